@@ -0,0 +1,381 @@
+# bulk_loader.py
+"""
+Parseo vectorizado (NumPy) de los archivos de ubicaciones y conexiones.
+
+Los archivos se leen en bloques grandes de bytes que terminan en salto de línea. Cada bloque
+se analiza como un array uint8: las líneas "limpias" (solo dígitos, comas y, para ubicaciones,
+'.' y '-') se convierten a números con aritmética vectorizada, sin crear objetos de Python por
+token. Las líneas que no pasan ese filtro se reparsean una a una con las mismas reglas del
+cargador línea por línea, de modo que el resultado es idéntico en ambos modos.
+"""
+import os
+import numpy as np
+
+DEFAULT_BLOCK_BYTES = 16 * 1024 * 1024 # 16 MB por bloque
+
+# Potencias de 10 exactas en int64 (hasta 10^18) para reconstruir enteros dígito a dígito.
+_POW10_INT = 10 ** np.arange(19, dtype=np.int64)
+# Máximo de dígitos por token en el camino rápido: enteros en int64 y mantisas exactas en float64.
+_MAX_INT_DIGITS = 18
+_MAX_FLOAT_DIGITS = 15
+
+_NL, _CR, _COMMA, _DOT, _MINUS = 10, 13, 44, 46, 45
+
+# Mayor user_id almacenable: los índices CSR son int32
+MAX_NODE_ID = int(np.iinfo(np.int32).max)
+
+CONNECTION_STAT_KEYS = ('lines', 'edges', 'malformed_lines', 'ignored_source_lines', 'out_of_range', 'self_loops')
+
+
+def iter_line_blocks(f, block_bytes=DEFAULT_BLOCK_BYTES, limit=None):
+    """
+    Itera sobre un archivo abierto en modo binario devolviendo bloques de ~block_bytes
+    que siempre terminan en b'\\n' (una última línea sin salto se completa).
+    Si se indica limit, se leen como máximo limit bytes desde la posición actual.
+    """
+    remainder = b''
+    remaining = limit
+    while True:
+        if remaining is not None:
+            if remaining <= 0:
+                break
+            chunk = f.read(min(block_bytes, remaining))
+            remaining -= len(chunk)
+        else:
+            chunk = f.read(block_bytes)
+        if not chunk:
+            break
+        data = remainder + chunk if remainder else chunk
+        cut = data.rfind(b'\n')
+        if cut == -1: # Línea más larga que el bloque: seguir acumulando
+            remainder = data
+            continue
+        yield data[:cut + 1]
+        remainder = data[cut + 1:]
+    if remainder:
+        yield remainder + b'\n'
+
+
+def empty_connection_stats():
+    return dict.fromkeys(CONNECTION_STAT_KEYS, 0)
+
+
+def merge_connection_stats(total, partial):
+    for key in CONNECTION_STAT_KEYS:
+        total[key] += partial[key]
+    return total
+
+
+def parse_location_line(line):
+    """Retorna (lat, lon) o None si la línea está malformada (reglas del cargador original)."""
+    try:
+        lat_str, lon_str = line.strip().split(',')
+        return float(lat_str), float(lon_str)
+    except ValueError:
+        return None
+
+
+def parse_connection_line(line, user_id_from, num_nodes):
+    """
+    Parsea una línea de conexiones con las reglas del cargador línea por línea.
+    Retorna (destinos_validos, malformada, origen_ignorado, fuera_de_rango, auto_bucles).
+    """
+    connections_str = line.strip()
+    if not connections_str:
+        return [], False, False, 0, 0 # Línea vacía, sin conexiones para este usuario
+    try:
+        connected_users_ids = [int(uid_str) for uid_str in connections_str.split(',')]
+    except ValueError:
+        return [], True, False, 0, 0
+
+    # Validar user_id_from (el que origina las conexiones)
+    if num_nodes > 0 and (user_id_from <= 0 or user_id_from > num_nodes):
+        return [], False, True, 0, 0
+
+    valid_targets = []
+    out_of_range = self_loops = 0
+    for user_id_to in connected_users_ids:
+        # Los IDs son 1-indexados y caben en int32: fuera de eso no pueden almacenarse aunque num_nodes sea 0.
+        if user_id_to <= 0 or user_id_to > MAX_NODE_ID or (num_nodes > 0 and user_id_to > num_nodes):
+            out_of_range += 1
+        elif user_id_from == user_id_to: # Evitar auto-bucles
+            self_loops += 1
+        else:
+            valid_targets.append(user_id_to)
+    return valid_targets, False, False, out_of_range, self_loops
+
+
+def _block_layout(a):
+    """Posiciones de los '\\n', inicio de cada línea y máscara de '\\r' válidos (justo antes de '\\n')."""
+    line_ends = np.flatnonzero(a == _NL)
+    line_starts = np.empty_like(line_ends)
+    line_starts[:1] = 0
+    line_starts[1:] = line_ends[:-1] + 1
+    next_byte = np.empty_like(a)
+    next_byte[:-1] = a[1:]
+    next_byte[-1:] = _NL
+    cr_ok = (a == _CR) & (next_byte == _NL)
+    return line_ends, line_starts, cr_ok
+
+
+def _shift_prev(mask):
+    prev = np.empty_like(mask)
+    prev[:1] = False
+    prev[1:] = mask[:-1]
+    return prev
+
+
+def _shift_next(mask):
+    nxt = np.empty_like(mask)
+    nxt[-1:] = False
+    nxt[:-1] = mask[1:]
+    return nxt
+
+
+def _digit_runs_to_int(a, digit_mask, starts, lengths):
+    """
+    Convierte tramos contiguos de dígitos (uno por token, en orden) a int64.
+    digit_mask debe marcar exactamente los dígitos de esos tramos.
+    """
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    digit_pos = np.flatnonzero(digit_mask)
+    first = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=first[1:])
+    # Exponente de cada dígito = dígitos que le siguen dentro de su token.
+    exponents = np.repeat(first + lengths - 1, lengths) - np.arange(len(digit_pos))
+    weighted = (a[digit_pos] - np.uint8(48)).astype(np.int64) * _POW10_INT[exponents]
+    return np.add.reduceat(weighted, first)
+
+
+def parse_connection_block(buf, first_line_id, num_nodes):
+    """
+    Parsea un bloque de líneas de conexiones (terminado en '\\n').
+    La línea i del bloque corresponde al usuario first_line_id + i.
+
+    Retorna (row_lengths, targets, stats): row_lengths[i] es el número de destinos válidos
+    de la línea i, targets son los destinos int32 concatenados en orden de línea y stats
+    cuenta líneas, aristas, líneas malformadas, orígenes ignorados, destinos fuera de rango
+    y auto-bucles.
+    """
+    stats = empty_connection_stats()
+    a = np.frombuffer(buf, dtype=np.uint8)
+    if len(a) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), stats
+    line_ends, line_starts, cr_ok = _block_layout(a)
+    num_lines = len(line_ends)
+    stats['lines'] = num_lines
+
+    is_digit = (a - np.uint8(48)) < 10
+    is_comma = a == _COMMA
+    prev_digit = _shift_prev(is_digit)
+    next_digit = _shift_next(is_digit)
+
+    # Camino rápido: solo dígitos, comas y fin de línea; sin tokens vacíos (",,", ",\n", ...).
+    bad_byte = ~(is_digit | is_comma | (a == _NL) | cr_ok)
+    bad_byte |= is_comma & ~(prev_digit & next_digit)
+    token_starts = np.flatnonzero(is_digit & ~prev_digit)
+    token_ends = np.flatnonzero(is_digit & ~next_digit) + 1
+    token_lengths = token_ends - token_starts
+    token_line = np.searchsorted(line_ends, token_starts)
+
+    bad_line = np.zeros(num_lines, dtype=bool)
+    bad_line[np.searchsorted(line_ends, np.flatnonzero(bad_byte))] = True
+    bad_line[token_line[token_lengths > _MAX_INT_DIGITS]] = True
+
+    keep = ~bad_line[token_line]
+    token_starts, token_lengths, token_line = token_starts[keep], token_lengths[keep], token_line[keep]
+    good_digits = is_digit & np.repeat(~bad_line, np.diff(np.concatenate(([0], line_ends + 1))))
+    targets = _digit_runs_to_int(a, good_digits, token_starts, token_lengths)
+    sources = token_line + first_line_id
+
+    # Validaciones del cargador original, vectorizadas.
+    if num_nodes > 0:
+        ignored_source = sources > num_nodes
+        stats['ignored_source_lines'] += len(np.unique(token_line[ignored_source]))
+        in_range = (targets >= 1) & (targets <= num_nodes) & ~ignored_source
+        stats['out_of_range'] += int(np.count_nonzero(~in_range & ~ignored_source))
+    else:
+        in_range = (targets >= 1) & (targets <= MAX_NODE_ID) # Sin esto, astype(int32) desbordaría
+        stats['out_of_range'] += int(np.count_nonzero(~in_range))
+    self_loop = in_range & (targets == sources)
+    stats['self_loops'] += int(np.count_nonzero(self_loop))
+    valid = in_range & ~self_loop
+    valid_lines = token_line[valid]
+    valid_targets = targets[valid].astype(np.int32)
+
+    # Camino lento (exacto) para las líneas que no pasaron el filtro.
+    slow_lines = np.flatnonzero(bad_line)
+    if len(slow_lines) > 0:
+        slow_line_ids, slow_targets = [], []
+        for line_idx in slow_lines.tolist():
+            line = buf[line_starts[line_idx]:line_ends[line_idx]].decode('utf-8', errors='replace')
+            line_targets, malformed, ignored, out_of_range, self_loops = parse_connection_line(line, first_line_id + line_idx, num_nodes)
+            stats['malformed_lines'] += malformed
+            stats['ignored_source_lines'] += ignored
+            stats['out_of_range'] += out_of_range
+            stats['self_loops'] += self_loops
+            slow_line_ids.extend([line_idx] * len(line_targets))
+            slow_targets.extend(line_targets)
+        if slow_targets:
+            valid_lines = np.concatenate((valid_lines, np.asarray(slow_line_ids, dtype=np.int64)))
+            valid_targets = np.concatenate((valid_targets, np.asarray(slow_targets, dtype=np.int32)))
+            order = np.argsort(valid_lines, kind='stable') # Mantener orden CSR por línea
+            valid_lines, valid_targets = valid_lines[order], valid_targets[order]
+
+    row_lengths = np.bincount(valid_lines, minlength=num_lines).astype(np.int64)
+    stats['edges'] = len(valid_targets)
+    return row_lengths, valid_targets, stats
+
+
+def parse_location_block(buf):
+    """
+    Parsea un bloque de líneas 'lat,lon' (terminado en '\\n').
+    Retorna (lats, lons, malformed): arrays float64 con una entrada por línea (NaN si la
+    línea está malformada) y el número de líneas malformadas.
+    """
+    a = np.frombuffer(buf, dtype=np.uint8)
+    if len(a) == 0:
+        return np.zeros(0), np.zeros(0), 0
+    line_ends, line_starts, cr_ok = _block_layout(a)
+    num_lines = len(line_ends)
+    content_ends = line_ends - cr_ok[np.maximum(line_ends - 1, 0)]
+
+    is_digit = (a - np.uint8(48)) < 10
+    is_comma = a == _COMMA
+    is_dot = a == _DOT
+    is_minus = a == _MINUS
+    bad_byte = ~(is_digit | is_comma | is_dot | is_minus | (a == _NL) | cr_ok)
+
+    # Línea candidata: sin bytes extraños y exactamente una coma.
+    comma_pos = np.flatnonzero(is_comma)
+    comma_line = np.searchsorted(line_ends, comma_pos)
+    good = np.bincount(comma_line, minlength=num_lines) == 1
+    good[np.searchsorted(line_ends, np.flatnonzero(bad_byte))] = False
+    line_comma = np.zeros(num_lines, dtype=np.int64)
+    line_comma[comma_line] = comma_pos # Solo significativo en líneas con una coma
+
+    # Dos campos por línea candidata: [inicio, coma) y (coma, fin).
+    good_idx = np.flatnonzero(good)
+    field_starts = np.column_stack((line_starts[good_idx], line_comma[good_idx] + 1)).ravel()
+    field_ends = np.column_stack((line_comma[good_idx], content_ends[good_idx])).ravel()
+    field_lengths = field_ends - field_starts
+    if len(field_starts) > 0:
+        # Conteos por campo con reduceat sobre los límites [inicio, fin) de cada campo.
+        bounds = np.column_stack((field_starts, field_ends)).ravel()
+        nonempty = field_lengths > 0
+        counts = {}
+        for name, mask in (('digits', is_digit), ('dots', is_dot), ('minus', is_minus)):
+            sums = np.add.reduceat(mask.view(np.uint8), bounds, dtype=np.int64)[::2]
+            counts[name] = np.where(nonempty, sums, 0)
+        starts_minus = nonempty & (a[np.minimum(field_starts, len(a) - 1)] == _MINUS)
+        field_ok = (nonempty & (counts['digits'] >= 1) & (counts['digits'] <= _MAX_FLOAT_DIGITS)
+                    & (counts['dots'] <= 1) & ((counts['minus'] == 0) | ((counts['minus'] == 1) & starts_minus)))
+        line_ok = field_ok[0::2] & field_ok[1::2]
+        good[good_idx[~line_ok]] = False
+        good_idx = good_idx[line_ok]
+        field_keep = np.repeat(line_ok, 2)
+        field_starts, field_ends = field_starts[field_keep], field_ends[field_keep]
+        num_digits = counts['digits'][field_keep]
+    else:
+        num_digits = np.zeros(0, dtype=np.int64)
+
+    lats = np.full(num_lines, np.nan)
+    lons = np.full(num_lines, np.nan)
+    if len(good_idx) > 0:
+        good_bytes = np.repeat(good, np.diff(np.concatenate(([0], line_ends + 1))))
+        mantissa = _digit_runs_to_int(a, is_digit & good_bytes, field_starts, num_digits)
+        # Dígitos tras el punto: en un campo válido solo hay dígitos, un '-' inicial y un '.'.
+        frac_digits = np.zeros(len(field_starts), dtype=np.int64)
+        dot_pos = np.flatnonzero(is_dot & good_bytes)
+        dot_field = np.searchsorted(field_starts, dot_pos, side='right') - 1
+        frac_digits[dot_field] = field_ends[dot_field] - dot_pos - 1
+        # Mantisa < 2^53 y 10^k exacto: una sola división correctamente redondeada = float().
+        values = mantissa.astype(np.float64) / _POW10_INT[frac_digits].astype(np.float64)
+        values[a[field_starts] == _MINUS] *= -1.0
+        lats[good_idx] = values[0::2]
+        lons[good_idx] = values[1::2]
+
+    malformed = 0
+    for line_idx in np.flatnonzero(~good).tolist(): # Camino lento (exacto)
+        parsed = parse_location_line(buf[line_starts[line_idx]:line_ends[line_idx]].decode('utf-8', errors='replace'))
+        if parsed is None:
+            malformed += 1
+        else:
+            lats[line_idx], lons[line_idx] = parsed
+    return lats, lons, malformed
+
+
+# --- Parseo paralelo por rangos de bytes (multiprocessing) ---
+
+def split_line_ranges(path, num_chunks):
+    """
+    Divide el archivo en hasta num_chunks rangos [inicio, fin) de bytes que empiezan y
+    terminan en límites de línea.
+    """
+    file_size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for chunk_idx in range(1, num_chunks):
+            # Avanzar hasta justo después del siguiente '\n' (a partir del byte anterior al corte).
+            f.seek(max(file_size * chunk_idx // num_chunks - 1, 0))
+            f.readline()
+            position = f.tell()
+            if bounds[-1] < position < file_size:
+                bounds.append(position)
+    bounds.append(file_size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def count_lines_in_range(path, start, end, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Cuenta las líneas de un rango de bytes (una última línea sin '\\n' también cuenta)."""
+    num_lines = 0
+    last_byte = b'\n'
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(block_bytes, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            num_lines += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+    return num_lines + (last_byte != b'\n')
+
+
+def parse_connection_range(path, start, end, first_line_id, num_nodes, block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Tarea de un worker: parsea el rango [start, end) del archivo de conexiones, cuya primera
+    línea corresponde al usuario first_line_id. Retorna (row_lengths, targets, stats) con el
+    mismo significado que parse_connection_block, para todo el rango.
+    """
+    row_blocks = [np.zeros(0, dtype=np.int64)]
+    target_blocks = [np.zeros(0, dtype=np.int32)]
+    stats = empty_connection_stats()
+    next_line_id = first_line_id
+    with open(path, 'rb') as f:
+        f.seek(start)
+        for block in iter_line_blocks(f, block_bytes, limit=end - start):
+            row_lengths, targets, block_stats = parse_connection_block(block, next_line_id, num_nodes)
+            row_blocks.append(row_lengths)
+            target_blocks.append(targets)
+            merge_connection_stats(stats, block_stats)
+            next_line_id += block_stats['lines']
+    return np.concatenate(row_blocks), np.concatenate(target_blocks), stats
+
+
+if __name__ == "__main__":
+    print("--- Testing Block Parser ---")
+    # Destinos > MAX_NODE_ID (no caben en int32) y líneas que van por el camino lento
+    test_block = b"2,3\n3000000000,1\n4,x\n\n1,2147483648,2\n"
+    for test_num_nodes in (0, 5):
+        row_lengths, block_targets, block_stats = parse_connection_block(test_block, 1, test_num_nodes)
+        line_targets, line_out_of_range = [], 0
+        for line_idx, line in enumerate(test_block.decode().splitlines()):
+            parsed = parse_connection_line(line, line_idx + 1, test_num_nodes)
+            line_targets.extend(parsed[0])
+            line_out_of_range += parsed[3]
+        print(f"num_nodes={test_num_nodes}: rows {row_lengths.tolist()}, targets {block_targets.tolist()}, "
+              f"out of range {block_stats['out_of_range']}") # rows [2, 1, 0, 0, 2], targets [2, 3, 1, 1, 2], out of range 2
+        print(f"  Matches line parser: {block_targets.tolist() == line_targets and block_stats['out_of_range'] == line_out_of_range}")
@@ -1,38 +1,370 @@
 # graph_utils.py
+import array
 import collections
+import collections.abc
+import json
+import math
+import struct
 import time # Para medir tiempos de carga
 import os # Para limpiar archivos de prueba en __main__
-from tqdm import tqdm
+import numpy as np
+from bulk_loader import (
+    DEFAULT_BLOCK_BYTES,
+    iter_line_blocks,
+    parse_location_line,
+    parse_location_block,
+    parse_connection_line,
+    parse_connection_block,
+    empty_connection_stats,
+    merge_connection_stats,
+    split_line_ranges,
+    count_lines_in_range,
+    parse_connection_range
+)
+
+class _LazyTqdm:
+    """
+    Sustituto de tqdm.tqdm que importa tqdm en el primer uso (barra o tqdm.write), para que
+    importar estos módulos no pague su coste de arranque. Se usa igual que tqdm.tqdm.
+    """
+    def __call__(self, *args, **kwargs):
+        from tqdm import tqdm as tqdm_class
+        return tqdm_class(*args, **kwargs)
+
+    def __getattr__(self, name):
+        from tqdm import tqdm as tqdm_class
+        return getattr(tqdm_class, name)
+
+
+tqdm = _LazyTqdm()
+
+
+class CSRAdjacency(collections.abc.Mapping):
+    """
+    Vista tipo diccionario (user_id -> vecinos) sobre arrays CSR (compressed sparse row).
+    La fila u ocupa indices[indptr[u]:indptr[u + 1]]; la fila 0 existe pero siempre está
+    vacía porque los IDs de usuario son 1-indexados.
+    Los vecinos se devuelven como slices de NumPy (vistas, sin copia).
+    Igual que el defaultdict(list) anterior, solo los nodos con aristas salientes son claves.
+    """
+    def __init__(self, indptr=None, indices=None):
+        if indptr is None:
+            indptr = np.zeros(1, dtype=np.int64)
+        if indices is None:
+            indices = np.zeros(0, dtype=np.int32)
+        self.indptr = indptr # int64: num_nodes + 2 entradas (admite más de 2^31 aristas)
+        self.indices = indices # int32: 4 bytes por arista
+        self.num_rows = len(indptr) - 1
+
+    def _row(self, user_id):
+        return self.indices[self.indptr[user_id]:self.indptr[user_id + 1]]
+
+    def __getitem__(self, user_id):
+        if 0 <= user_id < self.num_rows:
+            return self._row(user_id) # Slice vacío si no tiene aristas (como el defaultdict)
+        raise KeyError(user_id)
+
+    def get(self, user_id, default=None):
+        if 0 <= user_id < self.num_rows:
+            return self._row(user_id)
+        return default
+
+    def __contains__(self, user_id):
+        try:
+            return 0 <= user_id < self.num_rows and self.indptr[user_id + 1] > self.indptr[user_id]
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        for user_id in np.flatnonzero(np.diff(self.indptr)):
+            yield int(user_id)
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.indptr)))
+
+    def out_degrees(self):
+        """Grados de salida indexados por user_id (vectorizado)."""
+        return np.diff(self.indptr)
+
+    @classmethod
+    def from_row_lengths(cls, row_lengths, indices, num_nodes):
+        """
+        Construye el CSR a partir de las longitudes de fila (fila 0 incluida) y los destinos
+        concatenados en orden de fila. Rellena con filas vacías hasta num_nodes.
+        """
+        lengths = np.frombuffer(row_lengths, dtype=np.int64) if isinstance(row_lengths, array.array) else np.asarray(row_lengths, dtype=np.int64)
+        indices_np = np.frombuffer(indices, dtype=np.int32) if isinstance(indices, array.array) else np.asarray(indices, dtype=np.int32)
+        num_rows = max(num_nodes + 1, len(lengths))
+        indptr = np.zeros(num_rows + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:len(lengths) + 1])
+        indptr[len(lengths) + 1:] = indptr[len(lengths)]
+        return cls(indptr, indices_np)
+
+class LocationArrays(collections.abc.Mapping):
+    """
+    Vista tipo diccionario (user_id -> (lat, lon)) sobre dos arrays float64 indexados por user_id.
+    Las posiciones sin ubicación válida (líneas malformadas y el índice 0) contienen NaN.
+    """
+    def __init__(self, latitudes, longitudes):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.valid = ~np.isnan(latitudes)
+        self._num_valid = int(np.count_nonzero(self.valid))
+
+    def __getitem__(self, user_id):
+        if 0 <= user_id < len(self.latitudes) and self.valid[user_id]:
+            return (float(self.latitudes[user_id]), float(self.longitudes[user_id]))
+        raise KeyError(user_id)
+
+    def __contains__(self, user_id):
+        try:
+            return 0 <= user_id < len(self.latitudes) and bool(self.valid[user_id])
+        except TypeError:
+            return False
+
+    def __iter__(self):
+        for user_id in np.flatnonzero(self.valid):
+            yield int(user_id)
+
+    def __len__(self):
+        return self._num_valid
+
+class NodeArrayView(collections.abc.Mapping):
+    """
+    Vista tipo diccionario (user_id -> valor) sobre un array indexado por user_id (1..n).
+    Permite que estructuras precalculadas como los in-degrees vivan en arrays de NumPy
+    (o en un np.memmap) y se sigan consultando con .get() / .items().
+    """
+    def __init__(self, values):
+        self.values_array = values
+
+    def __getitem__(self, user_id):
+        if 1 <= user_id < len(self.values_array):
+            return self.values_array[user_id].item()
+        raise KeyError(user_id)
+
+    def __iter__(self):
+        return iter(range(1, len(self.values_array)))
+
+    def __len__(self):
+        return max(0, len(self.values_array) - 1)
+
+# Formato binario de snapshot: en la primera página, un prefijo fijo (magic, versión, longitud
+# de la cabecera) y una cabecera JSON con metadatos y la tabla de arrays; después, los arrays
+# crudos alineados a página para abrirlos con np.memmap y compartir páginas entre procesos.
+SNAPSHOT_MAGIC = b'SGSNAP\x00\x00'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_PREFIX = struct.Struct('<8sII') # magic, versión, bytes de cabecera JSON
+_SNAPSHOT_ALIGNMENT = 4096
+
+def csr_arrays(graph):
+    """
+    Retorna (indptr, indices) del grafo, con filas indexadas por user_id.
+    Si graph.adj no es un CSRAdjacency (p. ej. el MockSocialGraph de pruebas, con listas
+    por nodo) el CSR se construye al vuelo.
+    """
+    if isinstance(graph.adj, CSRAdjacency):
+        # np.asarray: vistas ndarray sin copia (evita la sobrecarga de np.memmap al indexar).
+        return np.asarray(graph.adj.indptr), np.asarray(graph.adj.indices)
+    max_id = max([0] + list(graph.get_nodes()) + list(graph.adj.keys()) + [max(t) for t in graph.adj.values() if len(t) > 0])
+    row_lengths = np.zeros(max_id + 1, dtype=np.int64)
+    targets = []
+    for user_id in sorted(graph.adj):
+        row_lengths[user_id] = len(graph.adj[user_id])
+        targets.extend(int(v) for v in graph.adj[user_id])
+    adjacency = CSRAdjacency.from_row_lengths(row_lengths, np.asarray(targets, dtype=np.int32), max_id)
+    return adjacency.indptr, adjacency.indices
+
+def edge_sources(indptr):
+    """Array con el nodo origen de cada arista del CSR (expande indptr)."""
+    return np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+
+def undirected_csr(graph):
+    """
+    Versión no dirigida del grafo como CSR simétrico (indptr, indices), con filas indexadas
+    por user_id, sin auto-bucles ni aristas repetidas (u->v y v->u cuentan como una arista)
+    y con los vecinos de cada fila ordenados. Se calcula de forma vectorizada y se cachea en
+    el grafo mientras graph.adj no cambie.
+    """
+    cached = getattr(graph, '_undirected_csr_cache', None)
+    if cached is not None and cached[0] is graph.adj:
+        return cached[1]
+    indptr, indices = csr_arrays(graph)
+    num_rows = len(indptr) - 1
+    sources = edge_sources(indptr)
+    targets = indices.astype(np.int64)
+    not_loop = sources != targets
+    low = np.minimum(sources[not_loop], targets[not_loop])
+    high = np.maximum(sources[not_loop], targets[not_loop])
+    pair_keys = np.unique(low * num_rows + high)
+    low, high = pair_keys // num_rows, pair_keys % num_rows
+    # Ambas direcciones, ordenadas por (fila, vecino).
+    both_keys = np.sort(np.concatenate((low * num_rows + high, high * num_rows + low)))
+    rows = both_keys // num_rows
+    sym_indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=sym_indptr[1:])
+    result = (sym_indptr, (both_keys % num_rows).astype(np.int32))
+    graph._undirected_csr_cache = (graph.adj, result)
+    return result
+
+def gather_neighbors(indptr, indices, nodes):
+    """Concatena (sin bucles de Python) las filas CSR de todos los nodos dados."""
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return indices[:0]
+    row_offsets = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - row_offsets, lengths) + np.arange(total)
+    return indices[positions]
+
+def induced_subgraph(graph, nodes):
+    """
+    Aristas (dirigidas) del subgrafo inducido por los user_ids dados, sin bucles de Python:
+    se concatenan sus filas CSR y se filtran los destinos con una máscara booleana de
+    pertenencia. Retorna (sources, targets) como arrays int64 de user_ids.
+    """
+    indptr, indices = csr_arrays(graph)
+    nodes = np.asarray(nodes, dtype=np.int64)
+    nodes = nodes[(nodes >= 0) & (nodes < len(indptr) - 1)]
+    in_subgraph = np.zeros(len(indptr) - 1, dtype=bool)
+    in_subgraph[nodes] = True
+    nodes = np.flatnonzero(in_subgraph) # Sin repetidos
+    sources = np.repeat(nodes, indptr[nodes + 1] - indptr[nodes])
+    targets = gather_neighbors(indptr, indices, nodes).astype(np.int64)
+    keep = in_subgraph[targets]
+    return sources[keep], targets[keep]
+
+def quotient_graph(graph, groups, chunk_edges=1 << 24):
+    """
+    Colapsa el grafo por grupos (groups[user_id] = grupo >= 0, o -1 para excluir el nodo)
+    en una sola pasada vectorizada por bloques de aristas. Las aristas entre grupos se
+    cuentan sin dirección (u->v y v->u suman en el mismo par).
+    Retorna (sizes, pair_sources, pair_targets, pair_counts, internal_edges): nodos por
+    grupo, pares de grupos (pair_sources < pair_targets) con su número de aristas y aristas
+    internas de cada grupo.
+    """
+    indptr, indices = csr_arrays(graph)
+    num_rows = len(indptr) - 1
+    groups = np.asarray(groups, dtype=np.int64)
+    padded_groups = np.full(num_rows, -1, dtype=np.int64)
+    padded_groups[:min(num_rows, len(groups))] = groups[:num_rows]
+    num_groups = int(groups.max()) + 1 if len(groups) else 0
+    sizes = np.bincount(groups[groups >= 0], minlength=num_groups)
+    internal_edges = np.zeros(num_groups, dtype=np.int64)
+    pair_keys, pair_counts = [], []
+    for start in range(0, int(indptr[-1]), chunk_edges):
+        positions = np.arange(start, min(start + chunk_edges, int(indptr[-1])))
+        source_groups = padded_groups[np.searchsorted(indptr, positions, side='right') - 1]
+        target_groups = padded_groups[indices[positions]]
+        valid = (source_groups >= 0) & (target_groups >= 0)
+        source_groups, target_groups = source_groups[valid], target_groups[valid]
+        same = source_groups == target_groups
+        internal_edges += np.bincount(source_groups[same], minlength=num_groups)
+        low = np.minimum(source_groups[~same], target_groups[~same])
+        high = np.maximum(source_groups[~same], target_groups[~same])
+        keys, counts = np.unique(low * num_groups + high, return_counts=True)
+        pair_keys.append(keys)
+        pair_counts.append(counts)
+    if pair_keys:
+        keys, inverse = np.unique(np.concatenate(pair_keys), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(pair_counts)).astype(np.int64)
+    else:
+        keys, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return sizes, keys // max(num_groups, 1), keys % max(num_groups, 1), counts, internal_edges
+
+def top_k_nodes(values, k):
+    """
+    IDs (índices >= 1) de los k mayores valores de un array indexado por user_id, en orden
+    descendente (empates por ID ascendente). Selección parcial con argpartition en O(N),
+    y solo los k elegidos se ordenan: O(N + k log k).
+    """
+    candidates = np.asarray(values)[1:] # El índice 0 no es un user_id
+    k = min(k, len(candidates))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(candidates):
+        # El k-ésimo mayor valor marca el umbral; entre los empatados en él entran los de menor ID.
+        threshold = candidates[np.argpartition(-candidates, k - 1)[k - 1]]
+        above = np.flatnonzero(candidates > threshold)
+        top = np.concatenate((above, np.flatnonzero(candidates == threshold)[:k - len(above)]))
+    else:
+        top = np.arange(len(candidates))
+    top = top[np.lexsort((top, -candidates[top]))]
+    return top + 1
+
+EARTH_RADIUS_KM = 6371.0088 # Radio medio de la Tierra
+
+def location_arrays(locations, num_rows=0):
+    """
+    (latitudes, longitudes) float64 indexados por user_id, con NaN donde no hay ubicación,
+    tanto si locations es una vista LocationArrays (sin copiar) como un dict user_id -> (lat, lon).
+    Los arrays tienen al menos num_rows posiciones.
+    """
+    if isinstance(locations, LocationArrays) and len(locations.latitudes) >= num_rows:
+        return locations.latitudes, locations.longitudes
+    if isinstance(locations, LocationArrays):
+        size = num_rows
+    else:
+        size = max(num_rows, max(locations, default=-1) + 1)
+    latitudes = np.full(size, np.nan)
+    longitudes = np.full(size, np.nan)
+    if isinstance(locations, LocationArrays):
+        latitudes[:len(locations.latitudes)] = locations.latitudes
+        longitudes[:len(locations.longitudes)] = locations.longitudes
+    else:
+        for user_id, (lat, lon) in locations.items():
+            latitudes[user_id] = lat
+            longitudes[user_id] = lon
+    return latitudes, longitudes
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia de gran círculo en km entre coordenadas en grados (vectorizada sobre arrays)."""
+    lat1, lon1, lat2, lon2 = (np.radians(values) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _parse_connection_range_task(task):
+    """Adaptador para Pool.imap (un único argumento por tarea)."""
+    return parse_connection_range(*task)
 
 class SocialGraph:
     def __init__(self):
-        self.adj = collections.defaultdict(list)
-        self.locations = {}  # user_id -> (lat, lon)
+        self.adj = CSRAdjacency()
+        self.locations = {}  # user_id -> (lat, lon); tras cargar, vista LocationArrays sobre dos arrays
         self.num_nodes = 0 # Fuente principal de verdad para el número de nodos
         self.num_edges = 0
         self.in_degrees = None # Para grados de entrada precalculados
-
-    def _process_location_line(self, line, user_id_counter):
-        try:
-            lat_str, lon_str = line.strip().split(',')
-            lat = float(lat_str)
-            lon = float(lon_str)
-            self.locations[user_id_counter] = (lat, lon)
-            return True
-        except ValueError:
-            # print(f"Warning: Skipping malformed location line (ID ~{user_id_counter}): {line.strip()}")
+        self.influence_scores = {} # métrica -> (adj con el que se calcularon, scores por user_id)
+
+    def _process_location_line(self, line, latitudes, longitudes):
+        """Añade la ubicación de la línea (NaN si está malformada) a los arrays de coordenadas."""
+        parsed = parse_location_line(line)
+        if parsed is None:
+            latitudes.append(math.nan)
+            longitudes.append(math.nan)
             return False
+        latitudes.append(parsed[0])
+        longitudes.append(parsed[1])
+        return True
 
-    def load_locations_batched(self, location_file, batch_size=100000):
+    def load_locations_batched(self, location_file, batch_size=100000, vectorized=False, block_bytes=DEFAULT_BLOCK_BYTES):
         """
         Carga las ubicaciones de los usuarios desde un archivo en lotes.
         user_id es implícito por el número de línea (1-indexed).
         Establece self.num_nodes basado en el número de líneas en este archivo.
+        Con vectorized=True el archivo se lee una sola vez en bloques de block_bytes y se
+        parsea con NumPy (ver _load_locations_vectorized).
         """
+        if vectorized:
+            return self._load_locations_vectorized(location_file, block_bytes)
+
         print(f"Loading locations from {location_file} (batch size: {batch_size})...")
         start_load_time = time.time()
         processed_lines_count = 0
         user_id_implicit_counter = 0
+        latitudes = array.array('d', [math.nan]) # Índice 0 sin ubicación (IDs 1-indexados)
+        longitudes = array.array('d', [math.nan])
 
         try:
             # Get total lines for tqdm if possible (requires reading the file once for count)
@@ -48,19 +380,21 @@ class SocialGraph:
                 progress_bar_loc = tqdm(f, total=total_lines, desc="Loading locations", unit="loc", disable=total_lines is None)
                 for line_content in progress_bar_loc:
                     user_id_implicit_counter += 1
-                    batch_lines_to_process.append((line_content, user_id_implicit_counter))
+                    batch_lines_to_process.append(line_content)
 
                     if len(batch_lines_to_process) >= batch_size:
-                        for l_content, uid in batch_lines_to_process:
-                            self._process_location_line(l_content, uid)
+                        for l_content in batch_lines_to_process:
+                            self._process_location_line(l_content, latitudes, longitudes)
                         processed_lines_count += len(batch_lines_to_process)
                         batch_lines_to_process = []
 
                 if batch_lines_to_process: # Procesar el último lote
-                    for l_content, uid in batch_lines_to_process:
-                        self._process_location_line(l_content, uid)
+                    for l_content in batch_lines_to_process:
+                        self._process_location_line(l_content, latitudes, longitudes)
                     processed_lines_count += len(batch_lines_to_process)
 
+            self.locations = LocationArrays(np.frombuffer(latitudes, dtype=np.float64), np.frombuffer(longitudes, dtype=np.float64))
+
             # self.num_nodes se establece por el número total de líneas en el archivo de ubicaciones,
             # asumiendo que cada línea corresponde a un ID de usuario secuencial.
             self.num_nodes = user_id_implicit_counter
@@ -70,54 +404,99 @@ class SocialGraph:
             print(f"Loaded {len(self.locations)} valid user locations (from {processed_lines_count} lines read).")
             print(f"Number of nodes set to {self.num_nodes} (based on lines in location file).")
             print(f"Location loading time: {end_load_time - start_load_time:.2f} seconds.")
+            self.get_spatial_index()
 
         except FileNotFoundError:
             print(f"Error: Location file {location_file} not found. self.num_nodes remains {self.num_nodes}.")
         except Exception as e:
             print(f"An error occurred during location loading: {e}")
 
-    def _process_user_connection_line(self, line_content, user_id_from):
-        connections_str = line_content.strip()
-        if not connections_str:
-            return 0 # Línea vacía, sin conexiones para este usuario
-
-        edges_added_this_line = 0
+    def _load_locations_vectorized(self, location_file, block_bytes):
+        """
+        Carga las ubicaciones en una sola pasada: bloques de bytes parseados con NumPy.
+        Produce directamente los arrays de latitud/longitud indexados por user_id
+        (self.locations pasa a ser una vista LocationArrays sobre ellos).
+        """
+        print(f"Loading locations from {location_file} (vectorized, block size: {block_bytes} bytes)...")
+        start_load_time = time.time()
         try:
-            connected_users_ids = [int(uid_str) for uid_str in connections_str.split(',')]
-
-            # Validar user_id_from (el que origina las conexiones)
-            if self.num_nodes > 0 and (user_id_from <= 0 or user_id_from > self.num_nodes):
-                # print(f"Warning: User ID {user_id_from} (from connections file) is out of range [1, {self.num_nodes}]. Its connections ignored.")
-                return 0
-
-            for user_id_to in connected_users_ids:
-                # Validar user_id_to (el destino de la conexión)
-                if self.num_nodes > 0 and (user_id_to <= 0 or user_id_to > self.num_nodes):
-                    # print(f"Warning: Connection from {user_id_from} to invalid/out-of-range user ID {user_id_to}. Skipped.")
-                    continue
-
-                if user_id_from == user_id_to: # Evitar auto-bucles
-                    # print(f"Warning: Self-loop for user {user_id_from} ignored.")
-                    continue
-
-                self.adj[user_id_from].append(user_id_to)
-                edges_added_this_line += 1
-            return edges_added_this_line
-        except ValueError:
-            # print(f"Warning: Malformed connection data for user {user_id_from} (line: '{line_content.strip()}'). Skipped line.")
-            return 0
+            file_size = os.path.getsize(location_file)
+            lat_blocks = [np.full(1, np.nan)] # Índice 0 sin ubicación (IDs 1-indexados)
+            lon_blocks = [np.full(1, np.nan)]
+            malformed_lines = 0
+
+            with open(location_file, 'rb') as f, tqdm(total=file_size, desc="Loading locations", unit="B", unit_scale=True) as progress_bar_loc:
+                for block in iter_line_blocks(f, block_bytes):
+                    lats, lons, malformed = parse_location_block(block)
+                    lat_blocks.append(lats)
+                    lon_blocks.append(lons)
+                    malformed_lines += malformed
+                    progress_bar_loc.update(len(block))
+
+            self.locations = LocationArrays(np.concatenate(lat_blocks), np.concatenate(lon_blocks))
+            self.num_nodes = len(self.locations.latitudes) - 1
+
+            elapsed = time.time() - start_load_time
+            print(f"Loaded {len(self.locations)} valid user locations (from {self.num_nodes} lines read, {malformed_lines} malformed).")
+            print(f"Number of nodes set to {self.num_nodes} (based on lines in location file).")
+            print(f"Location loading time: {elapsed:.2f} seconds ({self.num_nodes / max(elapsed, 1e-9):,.0f} lines/s).")
+            self.get_spatial_index()
 
-    def load_users_connections_batched(self, user_file, batch_size_progress_report=100000):
+        except FileNotFoundError:
+            print(f"Error: Location file {location_file} not found. self.num_nodes remains {self.num_nodes}.")
+        except Exception as e:
+            print(f"An error occurred during location loading: {e}")
+
+    def get_spatial_index(self):
+        """
+        Índice espacial (spatial_index.SpatialGridIndex) sobre las ubicaciones, con consultas
+        por caja, radio y k vecinos más cercanos. Se construye una vez tras cargar las
+        ubicaciones y se cachea mientras self.locations no cambie.
+        """
+        cached = getattr(self, '_spatial_index_cache', None)
+        if cached is not None and cached[0] is self.locations:
+            return cached[1]
+        # Import diferido: spatial_index importa este módulo.
+        from spatial_index import SpatialGridIndex
+        start_time = time.time()
+        latitudes, longitudes = location_arrays(self.locations)
+        index = SpatialGridIndex(latitudes, longitudes)
+        self._spatial_index_cache = (self.locations, index)
+        print(f"Spatial index: {index.rows}x{index.cols} grid over {index.num_points} locations built in {time.time() - start_time:.2f} seconds.")
+        return index
+
+    def _parse_user_connection_line(self, line_content, user_id_from):
+        """
+        Retorna la lista de destinos válidos de una línea de conexiones.
+        Aplica las validaciones de siempre: IDs fuera de rango, auto-bucles y
+        líneas malformadas (que se ignoran por completo).
+        """
+        return parse_connection_line(line_content, user_id_from, self.num_nodes)[0]
+
+    def load_users_connections_batched(self, user_file, batch_size_progress_report=100000, vectorized=False, block_bytes=DEFAULT_BLOCK_BYTES, workers=1):
         """
         Carga las conexiones de los usuarios línea por línea.
         user_id_from es implícito por el número de línea (1-indexed).
         Si self.num_nodes no fue establecido por load_locations, se inferirá aquí.
+        Las aristas se acumulan directamente en arrays int32 y se exponen como CSR en self.adj
+        (indptr/indices), en lugar de listas de enteros de Python por usuario.
+        Con vectorized=True se usa el parser por bloques de NumPy (una sola pasada).
+        Con workers > 1 el archivo se reparte en rangos de bytes que se parsean en paralelo
+        (siempre con el parser por bloques) en un pool de multiprocessing.
         """
+        if workers > 1:
+            return self._load_users_connections_parallel(user_file, block_bytes, workers)
+        if vectorized:
+            return self._load_users_connections_vectorized(user_file, block_bytes)
+
         print(f"Loading user connections from {user_file} (progress report every {batch_size_progress_report} lines)...")
         start_load_time = time.time()
         processed_lines_count = 0
         user_id_implicit_counter = 0
-        max_user_id_seen_overall = self.num_nodes # Empezar con el num_nodes de las ubicaciones
+
+        # Filas CSR en orden de línea: row_lengths[u] = número de destinos de u (fila 0 vacía).
+        row_lengths = array.array('q', [0])
+        indices = array.array('i')
 
         try:
             # Get total lines for tqdm
@@ -131,48 +510,32 @@ class SocialGraph:
                 progress_bar_usr = tqdm(f, total=total_lines_usr, desc="Loading user connections", unit="conn", disable=total_lines_usr is None)
                 for line_content in progress_bar_usr:
                     user_id_implicit_counter += 1
-                    max_user_id_seen_overall = max(max_user_id_seen_overall, user_id_implicit_counter)
-
-                    edges_added = self._process_user_connection_line(line_content, user_id_implicit_counter)
-                    self.num_edges += edges_added
                     processed_lines_count += 1
 
+                    if self.num_nodes > 0 and user_id_implicit_counter > self.num_nodes:
+                        continue # Fuera de rango: sus conexiones se ignoran (y no se crea fila)
+
+                    targets = self._parse_user_connection_line(line_content, user_id_implicit_counter)
+                    row_lengths.append(len(targets))
+                    if targets:
+                        indices.extend(targets)
+
                     # tqdm handles progress reporting, so the explicit batch_size_progress_report log can be removed
                     # if processed_lines_count % batch_size_progress_report == 0:
                     #     pass
 
-            # Si self.num_nodes no fue establecido por ubicaciones (es 0), o si las conexiones
-            # implican IDs de nodo más altos que los vistos en ubicaciones.
-            if self.num_nodes == 0: # No se cargaron ubicaciones, o el archivo de ubicaciones estaba vacío.
-                print("Number of nodes was not set by locations. Inferring from connections file...")
-                # Necesitamos encontrar el ID de nodo más alto mencionado en CUALQUIER LUGAR.
-                # Esto incluye claves en self.adj y valores en las listas de self.adj.
-                # user_id_implicit_counter da el número de líneas en user_file.
-                # max_user_id_seen_overall ya rastrea los IDs de origen.
-                # Ahora chequear los IDs de destino.
-                if self.adj: # Si se añadieron conexiones
-                    max_target_id = 0
-                    for targets in self.adj.values():
-                        if targets:
-                            max_target_id = max(max_target_id, max(targets))
-                    max_user_id_seen_overall = max(max_user_id_seen_overall, max_target_id)
-
-                self.num_nodes = max_user_id_seen_overall
-                print(f"Number of nodes inferred to be {self.num_nodes} based on connections.")
-            elif max_user_id_seen_overall > self.num_nodes:
-                 # Esto puede ocurrir si el archivo de conexiones hace referencia a IDs de usuario
-                 # más allá de lo que estaba en el archivo de ubicaciones.
-                 # Por ahora, mantenemos self.num_nodes de las ubicaciones si se cargaron,
-                 # las conexiones a IDs mayores son ignoradas por _process_user_connection_line.
-                 # Si quisiéramos expandir self.num_nodes:
-                 # print(f"Warning: Max user ID in connections ({max_user_id_seen_overall}) > num_nodes from locations ({self.num_nodes}).")
-                 # self.num_nodes = max_user_id_seen_overall # Descomentar para permitir expansión
-                 pass
-
+            # Si self.num_nodes no fue establecido por ubicaciones (es 0) se infiere a partir del
+            # ID más alto mencionado (origen o destino). Si las conexiones hacen referencia a IDs
+            # más allá del archivo de ubicaciones, se mantiene self.num_nodes de las ubicaciones
+            # y esas conexiones quedan ignoradas por _parse_user_connection_line.
+            self._finalize_connections(np.frombuffer(row_lengths, dtype=np.int64),
+                                       np.frombuffer(indices, dtype=np.int32),
+                                       user_id_implicit_counter)
 
             end_load_time = time.time()
             print(f"Processed {processed_lines_count} user connection lines. Total edges accumulated: {self.num_edges}.")
             print(f"Number of nodes (final): {self.get_number_of_nodes(force_recount=False)}.") # Usar el valor cacheado/establecido
+            print(f"Adjacency memory (CSR): {(self.adj.indptr.nbytes + self.adj.indices.nbytes) / 1e6:.1f} MB.")
             print(f"User connection loading time: {end_load_time - start_load_time:.2f} seconds.")
 
         except FileNotFoundError:
@@ -180,14 +543,197 @@ class SocialGraph:
         except Exception as e:
             print(f"An error occurred during user connection loading: {e}")
 
+    def _finalize_connections(self, row_lengths, targets, num_lines):
+        """
+        Ajusta self.num_nodes (infiriéndolo si no hubo ubicaciones) y construye el CSR a partir
+        de las longitudes de fila por línea (fila 0 incluida) y los destinos concatenados.
+        """
+        if self.num_nodes == 0: # No se cargaron ubicaciones, o el archivo de ubicaciones estaba vacío.
+            print("Number of nodes was not set by locations. Inferring from connections file...")
+            max_target_id = int(targets.max()) if len(targets) > 0 else 0
+            self.num_nodes = max(num_lines, max_target_id)
+            print(f"Number of nodes inferred to be {self.num_nodes} based on connections.")
+        else:
+            # Las líneas más allá de num_nodes no aportan aristas: sus filas se descartan.
+            row_lengths = row_lengths[:self.num_nodes + 1]
+        self.adj = CSRAdjacency.from_row_lengths(row_lengths, targets, self.num_nodes)
+        self.num_edges = len(self.adj.indices)
+
+    def _load_users_connections_vectorized(self, user_file, block_bytes):
+        """
+        Carga las conexiones en una sola pasada: bloques de bytes parseados con NumPy que
+        producen directamente las longitudes de fila y los destinos del CSR.
+        """
+        print(f"Loading user connections from {user_file} (vectorized, block size: {block_bytes} bytes)...")
+        start_load_time = time.time()
+        try:
+            file_size = os.path.getsize(user_file)
+            row_blocks = [np.zeros(1, dtype=np.int64)] # Fila 0 vacía
+            target_blocks = [np.zeros(0, dtype=np.int32)]
+            stats = empty_connection_stats()
+            next_line_id = 1
+
+            with open(user_file, 'rb') as f, tqdm(total=file_size, desc="Loading user connections", unit="B", unit_scale=True) as progress_bar_usr:
+                for block in iter_line_blocks(f, block_bytes):
+                    row_lengths, targets, block_stats = parse_connection_block(block, next_line_id, self.num_nodes)
+                    row_blocks.append(row_lengths)
+                    target_blocks.append(targets)
+                    merge_connection_stats(stats, block_stats)
+                    next_line_id += block_stats['lines']
+                    progress_bar_usr.update(len(block))
+
+            self._finalize_connections(np.concatenate(row_blocks), np.concatenate(target_blocks), stats['lines'])
+
+            elapsed = time.time() - start_load_time
+            print(f"Processed {stats['lines']} user connection lines. Total edges accumulated: {self.num_edges}.")
+            print(f"Skipped: {stats['malformed_lines']} malformed lines, {stats['ignored_source_lines']} out-of-range source lines, "
+                  f"{stats['out_of_range']} out-of-range targets, {stats['self_loops']} self-loops.")
+            print(f"Number of nodes (final): {self.get_number_of_nodes(force_recount=False)}.")
+            print(f"User connection loading time: {elapsed:.2f} seconds ({stats['lines'] / max(elapsed, 1e-9):,.0f} lines/s).")
+
+        except FileNotFoundError:
+            print(f"Error: User connections file {user_file} not found.")
+        except Exception as e:
+            print(f"An error occurred during user connection loading: {e}")
+
+    def save_snapshot(self, path):
+        """
+        Guarda el grafo en un archivo binario versionado: número de nodos y aristas, arrays CSR,
+        ubicaciones (latitud/longitud por user_id, NaN si no hay) e in-degrees precalculados.
+        """
+        print(f"Saving graph snapshot to {path}...")
+        start_time = time.time()
+        num_rows = self.adj.num_rows
+        arrays = {
+            'indptr': np.ascontiguousarray(self.adj.indptr, dtype=np.int64),
+            'indices': np.ascontiguousarray(self.adj.indices, dtype=np.int32),
+            'in_degrees': np.bincount(self.adj.indices, minlength=num_rows).astype(np.int64),
+        }
+        if isinstance(self.locations, LocationArrays) or self.locations:
+            arrays['latitudes'], arrays['longitudes'] = location_arrays(self.locations, max(num_rows, self.num_nodes + 1))
+
+        # Offsets de cada array en el archivo, alineados a página. La cabecera ocupa la primera página.
+        table = {}
+        offset = _SNAPSHOT_ALIGNMENT
+        for name, values in arrays.items():
+            table[name] = {'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset}
+            offset += _SNAPSHOT_ALIGNMENT * (-(-values.nbytes // _SNAPSHOT_ALIGNMENT))
+        header = {'num_nodes': self.num_nodes, 'num_edges': self.num_edges, 'arrays': table}
+        header_bytes = json.dumps(header).encode('utf-8')
+        if _SNAPSHOT_PREFIX.size + len(header_bytes) > _SNAPSHOT_ALIGNMENT:
+            raise ValueError("Snapshot header does not fit in the first page.")
+
+        with open(path, 'wb') as f:
+            f.write(_SNAPSHOT_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, values in arrays.items():
+                f.seek(table[name]['offset'])
+                values.tofile(f)
+            f.truncate(offset)
+
+        print(f"Snapshot saved ({offset / 1e6:.1f} MB) in {time.time() - start_time:.2f} seconds.")
+
+    @classmethod
+    def load_snapshot(cls, path, mmap=True):
+        """
+        Abre un snapshot creado con save_snapshot. Con mmap=True los arrays se abren con
+        np.memmap en modo solo lectura (no se copian a memoria y las páginas se comparten
+        entre procesos que abran el mismo archivo); con mmap=False se leen completos.
+        Lanza ValueError si el archivo no es un snapshot o su versión no es compatible.
+        """
+        print(f"Loading graph snapshot from {path} (mmap={mmap})...")
+        start_time = time.time()
+        with open(path, 'rb') as f:
+            prefix = f.read(_SNAPSHOT_PREFIX.size)
+            if len(prefix) < _SNAPSHOT_PREFIX.size:
+                raise ValueError(f"{path} is not a graph snapshot (file too short).")
+            magic, version, header_len = _SNAPSHOT_PREFIX.unpack(prefix)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a graph snapshot (bad magic).")
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION}).")
+            header = json.loads(f.read(header_len).decode('utf-8'))
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            shape = tuple(spec['shape'])
+            if mmap:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=spec['offset'], shape=shape)
+            else:
+                arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=spec['offset']).reshape(shape)
+
+        graph = cls()
+        graph.num_nodes = header['num_nodes']
+        graph.num_edges = header['num_edges']
+        graph.adj = CSRAdjacency(arrays['indptr'], arrays['indices'])
+        if 'latitudes' in arrays:
+            graph.locations = LocationArrays(arrays['latitudes'], arrays['longitudes'])
+        if 'in_degrees' in arrays:
+            graph.in_degrees = NodeArrayView(arrays['in_degrees'])
+
+        print(f"Snapshot loaded: {graph.num_nodes} nodes, {graph.num_edges} edges in {time.time() - start_time:.2f} seconds.")
+        return graph
+
+    def _load_users_connections_parallel(self, user_file, block_bytes, workers):
+        """
+        Carga las conexiones con un pool de procesos. El archivo se divide en rangos de bytes
+        alineados a líneas; un primer paso (paralelo) cuenta las líneas de cada rango para
+        conocer el user_id de su primera línea, y luego cada worker parsea su rango con las
+        mismas validaciones que el cargador secuencial. Los arrays por rango se concatenan
+        en orden para formar el CSR.
+        """
+        print(f"Loading user connections from {user_file} (parallel, {workers} workers, block size: {block_bytes} bytes)...")
+        start_load_time = time.time()
+        try:
+            # Más rangos que workers para balancear la carga entre procesos.
+            byte_ranges = split_line_ranges(user_file, workers * 4)
+            row_blocks = [np.zeros(1, dtype=np.int64)] # Fila 0 vacía
+            target_blocks = [np.zeros(0, dtype=np.int32)]
+            stats = empty_connection_stats()
+
+            import multiprocessing # Import diferido: solo la carga paralela crea procesos
+            with multiprocessing.Pool(processes=workers) as pool:
+                line_counts = pool.starmap(count_lines_in_range, [(user_file, start, end) for start, end in byte_ranges])
+                first_line_ids = np.concatenate(([1], 1 + np.cumsum(line_counts)[:-1])).astype(np.int64).tolist()
+                tasks = [(user_file, start, end, first_line_id, self.num_nodes, block_bytes)
+                         for (start, end), first_line_id in zip(byte_ranges, first_line_ids)]
+
+                # imap conserva el orden de los rangos (necesario para el orden de filas CSR).
+                chunk_results = pool.imap(_parse_connection_range_task, tasks)
+                for chunk_idx, (row_lengths, targets, chunk_stats) in enumerate(tqdm(chunk_results, total=len(tasks), desc="Loading user connections", unit="chunk")):
+                    row_blocks.append(row_lengths)
+                    target_blocks.append(targets)
+                    merge_connection_stats(stats, chunk_stats)
+                    first_line_id = first_line_ids[chunk_idx]
+                    tqdm.write(f"  Chunk {chunk_idx + 1}/{len(tasks)} (users {first_line_id}-{first_line_id + chunk_stats['lines'] - 1}): "
+                               f"{chunk_stats['edges']} edges, {chunk_stats['malformed_lines']} malformed lines, "
+                               f"{chunk_stats['ignored_source_lines']} out-of-range sources, {chunk_stats['out_of_range']} out-of-range targets, "
+                               f"{chunk_stats['self_loops']} self-loops.")
+
+            self._finalize_connections(np.concatenate(row_blocks), np.concatenate(target_blocks), stats['lines'])
+
+            elapsed = time.time() - start_load_time
+            print(f"Processed {stats['lines']} user connection lines. Total edges accumulated: {self.num_edges}.")
+            print(f"Skipped: {stats['malformed_lines']} malformed lines, {stats['ignored_source_lines']} out-of-range source lines, "
+                  f"{stats['out_of_range']} out-of-range targets, {stats['self_loops']} self-loops.")
+            print(f"Number of nodes (final): {self.get_number_of_nodes(force_recount=False)}.")
+            print(f"User connection loading time: {elapsed:.2f} seconds ({stats['lines'] / max(elapsed, 1e-9):,.0f} lines/s).")
+
+        except FileNotFoundError:
+            print(f"Error: User connections file {user_file} not found.")
+        except Exception as e:
+            print(f"An error occurred during user connection loading: {e}")
+
     def get_nodes(self):
         """
-        Retorna una lista de todos los IDs de nodos en el grafo (1 a self.num_nodes).
+        Retorna todos los IDs de nodos en el grafo (1 a self.num_nodes) como un range:
+        no ocupa memoria, admite len(), indexado, random.sample() y pruebas de pertenencia O(1).
         Asume que los IDs de nodo son contiguos y 1-indexados.
         """
         if self.num_nodes > 0:
-            return list(range(1, self.num_nodes + 1))
-        return [] # Si num_nodes no está establecido o es 0.
+            return range(1, self.num_nodes + 1)
+        return range(0) # Si num_nodes no está establecido o es 0.
 
     def get_number_of_nodes(self, force_recount=False):
         """
@@ -202,15 +748,11 @@ class SocialGraph:
             self.num_nodes = 0 # Cache
             return 0
 
-        # Esto es un fallback costoso y no debería ser necesario si la carga funciona bien.
-        print("Warning: Recalculating number of nodes from adjacency list (costly).")
-        max_id = 0
-        if self.adj.keys():
-            max_id = max(max_id, max(self.adj.keys()))
-        for connections_list in self.adj.values():
-            if connections_list:
-                max_id = max(max_id, max(connections_list))
-        self.num_nodes = max_id # Asume que los IDs son hasta el máximo visto.
+        # Fallback: no debería ser necesario si la carga funciona bien.
+        print("Warning: Recalculating number of nodes from adjacency arrays.")
+        max_source_id = int(np.flatnonzero(self.adj.out_degrees())[-1])
+        max_target_id = int(self.adj.indices.max())
+        self.num_nodes = max(max_source_id, max_target_id) # Asume que los IDs son hasta el máximo visto.
         return self.num_nodes
 
     def get_number_of_edges(self):
@@ -221,16 +763,10 @@ class SocialGraph:
         if degree_type == "out":
             return len(self.adj.get(user_id, []))
         elif degree_type == "in":
-            # Si in_degrees no fue precalculado, este es el cálculo costoso.
-            if self.in_degrees is not None: # Usar precalculado si existe
-                 return self.in_degrees.get(user_id, 0)
-
-            # Cálculo costoso si no precalculado
-            in_degree_val = 0
-            for source_node_connections in self.adj.values():
-                # Contar ocurrencias es más robusto si hay multi-aristas (no debería haber con lista de adyacencia)
-                in_degree_val += source_node_connections.count(user_id)
-            return in_degree_val
+            # Si in_degrees no fue precalculado, un único bincount O(E) los calcula todos.
+            if self.in_degrees is None:
+                self.precompute_in_degrees()
+            return self.in_degrees.get(user_id, 0)
         else:
             raise ValueError("degree_type debe ser 'in' o 'out'")
 
@@ -242,20 +778,27 @@ class SocialGraph:
 
         print("Precomputing in-degrees...")
         start_time = time.time()
-        self.in_degrees = collections.defaultdict(int)
-        for source_node in self.adj: # Iterar sobre nodos que tienen aristas salientes
-            for target_node in self.adj[source_node]:
-                self.in_degrees[target_node] += 1
-
-        # Asegurar que todos los nodos (de 1 a self.num_nodes) tengan una entrada,
-        # incluso si su in-degree es 0. Esto es importante para consistencia.
-        if self.num_nodes > 0:
-            for i in range(1, self.num_nodes + 1):
-                _ = self.in_degrees[i] # Acceder asegura que la clave exista (con valor 0 si no hay aristas entrantes)
+        # Un solo bincount sobre los destinos de todas las aristas. La longitud mínima asegura
+        # que todos los nodos (de 1 a self.num_nodes) tengan entrada, aunque su in-degree sea 0.
+        num_rows = max(self.adj.num_rows, self.num_nodes + 1)
+        self.in_degrees = NodeArrayView(np.bincount(self.adj.indices, minlength=num_rows))
 
         end_time = time.time()
         print(f"In-degree precomputation time: {end_time - start_time:.2f} seconds.")
 
+    def get_degree_array(self, degree_type="out"):
+        """Grados de todos los nodos como array de NumPy indexado por user_id (posición 0 sin uso)."""
+        if degree_type == "out":
+            out_degrees = self.adj.out_degrees()
+            if len(out_degrees) < self.num_nodes + 1:
+                out_degrees = np.concatenate((out_degrees, np.zeros(self.num_nodes + 1 - len(out_degrees), dtype=out_degrees.dtype)))
+            return out_degrees
+        elif degree_type == "in":
+            self.ensure_in_degrees_computed()
+            return self.in_degrees.values_array
+        else:
+            raise ValueError("degree_type debe ser 'in' o 'out'")
+
     def get_average_degree(self, degree_type="out"): # 'degree_type' es nominal aquí
         n_nodes = self.get_number_of_nodes(force_recount=False) # Usar cacheado
         if n_nodes == 0:
@@ -272,23 +815,46 @@ class SocialGraph:
         # else:
             # print("In-degrees ya estaban calculados.") # Opcional: para debugging
 
-    def get_top_n_influencers(self, n=10):
+    def get_influence_scores(self, metric="pagerank"):
         """
-        Retorna los N usuarios más influyentes basados en in-degree.
-        Asegura que los in-degrees estén calculados.
+        Scores de influencia por user_id: 'pagerank' o 'hits' (autoridad). Se cachean mientras
+        self.adj no cambie; si cambió, el resultado anterior sirve de warm start.
         """
-        self.ensure_in_degrees_computed()
-
-        if not self.in_degrees: # Si después de asegurar, sigue vacío (e.g., grafo vacío)
-            return []
-
-        # Ordenar por in-degree descendente. self.in_degrees es un defaultdict(int).
-        # Convertir a lista de tuplas (user_id, in_degree)
-        sorted_influencers = sorted(self.in_degrees.items(), key=lambda item: item[1], reverse=True)
+        # Import diferido: network_algorithms importa este módulo.
+        from network_algorithms import pagerank, hits
+        cached = self.influence_scores.get(metric)
+        if cached is not None and cached[0] is self.adj:
+            return cached[1]
+        previous_scores = cached[1] if cached is not None else None
+        if metric == "pagerank":
+            scores = pagerank(self, initial_scores=previous_scores)
+        elif metric == "hits":
+            scores = hits(self)[1]
+        else:
+            raise ValueError("metric debe ser 'pagerank' o 'hits'")
+        self.influence_scores[metric] = (self.adj, scores)
+        return scores
 
-        return sorted_influencers[:n]
+    def get_top_n_influencers(self, n=10, metric="in_degree"):
+        """
+        Retorna los N usuarios más influyentes como lista de tuplas (user_id, valor) en orden
+        descendente. metric='in_degree' (por defecto) usa los in-degrees precalculados;
+        'pagerank' y 'hits' usan get_influence_scores, menos sensibles a cuentas que siguen
+        en masa. La selección es parcial (sin ordenar todos los nodos).
+        """
+        if metric == "in_degree":
+            scores = self.get_degree_array("in")
+        else:
+            scores = self.get_influence_scores(metric)
+        top_users = top_k_nodes(scores, n)
+        return list(zip(top_users.tolist(), scores[top_users].tolist()))
 
-    def print_graph_summary(self):
+    def print_graph_summary(self, clustering_samples=None):
+        """
+        Imprime nodos, aristas, grado medio y componentes débilmente conexas. Con
+        clustering_samples=k también estima triángulos y clustering muestreando k wedges
+        (O(k log E)); el conteo exacto de triángulos es network_algorithms.clustering_coefficients.
+        """
         print("\n--- Graph Summary ---")
         num_nodes_val = self.get_number_of_nodes(force_recount=False) # Usar cacheado
         print(f"Number of users (nodes): {num_nodes_val}")
@@ -296,6 +862,13 @@ class SocialGraph:
         if num_nodes_val > 0:
             avg_deg = self.get_average_degree()
             print(f"Average out-degree (and in-degree): {avg_deg:.2f}")
+            # Import diferido: network_algorithms importa este módulo.
+            from network_algorithms import weakly_connected_components, clustering_coefficients
+            _, component_sizes = weakly_connected_components(self)
+            print(f"Weakly connected components: {len(component_sizes)}, giant component: {component_sizes[0]} nodes ({component_sizes[0] / num_nodes_val:.1%})")
+            if clustering_samples:
+                clustering = clustering_coefficients(self, sample_size=clustering_samples, seed=0)
+                print(f"Triangles (estimated): {clustering['triangles']}, global clustering: {clustering['global']:.4f}, average clustering: {clustering['average']:.4f}")
         else:
             print("Average degree: N/A (no nodes)")
 
@@ -330,6 +903,9 @@ if __name__ == "__main__":
     print("\n--- Loading Locations (Batched) ---")
     graph.load_locations_batched(test_loc_file, batch_size=2)
     # Esperado: 6 líneas leídas. len(self.locations) = 5. self.num_nodes = 6.
+    spatial_index = graph.get_spatial_index()
+    print(f"Users within 1500 km of (21, 21): {spatial_index.query_radius(21.0, 21.0, 1500.0)[0].tolist()}") # [2, 3] (1 está a ~1700 km)
+    print(f"2 nearest users to (58, 58): {spatial_index.query_knn(58.0, 58.0, 2)[0].tolist()}") # [6, 4] (5 no tiene ubicación)
 
     print("\n--- Loading User Connections (Batched) ---")
     graph.load_users_connections_batched(test_user_file, batch_size_progress_report=2)
@@ -343,8 +919,8 @@ if __name__ == "__main__":
     # U7: (línea 7) -> 0 aristas (user_id_from 7 > num_nodes)
     # Total aristas = 2 + 1 + 0 + 0 + 1 + 0 = 4.
 
-    graph.print_graph_summary()
-    # Nodos esperados: 6. Aristas: 4.
+    graph.print_graph_summary(clustering_samples=1000)
+    # Nodos esperados: 6. Aristas: 4. Sin triángulos (clustering 0).
 
     print("\n--- Testing In-degree Precomputation ---")
     graph.precompute_in_degrees() # Calcula in_degrees
@@ -364,11 +940,24 @@ if __name__ == "__main__":
     print(f"In-degree of User 5: {graph.get_node_degree(5, 'in')}")
     print(f"Out-degree of User 1: {graph.get_node_degree(1, 'out')}") # Esperado 2
     print(f"Out-degree of User 5: {graph.get_node_degree(5, 'out')}") # Esperado 1
+    print(f"Top 3 influencers (user_id, in-degree): {graph.get_top_n_influencers(n=3)}") # Esperado [(1, 1), (2, 1), (3, 1)]
+    print(f"Top 3 influencers (user_id, PageRank): {[(u, round(score, 4)) for u, score in graph.get_top_n_influencers(n=3, metric='pagerank')]}")
+
+    print("\n--- Testing Binary Snapshot (save + mmap reload) ---")
+    test_snapshot_file = "test_graph.sgsnap"
+    graph.save_snapshot(test_snapshot_file)
+    reloaded_graph = SocialGraph.load_snapshot(test_snapshot_file, mmap=True)
+    print(f"Reloaded: nodes={reloaded_graph.get_number_of_nodes()}, edges={reloaded_graph.get_number_of_edges()}") # Esperado 6, 4
+    print(f"Reloaded neighbors of User 1: {reloaded_graph.adj.get(1, []).tolist()}") # Esperado [2, 3]
+    print(f"Reloaded location of User 2: {reloaded_graph.locations.get(2)}, User 5: {reloaded_graph.locations.get(5)}") # (20.0, 20.0), None
+    print(f"Reloaded in-degree of User 6: {reloaded_graph.get_node_degree(6, 'in')}") # Esperado 1
+    del reloaded_graph # Liberar el memmap antes de borrar el archivo
 
     # Limpiar archivos de prueba
     try:
         os.remove(test_loc_file)
         os.remove(test_user_file)
-        print(f"\nCleaned up test files: {test_loc_file}, {test_user_file}")
+        os.remove(test_snapshot_file)
+        print(f"\nCleaned up test files: {test_loc_file}, {test_user_file}, {test_snapshot_file}")
     except OSError as e:
         print(f"Error cleaning up test files: {e}")
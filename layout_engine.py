@@ -0,0 +1,255 @@
+# layout_engine.py
+"""
+Layout de grafos por fuerzas (ForceAtlas2) calculado con NumPy sobre arrays de aristas,
+sin convertir a NetworkX. La repulsión entre todos los pares se aproxima con Barnes-Hut
+sobre una rejilla jerárquica (quadtree denso por niveles): cada celda interactúa con los
+centros de masa de las celdas bien separadas de su nivel y solo las celdas vecinas del
+nivel más fino se tratan de cerca, de modo que cada iteración cuesta O(n) operaciones
+vectorizadas en lugar de O(n^2).
+"""
+import math
+import numpy as np
+from graph_utils import induced_subgraph, tqdm
+
+# Por debajo de este número de nodos la repulsión exacta O(n^2) es más rápida que Barnes-Hut
+BARNES_HUT_MIN_NODES = 256
+# Nodos por celda buscados en el nivel más fino de la rejilla y profundidad máxima (4^10 celdas)
+BARNES_HUT_LEAF_SIZE = 4
+BARNES_HUT_MAX_DEPTH = 10
+# Se refina la rejilla mientras los pares exactos dentro de las celdas superen este número por nodo
+BARNES_HUT_MAX_LEAF_PAIRS_PER_NODE = 16
+_MIN_SQUARED_DISTANCE = 1e-9
+
+
+def _exact_repulsion(positions, masses, block_size=2048):
+    """Campo de repulsión exacto sum_j m_j (x_i - x_j) / |x_i - x_j|^2, por bloques de filas."""
+    field = np.zeros_like(positions)
+    for start in range(0, len(positions), block_size):
+        diff = positions[start:start + block_size, None, :] - positions[None, :, :]
+        squared = np.maximum((diff ** 2).sum(axis=2), _MIN_SQUARED_DISTANCE)
+        squared[np.arange(len(diff)), np.arange(start, start + len(diff))] = np.inf # Sin auto-repulsión
+        field[start:start + block_size] = (diff * (masses[None, :] / squared)[:, :, None]).sum(axis=1)
+    return field
+
+def _barnes_hut_repulsion(positions, masses):
+    """
+    Campo de repulsión aproximado con una rejilla jerárquica de 2^l x 2^l celdas por nivel l.
+    En cada nivel, cada celda ocupada recibe la repulsión de los centros de masa de su lista
+    de interacción (hijas de las vecinas de su celda padre que no son adyacentes a ella),
+    evaluada en su propio centro de masa y heredada por todos sus nodos. En el nivel más
+    fino, cada nodo interactúa con el centro de masa de las 8 celdas vecinas y de forma exacta
+    con los demás nodos de su celda (si no, dos nodos de la misma celda podrían no repelerse
+    y quedar superpuestos). Cada par de nodos se cuenta así en un único nivel.
+    """
+    num_nodes = len(positions)
+    depth = int(np.clip(math.ceil(math.log(max(num_nodes / BARNES_HUT_LEAF_SIZE, 1.0), 4)) + 1, 2, BARNES_HUT_MAX_DEPTH))
+    low = positions.min(axis=0)
+    extent = max(float((positions.max(axis=0) - low).max()), 1e-12) * (1 + 1e-9)
+    while True: # Refinar si los nodos se concentran en pocas celdas
+        grid = np.minimum(((positions - low) / extent * (1 << depth)).astype(np.int64), (1 << depth) - 1)
+        _, leaf_counts = np.unique(grid[:, 0] << depth | grid[:, 1], return_counts=True)
+        leaf_pairs = int((leaf_counts * (leaf_counts - 1) // 2).sum())
+        if depth == BARNES_HUT_MAX_DEPTH or leaf_pairs <= BARNES_HUT_MAX_LEAF_PAIRS_PER_NODE * num_nodes:
+            break
+        depth += 1
+    weighted_x, weighted_y = masses * positions[:, 0], masses * positions[:, 1]
+    field = np.zeros_like(positions)
+    offsets = np.arange(6)
+
+    for level in range(2, depth + 1):
+        side = 1 << level
+        cell_x, cell_y = grid[:, 0] >> (depth - level), grid[:, 1] >> (depth - level)
+        cells = cell_x * side + cell_y
+        mass = np.bincount(cells, weights=masses, minlength=side * side)
+        sum_x = np.bincount(cells, weights=weighted_x, minlength=side * side)
+        sum_y = np.bincount(cells, weights=weighted_y, minlength=side * side)
+        occupied = np.flatnonzero(mass)
+        center_x = np.zeros(side * side)
+        center_y = np.zeros(side * side)
+        center_x[occupied] = sum_x[occupied] / mass[occupied]
+        center_y[occupied] = sum_y[occupied] / mass[occupied]
+
+        # Lista de interacción: desplazamientos de -3 a 3 (según la paridad), sin los adyacentes
+        row, col = occupied // side, occupied % side
+        other_row = (row - 2 - (row & 1))[:, None, None] + offsets[None, :, None]
+        other_col = (col - 2 - (col & 1))[:, None, None] + offsets[None, None, :]
+        candidate = ((np.abs(other_row - row[:, None, None]) > 1) | (np.abs(other_col - col[:, None, None]) > 1)) \
+            & (other_row >= 0) & (other_row < side) & (other_col >= 0) & (other_col < side)
+        owner = np.broadcast_to(np.arange(len(occupied))[:, None, None], candidate.shape)[candidate]
+        other = (other_row * side + other_col)[candidate]
+        keep = mass[other] > 0
+        owner, other = owner[keep], other[keep]
+        diff_x = center_x[occupied[owner]] - center_x[other]
+        diff_y = center_y[occupied[owner]] - center_y[other]
+        factor = mass[other] / np.maximum(diff_x ** 2 + diff_y ** 2, _MIN_SQUARED_DISTANCE)
+        cell_field_x = np.zeros(side * side)
+        cell_field_y = np.zeros(side * side)
+        cell_field_x[occupied] = np.bincount(owner, weights=factor * diff_x, minlength=len(occupied))
+        cell_field_y[occupied] = np.bincount(owner, weights=factor * diff_y, minlength=len(occupied))
+        field[:, 0] += cell_field_x[cells]
+        field[:, 1] += cell_field_y[cells]
+
+    # Campo cercano (nivel más fino): centros de masa de las 8 celdas vecinas
+    for offset_x in (-1, 0, 1):
+        for offset_y in (-1, 0, 1):
+            if offset_x == 0 and offset_y == 0:
+                continue
+            near_x, near_y = cell_x + offset_x, cell_y + offset_y
+            inside = (near_x >= 0) & (near_x < side) & (near_y >= 0) & (near_y < side)
+            near_cells = np.where(inside, near_x * side + near_y, 0)
+            near_mass = np.where(inside, mass[near_cells], 0.0)
+            near_sum_x, near_sum_y = sum_x[near_cells], sum_y[near_cells]
+            present = near_mass > 1e-12
+            safe_mass = np.where(present, near_mass, 1.0)
+            diff_x = positions[:, 0] - near_sum_x / safe_mass
+            diff_y = positions[:, 1] - near_sum_y / safe_mass
+            factor = np.where(present, near_mass, 0.0) / np.maximum(diff_x ** 2 + diff_y ** 2, _MIN_SQUARED_DISTANCE)
+            field[:, 0] += factor * diff_x
+            field[:, 1] += factor * diff_y
+
+    # Pares exactos dentro de cada celda del nivel más fino
+    order = np.argsort(cells, kind='stable')
+    group_starts = np.flatnonzero(np.r_[True, cells[order][1:] != cells[order][:-1]])
+    group_sizes = np.diff(np.r_[group_starts, num_nodes])
+    rank_in_group = np.arange(num_nodes) - np.repeat(group_starts, group_sizes)
+    later = np.repeat(group_sizes, group_sizes) - rank_in_group - 1 # Nodos posteriores en la misma celda
+    first = np.repeat(np.arange(num_nodes), later)
+    second = first + np.arange(len(first)) - np.repeat(np.cumsum(later) - later, later) + 1
+    first, second = order[first], order[second]
+    diff = positions[first] - positions[second]
+    factor = 1.0 / np.maximum((diff ** 2).sum(axis=1), _MIN_SQUARED_DISTANCE)
+    for axis in (0, 1):
+        field[:, axis] += np.bincount(first, weights=masses[second] * factor * diff[:, axis], minlength=num_nodes)
+        field[:, axis] -= np.bincount(second, weights=masses[first] * factor * diff[:, axis], minlength=num_nodes)
+    return field
+
+def _initial_positions(num_nodes, communities, rng):
+    """
+    Posiciones iniciales: uniformes en un cuadrado de lado ~sqrt(n) o, con comunidades,
+    cada comunidad agrupada alrededor de su propio centro (espiral de ángulo áureo, las más
+    grandes en el centro) con un radio proporcional a la raíz de su tamaño.
+    """
+    spread = 10.0 * math.sqrt(max(num_nodes, 1))
+    if communities is None:
+        return rng.uniform(-spread / 2, spread / 2, size=(num_nodes, 2))
+    labels, local_labels, sizes = np.unique(np.asarray(communities), return_inverse=True, return_counts=True)
+    rank = np.empty(len(labels), dtype=np.int64)
+    rank[np.argsort(-sizes, kind='stable')] = np.arange(len(labels))
+    angle = rank * math.pi * (3 - math.sqrt(5))
+    radius = spread / 2 * np.sqrt(rank / max(len(labels), 1))
+    centers = np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+    scatter = 10.0 * np.sqrt(sizes)[local_labels] / 3
+    return centers[local_labels] + rng.normal(size=(num_nodes, 2)) * scatter[:, None]
+
+def forceatlas2_layout(num_nodes, sources, targets, iterations=100, communities=None, initial_positions=None,
+                       scaling_ratio=2.0, gravity=1.0, barnes_hut=None, seed=None, show_progress=True, edge_weights=None):
+    """
+    Layout ForceAtlas2 (Jacomy et al., 2014) de un grafo con nodos 0..num_nodes-1 y aristas
+    (sources[i], targets[i]), tratadas como no dirigidas.
+    - Repulsión scaling_ratio * (d_i + 1)(d_j + 1) / distancia, aproximada con Barnes-Hut
+      (barnes_hut=None: solo si num_nodes > BARNES_HUT_MIN_NODES).
+    - Atracción lineal a lo largo de las aristas (multiplicada por edge_weights, si se dan)
+      y gravedad hacia el origen.
+    - Velocidad adaptativa global y por nodo (swinging / traction), como en Gephi.
+    communities (array de etiquetas por nodo, opcional) agrupa las posiciones iniciales.
+    Retorna un array (num_nodes, 2) float64.
+    """
+    rng = np.random.default_rng(seed)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    if initial_positions is not None:
+        positions = np.array(initial_positions, dtype=np.float64)
+    else:
+        positions = _initial_positions(num_nodes, communities, rng)
+    if num_nodes < 2:
+        return positions
+    if barnes_hut is None:
+        barnes_hut = num_nodes > BARNES_HUT_MIN_NODES
+
+    not_loop = sources != targets
+    sources, targets = sources[not_loop], targets[not_loop]
+    weights = None if edge_weights is None else np.asarray(edge_weights, dtype=np.float64)[not_loop]
+    masses = np.bincount(sources, minlength=num_nodes) + np.bincount(targets, minlength=num_nodes) + 1.0
+    previous_forces = np.zeros_like(positions)
+    speed, speed_efficiency = 1.0, 1.0
+
+    for _ in tqdm(range(iterations), desc="ForceAtlas2 Layout", unit="iter", disable=not show_progress):
+        repulsion = _barnes_hut_repulsion(positions, masses) if barnes_hut else _exact_repulsion(positions, masses)
+        forces = scaling_ratio * masses[:, None] * repulsion
+        edge_diff = positions[sources] - positions[targets]
+        if weights is not None:
+            edge_diff *= weights[:, None]
+        for axis in (0, 1):
+            forces[:, axis] -= np.bincount(sources, weights=edge_diff[:, axis], minlength=num_nodes)
+            forces[:, axis] += np.bincount(targets, weights=edge_diff[:, axis], minlength=num_nodes)
+        distance_to_origin = np.maximum(np.linalg.norm(positions, axis=1), 1e-9)
+        forces -= (gravity * masses / distance_to_origin)[:, None] * positions
+
+        # Velocidad adaptativa (ver "Adjust speed and apply forces" en la implementación de Gephi)
+        swinging = masses * np.linalg.norm(forces - previous_forces, axis=1)
+        traction = masses * np.linalg.norm(forces + previous_forces, axis=1) / 2
+        total_swinging, total_traction = swinging.sum(), traction.sum()
+        estimated_jitter = 0.05 * math.sqrt(num_nodes)
+        jitter = max(math.sqrt(estimated_jitter), min(10.0, estimated_jitter * total_traction / num_nodes ** 2))
+        if total_swinging / max(total_traction, 1e-12) > 2.0:
+            speed_efficiency = max(speed_efficiency * 0.5, 0.05)
+            jitter = max(jitter, 1.0)
+        target_speed = jitter * speed_efficiency * total_traction / max(total_swinging, 1e-12)
+        if total_swinging > jitter * total_traction:
+            speed_efficiency = max(speed_efficiency * 0.7, 0.05)
+        elif speed < 1000:
+            speed_efficiency *= 1.3
+        speed += min(target_speed - speed, 0.5 * speed)
+        node_speed = speed / (1 + np.sqrt(speed * swinging))
+        positions += forces * node_speed[:, None]
+        previous_forces = forces
+    return positions
+
+def graph_layout(graph, node_ids, communities=None, iterations=100, seed=None):
+    """
+    Layout ForceAtlas2 del subgrafo inducido por node_ids (user_ids) de un SocialGraph.
+    communities es el dict {user_id: community_id} de louvain_optimized (opcional).
+    Retorna (x, y): arrays float64 alineados con node_ids.
+    """
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    if len(node_ids) == 0:
+        return np.zeros(0), np.zeros(0)
+    edge_sources, edge_targets = induced_subgraph(graph, node_ids)
+    position_of = np.zeros(int(node_ids.max()) + 1, dtype=np.int64)
+    position_of[node_ids] = np.arange(len(node_ids))
+    labels = None
+    if communities:
+        labels = np.array([communities.get(int(node_id), -1) for node_id in node_ids], dtype=np.int64)
+    positions = forceatlas2_layout(len(node_ids), position_of[edge_sources], position_of[edge_targets],
+                                   iterations=iterations, communities=labels, seed=seed)
+    return positions[:, 0], positions[:, 1]
+
+
+if __name__ == "__main__":
+    import time
+    print("--- Testing ForceAtlas2 Layout Engine ---")
+    # Dos cliques de 5 nodos unidos por una arista: deben quedar separados
+    clique_edges = [(i, j) for i in range(5) for j in range(i + 1, 5)]
+    test_edges = np.array(clique_edges + [(i + 5, j + 5) for i, j in clique_edges] + [(0, 5)])
+    layout = forceatlas2_layout(10, test_edges[:, 0], test_edges[:, 1], iterations=200, seed=0, show_progress=False)
+    first, second = layout[:5].mean(axis=0), layout[5:].mean(axis=0)
+    spread = max(np.linalg.norm(layout[:5] - first, axis=1).max(), np.linalg.norm(layout[5:] - second, axis=1).max())
+    print(f"Distance between cliques: {np.linalg.norm(first - second):.2f}, max radius within a clique: {spread:.2f}") # Distancia > radio
+
+    # Barnes-Hut frente a la repulsión exacta
+    rng = np.random.default_rng(0)
+    test_positions = rng.normal(size=(3000, 2)) * 50
+    test_masses = rng.integers(1, 10, 3000).astype(float)
+    exact_field = _exact_repulsion(test_positions, test_masses)
+    approximate_field = _barnes_hut_repulsion(test_positions, test_masses)
+    relative_error = np.linalg.norm(approximate_field - exact_field, axis=1) / np.linalg.norm(exact_field, axis=1)
+    print(f"Barnes-Hut relative error: median {np.median(relative_error):.3f}, 90th percentile {np.percentile(relative_error, 90):.3f}")
+
+    # Grafo aleatorio de 20.000 nodos con comunidades como semilla
+    num_test_nodes = 20000
+    random_sources = rng.integers(0, num_test_nodes, 80000)
+    random_targets = (random_sources + rng.integers(-50, 50, 80000)) % num_test_nodes # Localidad: comunidades
+    start_time = time.time()
+    big_layout = forceatlas2_layout(num_test_nodes, random_sources, random_targets, iterations=50,
+                                    communities=np.arange(num_test_nodes) // 1000, seed=0)
+    print(f"Layout of {num_test_nodes} nodes (50 iterations) in {time.time() - start_time:.2f} s, finite: {np.isfinite(big_layout).all()}")
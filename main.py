@@ -1,32 +1,74 @@
 # main.py
+import importlib.util
 import time
 import os
 from datetime import datetime # Added for timestamp logging
 
-# Importar NUM_USERS de data_generator para saber con cuántos usuarios se generaron los datos
-# si el usuario ejecuta data_generator.py standalone primero.
-# Si main.py controla la generación, usará su propia constante.
-from data_generator import generate_location_data, generate_user_data
+# data_generator y visualizer (plotly, matplotlib) se importan solo donde se usan (import
+# diferido): cargar un grafo y consultarlo no debe pagar su coste de arranque.
 # No necesitamos importar NUM_USERS de data_generator aquí si main controla la generación.
 # from data_generator import NUM_USERS as DEFAULT_NUM_USERS_FROM_GENERATOR
 
 from graph_utils import SocialGraph
 from network_algorithms import (
     average_shortest_path_length,
+    hyper_anf,
+    clustering_coefficients,
     louvain_optimized, # Cambiado de simplified_louvain
-    prim_mst
+    spanning_forest, # Reemplaza a prim_mst (todas las aristas pesan 1)
+    minimum_spanning_forest
 )
-from visualizer import visualize_network_plotly, visualize_sample_graph_mpl
 
 # Definir el número de usuarios para la simulación controlada por main.py
 # Esto anula el NUM_USERS que podría estar en data_generator.py si se ejecutó standalone.
 # Para pruebas en este entorno, mantenemos un número pequeño.
 # Para tus pruebas locales con archivos grandes, este valor no se usa si use_simulated_data=False.
 MAIN_SIMULATION_NUM_USERS = 100 # Usado solo si use_simulated_data=True
+# Procesos para parsear el archivo de conexiones externo (1 = parser vectorizado secuencial).
+MAIN_LOADER_WORKERS = os.cpu_count() or 1
+# Procesos para el cálculo de caminos más cortos en grafos grandes (1 = en el proceso actual).
+MAIN_ANALYSIS_WORKERS = os.cpu_count() or 1
+# Registros HyperLogLog por nodo para HyperANF (memoria = nodos * registros bytes).
+MAIN_HYPERANF_REGISTERS = 32
+# Por encima de este número de nodos el clustering se estima muestreando wedges (sin clustering local).
+MAIN_EXACT_CLUSTERING_MAX_NODES = 1000000
+MAIN_CLUSTERING_SAMPLES = 200000
+
+def _load_graph_from_text(actual_loc_file, actual_user_file, use_simulated_data):
+    """Construye el grafo parseando los archivos de texto de ubicaciones y conexiones."""
+    graph = SocialGraph()
+
+    # Determinar batch_size basado en el tamaño de la simulación o un valor por defecto grande
+    # si se usan archivos externos (donde no conocemos el tamaño de antemano).
+    # Para archivos externos grandes se usa además el parser vectorizado por bloques (una sola pasada).
+    if use_simulated_data:
+        loc_batch_size = max(10, MAIN_SIMULATION_NUM_USERS // 20) # Al menos 10, o 5%
+        conn_batch_size_report = max(10, MAIN_SIMULATION_NUM_USERS // 20)
+        use_vectorized_loader = False
+        loader_workers = 1
+    else: # Para archivos externos grandes, usar un batch size mayor por defecto
+        loc_batch_size = 100000
+        conn_batch_size_report = 100000
+        use_vectorized_loader = True
+        loader_workers = MAIN_LOADER_WORKERS
 
-def run_analysis_pipeline(use_simulated_data=True, locations_file=None, users_file=None):
+    graph.load_locations_batched(actual_loc_file, batch_size=loc_batch_size, vectorized=use_vectorized_loader)
+    graph.load_users_connections_batched(actual_user_file, batch_size_progress_report=conn_batch_size_report,
+                                         vectorized=use_vectorized_loader, workers=loader_workers)
+    return graph
+
+def _snapshot_is_fresh(snapshot_file, source_files):
+    """True si el snapshot existe y es más reciente que todos los archivos de texto de origen."""
+    if not snapshot_file or not os.path.exists(snapshot_file):
+        return False
+    snapshot_mtime = os.path.getmtime(snapshot_file)
+    return all(os.path.getmtime(source) <= snapshot_mtime for source in source_files)
+
+def run_analysis_pipeline(use_simulated_data=True, locations_file=None, users_file=None, snapshot_file=None):
     """
     Ejecuta el pipeline completo de análisis de grafos, ahora usando funciones optimizadas.
+    Si se indica snapshot_file, el grafo se abre desde ese snapshot binario (memory-mapped)
+    cuando está al día con los archivos de texto; si no, se parsean los textos y se guarda.
     """
     start_datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     print(f"--- Pipeline de Análisis Iniciado: {start_datetime_str} ---")
@@ -39,6 +81,7 @@ def run_analysis_pipeline(use_simulated_data=True, locations_file=None, users_fi
         print(f"Generando datos simulados para {MAIN_SIMULATION_NUM_USERS} usuarios...")
         sim_loc_file = "simulated_locations.txt"
         sim_user_file = "simulated_users.txt"
+        from data_generator import generate_location_data, generate_user_data
         # Pasar explícitamente el número de usuarios a generar
         generate_location_data(sim_loc_file, num_users_to_generate=MAIN_SIMULATION_NUM_USERS)
         generate_user_data(sim_user_file, num_users_to_generate=MAIN_SIMULATION_NUM_USERS)
@@ -54,19 +97,21 @@ def run_analysis_pipeline(use_simulated_data=True, locations_file=None, users_fi
 
     # 1. Cargar Grafo usando métodos optimizados
     print("--- 1. Cargando Grafo (Optimizado) ---")
-    graph = SocialGraph()
-
-    # Determinar batch_size basado en el tamaño de la simulación o un valor por defecto grande
-    # si se usan archivos externos (donde no conocemos el tamaño de antemano).
-    if use_simulated_data:
-        loc_batch_size = max(10, MAIN_SIMULATION_NUM_USERS // 20) # Al menos 10, o 5%
-        conn_batch_size_report = max(10, MAIN_SIMULATION_NUM_USERS // 20)
-    else: # Para archivos externos grandes, usar un batch size mayor por defecto
-        loc_batch_size = 100000
-        conn_batch_size_report = 100000
-
-    graph.load_locations_batched(actual_loc_file, batch_size=loc_batch_size)
-    graph.load_users_connections_batched(actual_user_file, batch_size_progress_report=conn_batch_size_report)
+    graph = None
+    if not use_simulated_data and _snapshot_is_fresh(snapshot_file, [actual_loc_file, actual_user_file]):
+        try:
+            graph = SocialGraph.load_snapshot(snapshot_file, mmap=True)
+        except (OSError, ValueError) as e:
+            print(f"No se pudo abrir el snapshot ({e}). Se parsearán los archivos de texto.")
+            graph = None
+
+    if graph is None:
+        graph = _load_graph_from_text(actual_loc_file, actual_user_file, use_simulated_data)
+        if snapshot_file and not use_simulated_data and graph.get_number_of_nodes(force_recount=False) > 0:
+            try:
+                graph.save_snapshot(snapshot_file)
+            except OSError as e:
+                print(f"No se pudo guardar el snapshot: {e}")
 
     if graph.get_number_of_nodes(force_recount=False) == 0:
         print("Grafo vacío después de la carga. Finalizando análisis.")
@@ -87,32 +132,61 @@ def run_analysis_pipeline(use_simulated_data=True, locations_file=None, users_fi
     sample_size_asp = 100 if num_nodes_for_asp > 1000 else None
     if num_nodes_for_asp <= 200 : sample_size_asp = None # Para simulaciones pequeñas, calcular todos.
 
-    avg_path_len = average_shortest_path_length(graph, sample_size=sample_size_asp)
-    print(f"Longitud promedio del camino más corto (sample_size={sample_size_asp if sample_size_asp is not None else 'all'}): {avg_path_len:.2f}")
+    asp_workers = MAIN_ANALYSIS_WORKERS if num_nodes_for_asp > 1000 else 1 # El pool no compensa en grafos pequeños
+    avg_path_len = average_shortest_path_length(graph, sample_size=sample_size_asp, workers=asp_workers, giant_component=True)
+    print(f"Longitud promedio del camino más corto (componente gigante, sample_size={sample_size_asp if sample_size_asp is not None else 'all'}): {avg_path_len:.2f}")
+
+    print("\nEstimando la distribución de distancias (HyperANF)...")
+    distance_summary = hyper_anf(graph, num_registers=MAIN_HYPERANF_REGISTERS)
+    print(f"Distancia promedio (todos los pares alcanzables, aprox.): {distance_summary['average_distance']:.2f}")
+    print(f"Diámetro efectivo (percentil 90, aprox.): {distance_summary['effective_diameter']:.2f}")
 
+    approximate_clustering = graph.get_number_of_nodes() > MAIN_EXACT_CLUSTERING_MAX_NODES
+    if approximate_clustering:
+        print(f"\nEstimando coeficientes de clustering ({MAIN_CLUSTERING_SAMPLES} wedges muestreados)...")
+    else:
+        print("\nCalculando coeficientes de clustering (conteo de triángulos)...")
+    clustering = clustering_coefficients(graph, sample_size=MAIN_CLUSTERING_SAMPLES if approximate_clustering else None, seed=0)
+    print(f"Triángulos{' (estimados)' if approximate_clustering else ''}: {clustering['triangles']}, clustering global (transitividad): {clustering['global']:.4f}, clustering medio: {clustering['average']:.4f}")
 
     print("\nDetectando comunidades (Louvain optimizado)...")
-    communities = louvain_optimized(graph, max_passes=5)
+    louvain_workers = MAIN_ANALYSIS_WORKERS if graph.get_number_of_nodes() > 100000 else 1
+    communities, community_levels = louvain_optimized(graph, max_passes=5, return_hierarchy=True, workers=louvain_workers)
     if communities:
         num_detected_communities = len(set(communities.values()))
-        print(f"Número de comunidades detectadas: {num_detected_communities}")
+        print(f"Número de comunidades detectadas: {num_detected_communities} ({len(community_levels)} niveles de agregación)")
     else:
         print("No se detectaron comunidades.")
 
-    print("\nCalculando Árbol de Expansión Mínima (Prim)...")
-    mst = prim_mst(graph)
-    if mst:
-        print(f"MST encontrado con {len(mst)} aristas.")
+    print("\nCalculando Bosque de Expansión Mínima (Borůvka)...")
+    mst_sources, mst_targets = spanning_forest(graph)
+    if len(mst_sources) > 0:
+        num_mst_components = graph.get_number_of_nodes() - len(mst_sources)
+        print(f"MST encontrado con {len(mst_sources)} aristas ({num_mst_components} componentes conexas).")
     else:
         print("No se pudo generar el MST.")
 
+    if graph.locations:
+        print("\nCalculando MST geográfico (Borůvka, distancia haversine)...")
+        geo_sources, geo_targets, geo_weights = minimum_spanning_forest(graph, weight='haversine')
+        print(f"MST geográfico con {len(geo_sources)} aristas, longitud total {geo_weights.sum():,.0f} km.")
+
+        spatial_index = graph.get_spatial_index()
+        if spatial_index.num_points > 0:
+            reference_user = int(spatial_index.user_ids[0])
+            reference_lat, reference_lon = graph.locations[reference_user]
+            nearest_users, nearest_km = spatial_index.query_knn(reference_lat, reference_lon, 6)
+            nearby_users, _ = spatial_index.query_radius(reference_lat, reference_lon, 50.0)
+            print(f"Usuarios más cercanos al usuario {reference_user}: {nearest_users[1:].tolist()} (hasta {nearest_km[-1]:.1f} km); {len(nearby_users) - 1} usuarios a menos de 50 km.")
+
 
     # 3. Visualización
     print("\n--- 3. Visualización Interactiva (Plotly) ---")
+    from visualizer import visualize_network_plotly, visualize_community_graph
     # La lógica de muestreo para grafos grandes ahora está dentro de visualize_network_plotly.
     # Ya no es necesario el chequeo de tamaño aquí para omitir la visualización.
     print("Generando visualización de la red (Plotly)...")
-    layout_type_vis = 'locations' if graph.locations and len(graph.locations) > 0 else 'random'
+    layout_type_vis = 'locations' if graph.locations and len(graph.locations) > 0 else 'force'
 
     # visualize_network_plotly ahora maneja internamente el muestreo si el grafo es grande.
     fig = visualize_network_plotly(graph, communities=communities, layout_type=layout_type_vis)
@@ -120,7 +194,7 @@ def run_analysis_pipeline(use_simulated_data=True, locations_file=None, users_fi
     if fig and (fig.data or fig.layout.annotations): # Chequeo básico si la figura tiene contenido
         output_html_file = "network_visualization.html"
         try:
-            fig.write_html(output_html_file)
+            fig.write_html(output_html_file, include_plotlyjs="cdn") # plotly.js desde CDN: HTML pequeño
             print(f"Visualización guardada en: {os.path.abspath(output_html_file)}")
             print(f"AIDERAIDER_CONTENT_DISPLAY_HTML:{os.path.abspath(output_html_file)}")
         except Exception as e:
@@ -128,6 +202,31 @@ def run_analysis_pipeline(use_simulated_data=True, locations_file=None, users_fi
     else:
         print("No se generó la figura de Plotly o estaba vacía (posiblemente debido a un grafo vacío o error en la visualización).")
 
+    if communities:
+        print("Generando grafo de comunidades (Plotly)...")
+        community_fig = visualize_community_graph(graph, communities, layout_type=layout_type_vis)
+        if community_fig and community_fig.data:
+            community_html_file = "network_communities.html"
+            try:
+                community_fig.write_html(community_html_file, include_plotlyjs="cdn")
+                print(f"Visualización guardada en: {os.path.abspath(community_html_file)}")
+            except Exception as e:
+                print(f"Error al guardar la visualización HTML: {e}")
+
+    if clustering['local'] is None: # Solo hay valores locales con el conteo exacto
+        print("Clustering local no disponible (estimado por muestreo); se omite network_clustering.html.")
+        clustering_fig = None
+    else:
+        print("Generando visualización coloreada por clustering local (Plotly)...")
+        clustering_fig = visualize_network_plotly(graph, layout_type=layout_type_vis, node_values=clustering['local'], node_values_label='Clustering local')
+    if clustering_fig and clustering_fig.data:
+        clustering_html_file = "network_clustering.html"
+        try:
+            clustering_fig.write_html(clustering_html_file, include_plotlyjs="cdn")
+            print(f"Visualización guardada en: {os.path.abspath(clustering_html_file)}")
+        except Exception as e:
+            print(f"Error al guardar la visualización HTML: {e}")
+
     pipeline_end_time = time.time()
     total_duration_seconds = pipeline_end_time - pipeline_start_time
     end_datetime_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -149,10 +248,11 @@ def interactive_menu(graph):
     while True:
         print("\nOpciones:")
         print("1. Mostrar Top N usuarios influyentes (por in-degree)")
-        print("2. Visualizar muestra del grafo (Matplotlib)")
-        print("3. Salir del menú")
+        print("2. Mostrar Top N usuarios influyentes (por PageRank)")
+        print("3. Visualizar muestra del grafo (Matplotlib)")
+        print("4. Salir del menú")
 
-        choice = input("Selecciona una opción (1-3): ")
+        choice = input("Selecciona una opción (1-4): ")
 
         if choice == '1':
             try:
@@ -177,6 +277,27 @@ def interactive_menu(graph):
                 print(f"Ocurrió un error al obtener los top influencers: {e}")
 
         elif choice == '2':
+            try:
+                n_str = input("Introduce el número de usuarios top a mostrar (ej. 10): ")
+                n_top = int(n_str)
+                if n_top <= 0:
+                    print("Por favor, introduce un número positivo.")
+                    continue
+
+                print(f"\n--- Top {n_top} Usuarios Más Influyentes (por PageRank) ---")
+                top_influencers = graph.get_top_n_influencers(n=n_top, metric="pagerank")
+
+                if not top_influencers:
+                    print("No se encontraron influencers o el grafo no tiene suficientes datos.")
+                else:
+                    for i, (user_id, score) in enumerate(top_influencers):
+                        print(f"{i+1}. Usuario ID: {user_id}, PageRank: {score:.6f}, In-Degree (Seguidores): {graph.get_node_degree(user_id, 'in')}")
+            except ValueError:
+                print("Entrada no válida. Por favor, introduce un número.")
+            except Exception as e:
+                print(f"Ocurrió un error al calcular PageRank: {e}")
+
+        elif choice == '3':
             try:
                 sample_size_str = input("Introduce el tamaño de la muestra para visualización (ej. 50, default 50): ")
                 if not sample_size_str.strip(): # Si está vacío, usar default
@@ -188,12 +309,13 @@ def interactive_menu(graph):
                     print("Por favor, introduce un número positivo para el tamaño de la muestra.")
                     continue
 
+                from visualizer import visualize_sample_graph_mpl
                 visualize_sample_graph_mpl(graph, sample_size=sample_size_val)
             except ValueError:
                 print("Entrada no válida. Por favor, introduce un número para el tamaño de la muestra.")
             except Exception as e:
                 print(f"Ocurrió un error durante la visualización de la muestra: {e}")
-        elif choice == '3':
+        elif choice == '4':
             print("Saliendo del menú interactivo.")
             break
         else:
@@ -202,9 +324,7 @@ def interactive_menu(graph):
 
 if __name__ == "__main__":
     # ... (resto del código __main__ sin cambios hasta la llamada a run_analysis_pipeline)
-    try:
-        import plotly
-    except ImportError:
+    if importlib.util.find_spec("plotly") is None: # Comprobar sin importarlo
         print("Error: Plotly no está instalado. Ejecuta 'pip install plotly'. La visualización no funcionará.")
 
     # print(f"Ejecutando pipeline con datos simulados (MAIN_SIMULATION_NUM_USERS={MAIN_SIMULATION_NUM_USERS})...")
@@ -217,9 +337,11 @@ if __name__ == "__main__":
     external_users = "datos/10_million_user.txt"       # Reemplaza con tu nombre de archivo
     print(f"Intentando cargar desde: {external_locations} y {external_users}")
 
+    external_snapshot = "datos/10_million_graph.sgsnap" # Se crea en la primera ejecución
     graph_data = run_analysis_pipeline(use_simulated_data=False,
                                        locations_file=external_locations,
-                                       users_file=external_users)
+                                       users_file=external_users,
+                                       snapshot_file=external_snapshot)
 
     # Iniciar menú interactivo si el grafo se cargó
     if graph_data:
@@ -2,250 +2,1124 @@
 import collections
 import math
 import random
-import heapq # Para Prim
-from tqdm import tqdm
+import numpy as np
+from graph_utils import csr_arrays, gather_neighbors, edge_sources, undirected_csr, location_arrays, haversine_km, tqdm
+
+def _edge_source_array(indptr):
+    """Origen de cada arista como int32 (la mitad de memoria que edge_sources en grafos grandes)."""
+    num_rows = len(indptr) - 1
+    dtype = np.int32 if num_rows < np.iinfo(np.int32).max else np.int64
+    return np.repeat(np.arange(num_rows, dtype=dtype), np.diff(indptr))
 
 # --- 1. Análisis de Camino Más Corto (BFS) ---
 
+def bfs_distances(graph, start_node, csr=None):
+    """
+    BFS sincronizado por niveles sobre los arrays CSR del grafo.
+    Retorna un array int32 de distancias indexado por user_id (-1 = inalcanzable).
+    En cada nivel los vecinos de toda la frontera se expanden de forma vectorizada.
+    csr permite pasar (indptr, indices) ya obtenidos para evitar reconstruirlos.
+    """
+    indptr, indices = csr if csr is not None else csr_arrays(graph)
+    num_rows = len(indptr) - 1
+    distances = np.full(num_rows, -1, dtype=np.int32)
+    if not 0 < start_node < num_rows:
+        return distances
+    distances[start_node] = 0
+    # Deduplicación de la frontera en O(k) sin ordenar: cada nodo candidato queda "reclamado"
+    # por su última aparición y solo esa aparición pasa a la siguiente frontera.
+    claimed_by = np.empty(num_rows, dtype=np.int64)
+    frontier = np.array([start_node], dtype=np.int64)
+    level = 0
+    while len(frontier) > 0:
+        level += 1
+        neighbors = gather_neighbors(indptr, indices, frontier)
+        candidates = neighbors[distances[neighbors] < 0]
+        positions = np.arange(len(candidates))
+        claimed_by[candidates] = positions
+        frontier = candidates[claimed_by[candidates] == positions].astype(np.int64)
+        distances[frontier] = level
+    return distances
+
+def _popcount_total(words):
+    """Número total de bits a 1 en un array de uint64."""
+    if hasattr(np, 'bitwise_count'): # NumPy >= 2.0
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(np.unpackbits(np.ascontiguousarray(words).view(np.uint8)).sum(dtype=np.int64))
+
+def multi_source_bfs_path_sums(graph, sources, csr=None):
+    """
+    MS-BFS (Then et al., 2014, "The More the Merrier: Efficient Multi-Source Graph Traversal"):
+    avanza len(sources) BFS a la vez. Cada nodo guarda bitsets uint64 (un bit por fuente) de
+    'visto' y 'frontera', de modo que cada arista de la frontera se recorre una sola vez por
+    nivel para todas las fuentes del lote.
+    Retorna (total_path_length, num_paths_found) sumados sobre todas las fuentes, igual que
+    sumar las distancias > 0 de bfs_distances para cada una.
+    """
+    indptr, indices = csr if csr is not None else csr_arrays(graph)
+    num_rows = len(indptr) - 1
+    sources = np.asarray(sources, dtype=np.int64)
+    sources = sources[(sources > 0) & (sources < num_rows)]
+    if len(sources) == 0:
+        return 0, 0
+    num_words = (len(sources) + 63) // 64
+    source_idx = np.arange(len(sources))
+    source_bits = np.left_shift(np.uint64(1), (source_idx % 64).astype(np.uint64))
+
+    # Un array 1D de uint64 por palabra de 64 fuentes (los accesos 1D son mucho más rápidos).
+    seen = [np.zeros(num_rows, dtype=np.uint64) for _ in range(num_words)]
+    frontier = [np.zeros(num_rows, dtype=np.uint64) for _ in range(num_words)]
+    visit = [np.zeros(num_rows, dtype=np.uint64) for _ in range(num_words)] # Acumulador del nivel
+    for word in range(num_words):
+        in_word = source_idx // 64 == word
+        np.bitwise_or.at(seen[word], sources[in_word], source_bits[in_word])
+        frontier[word][:] = seen[word]
+    claimed_by = np.empty(num_rows, dtype=np.int64)
+
+    active = np.unique(sources)
+    total_path_length, num_paths_found, level = 0, 0, 0
+    while len(active) > 0:
+        level += 1
+        row_lengths = indptr[active + 1] - indptr[active]
+        targets = gather_neighbors(indptr, indices, active)
+        origins = np.repeat(active, row_lengths)
+
+        # Nodos tocados sin repetir (deduplicación O(k) como en bfs_distances).
+        positions = np.arange(len(targets))
+        claimed_by[targets] = positions
+        touched = targets[claimed_by[targets] == positions]
+
+        has_new = np.zeros(len(touched), dtype=bool)
+        new_bits = []
+        for word in range(num_words):
+            # visit[v] |= frontier[u] para cada arista u -> v que sale de la frontera.
+            np.bitwise_or.at(visit[word], targets, frontier[word][origins])
+            frontier[word][active] = 0
+            word_new = visit[word][touched] & ~seen[word][touched]
+            visit[word][touched] = 0
+            has_new |= word_new != 0
+            new_bits.append(word_new)
+
+        touched = touched[has_new]
+        for word in range(num_words):
+            word_new = new_bits[word][has_new]
+            seen[word][touched] |= word_new
+            frontier[word][touched] = word_new
+            reached = _popcount_total(word_new)
+            total_path_length += level * reached
+            num_paths_found += reached
+        active = touched
+    return total_path_length, num_paths_found
+
 def bfs_shortest_paths(graph, start_node):
+    """Compatibilidad: distancias desde start_node como dict {nodo: distancia} (solo alcanzables)."""
     if start_node not in graph.get_nodes():
         return {}
-    queue = collections.deque([(start_node, 0)])
-    distances = {start_node: 0}
-    while queue:
-        current_node, dist = queue.popleft()
-        for neighbor in graph.adj.get(current_node, []):
-            if neighbor not in distances:
-                distances[neighbor] = dist + 1
-                queue.append((neighbor, dist + 1))
-    return distances
+    distances = bfs_distances(graph, start_node)
+    reached = np.flatnonzero(distances >= 0)
+    return dict(zip(reached.tolist(), distances[reached].tolist()))
+
+# Estado de cada worker del pool: arrays CSR adjuntados desde memoria compartida.
+_WORKER_STATE = {}
+_LOUVAIN_MIN_PARALLEL_BATCH = 20000 # Tamaño mínimo de lote de color para repartirlo entre workers
+
+def _init_path_length_worker(csr_specs):
+    from parallel_utils import attach_shared_arrays
+    arrays, blocks = attach_shared_arrays(csr_specs)
+    _WORKER_STATE['csr'] = (arrays['indptr'], arrays['indices'])
+    _WORKER_STATE['blocks'] = blocks # Mantener vivos los bloques compartidos
+
+def _path_length_worker_task(sources, batch_sources):
+    """Sumas parciales (total_path_length, num_paths_found) de un grupo de fuentes."""
+    csr = _WORKER_STATE['csr']
+    if batch_sources is not None and batch_sources > 1:
+        return multi_source_bfs_path_sums(None, sources, csr=csr)
+    total_path_length, num_paths_found = 0, 0
+    for start_node in sources:
+        reached = bfs_distances(None, start_node, csr=csr)
+        reached = reached[reached > 0]
+        total_path_length += int(reached.sum(dtype=np.int64))
+        num_paths_found += len(reached)
+    return total_path_length, num_paths_found
 
-def average_shortest_path_length(graph, sample_size=None):
+def _average_shortest_path_parallel(csr, sources, batch_sources, workers):
+    """
+    Reparte las fuentes entre un ProcessPoolExecutor. Los workers adjuntan indptr/indices
+    desde memoria compartida (sin pickle del grafo) y devuelven sumas parciales enteras,
+    por lo que el resultado no depende del orden en que terminan.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    group_size = batch_sources if batch_sources is not None and batch_sources > 1 else max(1, len(sources) // (workers * 8))
+    groups = [sources[i:i + group_size] for i in range(0, len(sources), group_size)]
+    # Imports diferidos: los procesos y la memoria compartida solo se usan en modo paralelo
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from parallel_utils import SharedArrays
+    total_path_length, num_paths_found = 0, 0
+    with SharedArrays({'indptr': csr[0], 'indices': csr[1]}) as shared_csr:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_path_length_worker, initargs=(shared_csr.specs,)) as executor:
+            futures = {executor.submit(_path_length_worker_task, group, batch_sources): len(group) for group in groups}
+            with tqdm(total=len(sources), desc=f"Avg. Shortest Path ({workers} workers)", unit="node") as progress_bar:
+                for future in as_completed(futures):
+                    group_length, group_paths = future.result()
+                    total_path_length += group_length
+                    num_paths_found += group_paths
+                    progress_bar.update(futures[future])
+    return total_path_length, num_paths_found
+
+def _average_from_sums(total_path_length, num_paths_found, num_sources, num_nodes):
+    """Promedio final; informa qué fracción de pares (fuente, destino) era alcanzable."""
+    possible_pairs = num_sources * max(num_nodes - 1, 0)
+    if possible_pairs > 0:
+        tqdm.write(f"  Reachable pairs: {num_paths_found} of {possible_pairs} ({num_paths_found / possible_pairs:.1%}); unreachable pairs are excluded from the average.")
+    return total_path_length / num_paths_found if num_paths_found > 0 else 0.0
+
+def average_shortest_path_length(graph, sample_size=None, batch_sources=64, workers=1, seed=None, giant_component=False):
+    """
+    Longitud promedio de los caminos más cortos (dirigidos) desde todos los nodos o desde una
+    muestra de sample_size fuentes. Con batch_sources > 1 las fuentes se procesan en lotes con
+    MS-BFS (multi_source_bfs_path_sums); con batch_sources=None o 1, un BFS por fuente.
+    Con workers > 1 los lotes se reparten en un pool de procesos que comparten el grafo por
+    memoria compartida. seed fija la muestra de fuentes (resultado determinista).
+    Solo se promedian los pares alcanzables (se informa la fracción). Con giant_component=True
+    las fuentes se toman de la componente débilmente conexa más grande, evitando gastar BFS
+    en nodos de componentes pequeñas.
+    """
     all_nodes = graph.get_nodes()
-    if not all_nodes: return 0.0
+    if len(all_nodes) == 0: return 0.0
+    num_nodes = len(all_nodes)
+    if giant_component:
+        all_nodes = giant_component_nodes(weakly_connected_components(graph)[0])
+    rng = random.Random(seed) if seed is not None else random
     nodes_to_process = []
     if sample_size is None or sample_size >= len(all_nodes):
         nodes_to_process = all_nodes
     else:
         actual_sample_size = min(max(0, sample_size), len(all_nodes))
         if actual_sample_size == 0: return 0.0
-        nodes_to_process = random.sample(all_nodes, actual_sample_size)
-    if not nodes_to_process: return 0.0
+        nodes_to_process = [all_nodes[i] for i in rng.sample(range(len(all_nodes)), actual_sample_size)]
+    if len(nodes_to_process) == 0: return 0.0
     total_path_length, num_paths_found = 0, 0
+    csr = csr_arrays(graph) # Una sola vez para todas las fuentes
+
+    if workers is not None and workers > 1:
+        total_path_length, num_paths_found = _average_shortest_path_parallel(csr, nodes_to_process, batch_sources, workers)
+        return _average_from_sums(total_path_length, num_paths_found, len(nodes_to_process), num_nodes)
+
+    if batch_sources is not None and batch_sources > 1:
+        sources = np.asarray(nodes_to_process, dtype=np.int64)
+        with tqdm(total=len(sources), desc="Avg. Shortest Path (MS-BFS)", unit="node") as progress_bar:
+            for batch_start in range(0, len(sources), batch_sources):
+                batch = sources[batch_start:batch_start + batch_sources]
+                batch_length, batch_paths = multi_source_bfs_path_sums(graph, batch, csr=csr)
+                total_path_length += batch_length
+                num_paths_found += batch_paths
+                progress_bar.update(len(batch))
+        return _average_from_sums(total_path_length, num_paths_found, len(nodes_to_process), num_nodes)
 
     # Progress bar for iterating through source nodes for BFS
     # print(f"Calculating average shortest path length (processing {len(nodes_to_process)} source nodes)...")
     for start_node in tqdm(nodes_to_process, desc="Avg. Shortest Path (BFS)", unit="node"):
-        distances = bfs_shortest_paths(graph, start_node)
-        for target_node, dist_val in distances.items():
-            if target_node != start_node:
-                total_path_length += dist_val
-                num_paths_found += 1
-    return total_path_length / num_paths_found if num_paths_found > 0 else 0.0
+        distances = bfs_distances(graph, start_node, csr=csr)
+        reached = distances[distances > 0] # Excluye la fuente (0) y los inalcanzables (-1)
+        total_path_length += int(reached.sum(dtype=np.int64))
+        num_paths_found += len(reached)
+    return _average_from_sums(total_path_length, num_paths_found, len(nodes_to_process), num_nodes)
 
 # --- 2. Detección de Comunidades (Louvain Optimizado) ---
 
-def louvain_optimized(graph, max_passes=5, min_modularity_increase=1e-7):
+def _louvain_level_graph(graph, node_ids):
     """
-    Algoritmo de Louvain (Fase 1) optimizado usando cálculo de Delta Q.
-    Trata el grafo como NO DIRIGIDO para la modularidad.
-    Ref: Blondel et al. (2008) "Fast unfolding of communities in large networks"
+    Grafo del nivel 0 de Louvain: CSR no dirigido ponderado (pesos 1) sobre las posiciones
+    0..N-1 de node_ids, sin auto-bucles. Retorna (indptr, indices, weights, self_loops).
     """
-    nodes = graph.get_nodes()
-    if not nodes: return {}
+    sym_indptr, sym_indices = undirected_csr(graph)
+    position_of = np.full(len(sym_indptr) - 1, -1, dtype=np.int64)
+    position_of[node_ids] = np.arange(len(node_ids))
+    row_lengths = sym_indptr[node_ids + 1] - sym_indptr[node_ids]
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=indptr[1:])
+    indices = position_of[gather_neighbors(sym_indptr, sym_indices, node_ids)]
+    return indptr, indices, np.ones(len(indices)), np.zeros(len(node_ids))
 
-    # 1. Construir representación no dirigida y calcular grados y m (número de aristas no dirigidas)
-    adj_undirected = collections.defaultdict(set)
-    degrees_undirected = collections.defaultdict(int)
-    edge_set_undirected = set()
-
-    for u in graph.adj: # graph.adj contiene aristas dirigidas
-        for v in graph.adj[u]:
-            # Considerar la existencia de una arista dirigida u->v como una arista no dirigida (u,v)
-            # No añadir duplicados si el grafo original ya tiene u->v y v->u.
-            # La lista de adyacencia no dirigida las tendrá en ambos sentidos.
-            adj_undirected[u].add(v)
-            adj_undirected[v].add(u)
+def _modularity_from_sums(sigma_in, sigma_tot, m2_undirected):
+    """
+    Modularidad a partir de las sumas por comunidad: Sigma_in (peso interno, cada arista
+    interna contada en ambos sentidos, más 2 * auto-bucles) y Sigma_tot (suma de grados).
+    Q = sum_c [Sigma_in_c / 2m - (Sigma_tot_c / 2m)^2]
+    """
+    return float(sigma_in.sum() / m2_undirected - np.square(sigma_tot / m2_undirected).sum())
 
-            # Para contar m_undirected correctamente (número de aristas únicas no dirigidas)
-            # y calcular grados no dirigidos:
-            # No es necesario edge_set_undirected si los grados se calculan desde adj_undirected final.
+def _louvain_pass_report(current_pass, level, num_moves, modularity, modularity_gain, min_modularity_increase):
+    """Informa una pasada de movimiento local; retorna True si hay que detener el nivel."""
+    tqdm.write(f"  Level {level}, pass {current_pass + 1}: {num_moves} moves, modularity {modularity:.6f} (+{modularity_gain:.2e})")
+    if num_moves == 0:
+        tqdm.write(f"  No change in modularity during pass {current_pass + 1}, stopping local moving (level {level}).")
+        return True
+    if modularity_gain < min_modularity_increase:
+        tqdm.write(f"  Modularity gain below {min_modularity_increase:g}, stopping local moving (level {level}).")
+        return True
+    return False
 
-    # Calcular grados no dirigidos y m_undirected
-    for node_id in nodes: # Asegurar que todos los nodos tengan una entrada de grado
-        degrees_undirected[node_id] = len(adj_undirected.get(node_id, set()))
+def _louvain_local_moving(indptr, indices, weights, self_loops, max_passes, level, min_modularity_increase):
+    """
+    Fase 1 de Louvain (movimiento local) sobre un grafo no dirigido ponderado en CSR simétrico,
+    con nodos 0..N-1 y auto-bucles (peso interno de super-nodos) en self_loops.
+    Kernel basado en arrays: etiquetas int32, Sigma_tot float64 y un buffer reutilizable con
+    lista de comunidades tocadas para los pesos k_i,c; no se reserva memoria por nodo.
+    Sigma_in y Sigma_tot se actualizan con cada movimiento, así que la modularidad de cada
+    pasada se obtiene sin recorrer las aristas; las pasadas se detienen cuando la ganancia
+    de modularidad es menor que min_modularity_increase.
+    Retorna (labels, made_change, modularity): array int32 nodo -> comunidad, si hubo algún
+    movimiento y la modularidad final de la partición.
+    """
+    num_nodes = len(indptr) - 1
+    # Grado ponderado: suma de pesos de aristas incidentes + 2 * auto-bucle.
+    degrees = np.bincount(edge_sources(indptr), weights=weights, minlength=num_nodes) + 2 * self_loops
+    m2_undirected = float(degrees.sum()) # Esto es 2*m (suma de todos los grados)
+    labels = np.arange(num_nodes, dtype=np.int32) # Inicialización: cada nodo en su propia comunidad
+    if m2_undirected == 0: # Grafo sin aristas
+        return labels, False, 0.0
 
-    m2_undirected = 0 # Esto será 2*m (suma de todos los grados no dirigidos)
-    for node_id in nodes:
-        m2_undirected += degrees_undirected[node_id]
+    sigma_tot = degrees.copy() # Sigma_tot[c]: suma de grados de los nodos de la comunidad c
+    sigma_in = 2 * self_loops # Sigma_in[c]: peso interno de c (aristas internas en ambos sentidos)
+    modularity = _modularity_from_sums(sigma_in, sigma_tot, m2_undirected)
+    k_i_to_comm = np.zeros(num_nodes) # Buffer: k_i,c = suma de pesos de aristas de i a la comunidad c
+    touched = np.empty(max(int(np.diff(indptr).max()), 1), dtype=np.int32) # Comunidades con k_i,c > 0
+    # memoryviews: acceso elemento a elemento sin crear escalares de NumPy (y sin copiar los arrays)
+    indptr_mv, indices_mv, weights_mv = memoryview(indptr), memoryview(np.ascontiguousarray(indices, dtype=np.int64)), memoryview(weights)
+    degrees_mv, labels_mv, sigma_mv = memoryview(degrees), memoryview(labels), memoryview(sigma_tot)
+    self_loops_mv, sigma_in_mv = memoryview(np.ascontiguousarray(self_loops)), memoryview(sigma_in)
+    k_i_mv, touched_mv = memoryview(k_i_to_comm), memoryview(touched)
+    made_change_in_level = False
 
-    if m2_undirected == 0: # Grafo sin aristas
-        return {node: i for i, node in enumerate(nodes)}
+    # Progress bar for Louvain passes
+    for current_pass in tqdm(range(max_passes), desc=f"Louvain Level {level} Passes", unit="pass"):
+        order = np.arange(num_nodes, dtype=np.int32)
+        random.shuffle(order)
+        num_moves = 0
 
-    # Inicialización: cada nodo en su propia comunidad
-    communities = {node: i for i, node in enumerate(nodes)}
+        for node_i in order.tolist():
+            original_community_id = labels_mv[node_i]
+            ki = degrees_mv[node_i]
 
-    # Información por comunidad para cálculo de Delta Q:
-    # Sigma_tot[c]: Suma de grados (no dirigidos) de nodos en la comunidad c. (ponderado por 2m si se usa esa modularidad)
-    # k_i_in[c]: Suma de pesos (1 para no ponderado) de aristas de nodo i a la comunidad c.
+            num_touched = 0
+            for edge_idx in range(indptr_mv[node_i], indptr_mv[node_i + 1]):
+                neighbor_community = labels_mv[indices_mv[edge_idx]]
+                if k_i_mv[neighbor_community] == 0.0: # Pesos > 0: primera arista hacia esa comunidad
+                    touched_mv[num_touched] = neighbor_community
+                    num_touched += 1
+                k_i_mv[neighbor_community] += weights_mv[edge_idx]
 
-    # Sigma_tot[comm_id] = sum of degrees of nodes in community comm_id
-    # community_total_degree[c] = sum_{i in c} degree(i)
-    community_total_degree = {i: degrees_undirected.get(node,0) for i, node in enumerate(nodes)}
+            sigma_mv[original_community_id] -= ki # Retirar temporalmente
 
-    # Progress bar for Louvain passes
-    for current_pass in tqdm(range(max_passes), desc="Louvain Passes", unit="pass"):
-        # print(f"Louvain Optimized Pass: {current_pass + 1}") # tqdm handles this
-        nodes_shuffled = list(nodes)
-        random.shuffle(nodes_shuffled)
-        made_change_in_pass = False
-
-        # Optional: Nested progress bar for nodes within a pass
-        # Can be verbose for large graphs, leave=False helps clean up after each pass.
-        for node_i in tqdm(nodes_shuffled, desc=f"Pass {current_pass + 1}", unit="node", leave=False):
-            original_community_id = communities[node_i]
-            ki = degrees_undirected.get(node_i, 0)
-
-            # Ganancia de modularidad si node_i se mueve a cada comunidad vecina (o se queda)
+            # Ganancia proporcional a Delta Q (2m * Delta Q, como en NetworkX):
+            #   gain = k_i,in - Sigma_tot * k_i / 2m
+            # Con i retirado de su comunidad, la de origen compite en igualdad con las demás
+            # y solo se mueve si otra comunidad mejora estrictamente la ganancia de quedarse.
             best_target_community_id = original_community_id
-            max_delta_q = 0.0 # Ganancia relativa a la comunidad actual de node_i
-
-            # Calcular conectividad de node_i a otras comunidades
-            # k_i_to_comm[c] = sum of weights of edges from i to nodes in community c
-            k_i_to_comm = collections.defaultdict(float)
-            for neighbor in adj_undirected.get(node_i, set()):
-                neighbor_comm_id = communities[neighbor]
-                k_i_to_comm[neighbor_comm_id] += 1.0 # Peso de arista es 1
-
-            # Considerar quitar node_i de su comunidad actual
-            # Efecto en la comunidad original:
-            # Sigma_tot'[C_orig] = Sigma_tot[C_orig] - ki
-            # k_i_in_C_orig = conectividad de i a su propia comunidad original
-
-            community_total_degree[original_community_id] -= ki # Retirar temporalmente
-
-            candidate_communities_ids = set(k_i_to_comm.keys())
-            candidate_communities_ids.add(original_community_id) # Opción de quedarse (o volver)
-
-            for target_comm_id in candidate_communities_ids:
-                # Delta Q para mover i a target_comm_id
-                # Formula (simplificada de Blondel et al. 2008, eq 2, adaptada):
-                # dQ = (k_i,in / 2m) - (Sigma_tot * k_i) / (2m)^2  (Ojo: 2m en denominador)
-                # Donde k_i,in es la suma de pesos de aristas de i a la comunidad C (target_comm_id)
-                # Sigma_tot es la suma de grados de nodos en C (ANTES de añadir i)
-                # k_i es el grado de i.
-                # m es el número de aristas no dirigidas (m2_undirected / 2)
-
-                # k_i_in_target: suma de pesos de aristas de i a target_comm_id
-                k_i_in_target = k_i_to_comm.get(target_comm_id, 0.0)
-
-                # Sigma_tot_target: suma de grados en target_comm_id (sin contar a i si no estaba ya)
-                sigma_tot_target = community_total_degree.get(target_comm_id, 0.0)
-                # Si target_comm_id == original_community_id, i ya fue retirado de su Sigma_tot.
-                # Si target_comm_id != original_community_id, i no está en sigma_tot_target.
-
-                # Ganancia = [ (k_i_in_target / m2_undirected) - (sigma_tot_target * ki) / (m2_undirected^2) ]
-                # El m2_undirected ya es 2*m. La formula es (k_i_in / 2m) - (Sigma_tot * k_i) / (2m)^2
-                # Ojo: Blondel et al. usan m para el total de pesos (que es 2*num_aristas para no ponderado)
-                # Si usamos m2_undirected = sum of degrees = 2 * num_aristas_no_dirigidas.
-                # Entonces Q = sum_ij (Aij - ki*kj / (2m)) * delta(ci,cj)
-                # DeltaQ = ( (sum_in + k_i_in) / 2m - ((sum_tot+ki)/2m)^2 ) - ( sum_in/2m - (sum_tot/2m)^2 - (ki/2m)^2 )
-                # Esto es para añadir un nodo aislado.
-                # Para mover de C_old a C_new, es más complejo.
-                # La implementación de NetworkX usa:
-                #   gain = k_i_in_target - sigma_tot_target * ki / m2_undirected
-                #   (esto es 2m * delta_Q, así que se compara con 0)
-
-                delta_q = (k_i_in_target - (sigma_tot_target * ki) / m2_undirected)
-                # Este delta_q es proporcional al cambio real. No es el valor absoluto.
-                # Se compara con el delta_q de la comunidad original.
-
-                if delta_q > max_delta_q:
-                    max_delta_q = delta_q
+            k_i_original = best_k_i_in = k_i_mv[original_community_id]
+            max_gain = k_i_original - sigma_mv[original_community_id] * ki / m2_undirected
+            for t in range(num_touched):
+                target_comm_id = touched_mv[t]
+                gain = k_i_mv[target_comm_id] - sigma_mv[target_comm_id] * ki / m2_undirected
+                if gain > max_gain:
+                    max_gain = gain
                     best_target_community_id = target_comm_id
+                    best_k_i_in = k_i_mv[target_comm_id]
+                k_i_mv[target_comm_id] = 0.0 # Limpiar el buffer para el siguiente nodo
 
-            # Añadir de nuevo ki a la comunidad de donde se retiró (que podría ser la original o la mejor si no cambió)
-            # Si best_target_community_id es diferente, se actualizará después.
-            community_total_degree[original_community_id] += ki # Revertir el retiro temporal
-
-            # Si se encontró una mejor comunidad (con mayor ganancia de modularidad)
+            sigma_mv[best_target_community_id] += ki
             if best_target_community_id != original_community_id:
-                 # Mover el nodo i
-                communities[node_i] = best_target_community_id
-                made_change_in_pass = True
+                labels_mv[node_i] = best_target_community_id
+                self_loop = self_loops_mv[node_i]
+                sigma_in_mv[original_community_id] -= 2 * (k_i_original + self_loop)
+                sigma_in_mv[best_target_community_id] += 2 * (best_k_i_in + self_loop)
+                num_moves += 1
+
+        previous_modularity, modularity = modularity, _modularity_from_sums(sigma_in, sigma_tot, m2_undirected)
+        made_change_in_level = made_change_in_level or num_moves > 0
+        if _louvain_pass_report(current_pass, level, num_moves, modularity, modularity - previous_modularity, min_modularity_increase):
+            break
+
+    return labels, made_change_in_level, modularity
+
+def _louvain_color_batches(indptr, indices):
+    """
+    Coloreo voraz aleatorio (Jones-Plassmann), vectorizado: en cada ronda los nodos sin color
+    cuya prioridad aleatoria supera la de todos sus vecinos sin color forman un conjunto
+    independiente (un color). Retorna la lista de lotes (arrays int64 de nodos), uno por color;
+    dos nodos de un mismo lote nunca son vecinos.
+    """
+    num_nodes = len(indptr) - 1
+    priority = np.random.default_rng(random.getrandbits(32)).permutation(num_nodes)
+    sources, targets = edge_sources(indptr), np.asarray(indices, dtype=np.int64)
+    uncolored = np.ones(num_nodes, dtype=bool)
+    batches = []
+    while uncolored.any():
+        active = uncolored[sources] & uncolored[targets] # Aristas entre nodos aún sin color
+        sources, targets = sources[active], targets[active]
+        neighbor_max_priority = np.full(num_nodes, -1, dtype=np.int64)
+        np.maximum.at(neighbor_max_priority, sources, priority[targets])
+        batch = np.flatnonzero(uncolored & (priority > neighbor_max_priority))
+        uncolored[batch] = False
+        batches.append(batch)
+    return batches
+
+def _louvain_batch_moves(nodes, indptr, indices, weights, degrees, labels, sigma_tot, m2_undirected):
+    """
+    Evalúa (vectorizado, sin aplicar) el mejor movimiento de cada nodo de un lote con las
+    etiquetas y Sigma_tot actuales. Misma regla que el kernel secuencial: un nodo se mueve
+    solo si otra comunidad mejora estrictamente la ganancia de quedarse.
+    Retorna (nodos_que_se_mueven, comunidades_destino, k_i_origen, k_i_destino), donde k_i_* es
+    el peso de las aristas de cada nodo hacia su comunidad de origen y de destino.
+    """
+    if len(nodes) == 0:
+        return nodes, nodes, np.zeros(0), np.zeros(0)
+    num_nodes = len(indptr) - 1
+    row_lengths = indptr[nodes + 1] - indptr[nodes]
+    edge_node = np.repeat(np.arange(len(nodes)), row_lengths) # Posición en el lote del nodo origen
+    edge_comms = labels[gather_neighbors(indptr, indices, nodes)].astype(np.int64)
+    pair_keys, pair_inverse = np.unique(edge_node * num_nodes + edge_comms, return_inverse=True)
+    k_i_in = np.bincount(pair_inverse, weights=gather_neighbors(indptr, weights, nodes), minlength=len(pair_keys))
+    pair_node, pair_comm = pair_keys // num_nodes, pair_keys % num_nodes
+
+    original = labels[nodes].astype(np.int64)
+    ki = degrees[nodes]
+    # Sigma_tot con el nodo retirado de su propia comunidad
+    pair_sigma = sigma_tot[pair_comm] - np.where(pair_comm == original[pair_node], ki[pair_node], 0.0)
+    gains = k_i_in - pair_sigma * ki[pair_node] / m2_undirected
+    stay_gains = -(sigma_tot[original] - ki) * ki / m2_undirected
+    is_original = pair_comm == original[pair_node]
+    stay_gains[pair_node[is_original]] = gains[is_original]
+    k_i_original = np.zeros(len(nodes))
+    k_i_original[pair_node[is_original]] = k_i_in[is_original]
+
+    # Mejor comunidad por nodo: ordenar por (nodo, -ganancia) y tomar el primero de cada grupo
+    order = np.lexsort((-gains, pair_node))
+    first = order[np.r_[True, pair_node[order[1:]] != pair_node[order[:-1]]]]
+    moving = gains[first] > stay_gains[pair_node[first]]
+    moving_positions = pair_node[first][moving]
+    return nodes[moving_positions], pair_comm[first][moving], k_i_original[moving_positions], k_i_in[first][moving]
+
+def _louvain_worker_arrays(specs):
+    """Arrays del nivel actual en el worker; se re-adjuntan solo cuando cambia el nivel."""
+    if _WORKER_STATE.get('louvain_specs') != specs:
+        from parallel_utils import attach_shared_arrays
+        _WORKER_STATE.pop('louvain_arrays', None) # Liberar vistas antes de cerrar los bloques
+        for block in _WORKER_STATE.pop('louvain_blocks', []):
+            block.close()
+        _WORKER_STATE['louvain_arrays'], _WORKER_STATE['louvain_blocks'] = attach_shared_arrays(specs)
+        _WORKER_STATE['louvain_specs'] = specs
+    return _WORKER_STATE['louvain_arrays']
+
+def _louvain_batch_task(specs, start, end, m2_undirected):
+    """Movimientos del tramo order[start:end] de un lote, leyendo el estado compartido."""
+    arrays = _louvain_worker_arrays(specs)
+    return _louvain_batch_moves(arrays['order'][start:end], arrays['indptr'], arrays['indices'], arrays['weights'],
+                                arrays['degrees'], arrays['labels'], arrays['sigma_tot'], m2_undirected)
+
+def _louvain_parallel_passes(executor, shared, workers, max_passes, level, m2_undirected, min_modularity_increase):
+    """
+    Pasadas de movimiento local por lotes de color: los nodos de cada lote se evalúan en
+    paralelo (tramos repartidos entre los workers) y los movimientos se aplican en el proceso
+    principal entre lotes, actualizando las etiquetas, Sigma_tot (compartidos) y Sigma_in.
+    Dentro de un lote ningún vecino cambia de comunidad, así que los k_i,c son exactos.
+    """
+    arrays = shared.arrays
+    labels, sigma_tot, degrees, order = arrays['labels'], arrays['sigma_tot'], arrays['degrees'], arrays['order']
+    self_loops = arrays['self_loops']
+    sigma_in = 2 * self_loops
+    modularity = _modularity_from_sums(sigma_in, sigma_tot, m2_undirected)
+    batches = _louvain_color_batches(arrays['indptr'], arrays['indices'])
+    batch_bounds = np.cumsum([0] + [len(batch) for batch in batches])
+    order[:] = np.concatenate(batches)
+    made_change_in_level = False
+
+    for current_pass in tqdm(range(max_passes), desc=f"Louvain Level {level} Passes ({workers} workers)", unit="pass"):
+        num_moves = 0
+        batch_order = list(range(len(batches)))
+        random.shuffle(batch_order)
+        for b in batch_order:
+            start, end = int(batch_bounds[b]), int(batch_bounds[b + 1])
+            if end - start < _LOUVAIN_MIN_PARALLEL_BATCH: # Lote pequeño: no compensa repartirlo
+                results = [_louvain_batch_moves(order[start:end], arrays['indptr'], arrays['indices'], arrays['weights'],
+                                                degrees, labels, sigma_tot, m2_undirected)]
+            else:
+                step = -(-(end - start) // workers)
+                futures = [executor.submit(_louvain_batch_task, shared.specs, i, min(i + step, end), m2_undirected)
+                           for i in range(start, end, step)]
+                results = [future.result() for future in futures]
+            for moving_nodes, targets, k_i_original, k_i_target in results:
+                if len(moving_nodes) == 0:
+                    continue
+                moved_degrees = degrees[moving_nodes]
+                moved_self_loops = self_loops[moving_nodes]
+                np.subtract.at(sigma_tot, labels[moving_nodes], moved_degrees)
+                np.add.at(sigma_tot, targets, moved_degrees)
+                np.subtract.at(sigma_in, labels[moving_nodes], 2 * (k_i_original + moved_self_loops))
+                np.add.at(sigma_in, targets, 2 * (k_i_target + moved_self_loops))
+                labels[moving_nodes] = targets
+                num_moves += len(moving_nodes)
+
+        previous_modularity, modularity = modularity, _modularity_from_sums(sigma_in, sigma_tot, m2_undirected)
+        made_change_in_level = made_change_in_level or num_moves > 0
+        if _louvain_pass_report(current_pass, level, num_moves, modularity, modularity - previous_modularity, min_modularity_increase):
+            break
+
+    return labels.copy(), made_change_in_level, modularity
+
+def _louvain_local_moving_parallel(executor, workers, indptr, indices, weights, self_loops, max_passes, level, min_modularity_increase):
+    """
+    Variante paralela de _louvain_local_moving (mismos argumentos y retorno): el grafo del
+    nivel y el estado de la partición se exportan a memoria compartida para los workers.
+    """
+    num_nodes = len(indptr) - 1
+    degrees = np.bincount(edge_sources(indptr), weights=weights, minlength=num_nodes) + 2 * self_loops
+    m2_undirected = float(degrees.sum())
+    if m2_undirected == 0:
+        return np.arange(num_nodes, dtype=np.int32), False, 0.0
+    level_arrays = {'indptr': indptr, 'indices': indices, 'weights': weights, 'degrees': degrees, 'self_loops': self_loops,
+                    'labels': np.arange(num_nodes, dtype=np.int32), 'sigma_tot': degrees,
+                    'order': np.zeros(num_nodes, dtype=np.int64)}
+    from parallel_utils import SharedArrays
+    with SharedArrays(level_arrays) as shared:
+        return _louvain_parallel_passes(executor, shared, workers, max_passes, level, m2_undirected, min_modularity_increase)
+
+def _aggregate_communities(labels, num_communities, indptr, indices, weights, self_loops):
+    """
+    Fase 2 de Louvain (agregación): colapsa cada comunidad en un super-nodo. Las aristas entre
+    comunidades se suman como pesos y las internas pasan a ser el auto-bucle del super-nodo.
+    Todo vectorizado sobre los arrays de aristas. Retorna el CSR del grafo agregado.
+    """
+    source_comms = labels[edge_sources(indptr)]
+    target_comms = labels[indices]
+    internal = source_comms == target_comms
+    # Cada arista interna aparece dos veces en el CSR simétrico: se divide entre 2.
+    new_self_loops = (np.bincount(source_comms[internal], weights=weights[internal], minlength=num_communities) / 2
+                      + np.bincount(labels, weights=self_loops, minlength=num_communities))
+    pair_keys, pair_inverse = np.unique(source_comms[~internal] * num_communities + target_comms[~internal], return_inverse=True)
+    new_weights = np.bincount(pair_inverse, weights=weights[~internal], minlength=len(pair_keys))
+    new_indptr = np.zeros(num_communities + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_keys // num_communities, minlength=num_communities), out=new_indptr[1:])
+    return new_indptr, pair_keys % num_communities, new_weights, new_self_loops
+
+def louvain_optimized(graph, max_passes=5, min_modularity_increase=1e-7, max_levels=None, return_hierarchy=False, workers=1):
+    """
+    Algoritmo de Louvain completo (multinivel) usando cálculo de Delta Q.
+    Trata el grafo como NO DIRIGIDO para la modularidad.
+    Cada nivel ejecuta la Fase 1 (movimiento local, hasta max_passes pasadas) y la Fase 2
+    (agregación de comunidades en super-nodos con aristas ponderadas y auto-bucles); se repite
+    sobre el grafo agregado hasta que un nivel no mueve ningún nodo, la modularidad mejora
+    menos que min_modularity_increase o se alcanza max_levels (max_levels=1 equivale a solo
+    la Fase 1). La modularidad se mantiene incrementalmente y se informa en cada pasada.
+    Retorna {nodo: comunidad}; con return_hierarchy=True retorna (comunidades, niveles), donde
+    niveles[k] es el dict {nodo: comunidad} tras el nivel k + 1.
+    Con workers > 1 el movimiento local se hace por lotes de nodos sin aristas entre sí
+    (coloreo del grafo de cada nivel), evaluados en paralelo en un ProcessPoolExecutor; la
+    modularidad alcanzada es comparable a la secuencial, no idéntica.
+    Ref: Blondel et al. (2008) "Fast unfolding of communities in large networks"
+    """
+    nodes = graph.get_nodes()
+    if not nodes: return ({}, []) if return_hierarchy else {}
 
-                # Actualizar Sigma_tot para las comunidades afectadas
-                community_total_degree[original_community_id] -= ki # Quitar de la vieja
-                community_total_degree[best_target_community_id] += ki  # Añadir a la nueva
+    node_ids = np.asarray(nodes, dtype=np.int64)
+    indptr, indices, weights, self_loops = _louvain_level_graph(graph, node_ids)
+    m2_undirected = float(weights.sum() + 2 * self_loops.sum())
+    node_to_community = np.arange(len(node_ids)) # Posición original -> comunidad del último nivel
+    hierarchy = []
+    modularity = None
+    executor = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor # Import diferido: solo en modo paralelo
+        executor = ProcessPoolExecutor(max_workers=workers)
 
-        # current_pass is handled by the tqdm loop for passes
-        if not made_change_in_pass:
-            tqdm.write(f"  No change in modularity during pass {current_pass + 1}, stopping Louvain Phase 1.")
-            break # Stop if no improvement in a pass
+    try:
+        level = 0
+        while max_levels is None or level < max_levels:
+            level += 1
+            if executor is not None:
+                level_communities, made_change, level_modularity = _louvain_local_moving_parallel(executor, workers, indptr, indices, weights, self_loops, max_passes, level, min_modularity_increase)
+            else:
+                level_communities, made_change, level_modularity = _louvain_local_moving(indptr, indices, weights, self_loops, max_passes, level, min_modularity_increase)
+            if not made_change and hierarchy:
+                break # El nivel anterior ya es la partición final
+            # Reetiquetar comunidades a 0..C-1 y componer con los niveles anteriores
+            community_ids, labels = np.unique(level_communities, return_inverse=True)
+            node_to_community = labels[node_to_community]
+            hierarchy.append(node_to_community)
+            indptr, indices, weights, self_loops = _aggregate_communities(labels, len(community_ids), indptr, indices, weights, self_loops)
+            if m2_undirected > 0:
+                tqdm.write(f"  Louvain level {level}: {len(community_ids)} communities, modularity {level_modularity:.4f}")
+            level_gain = None if modularity is None else level_modularity - modularity
+            modularity = level_modularity
+            if not made_change or len(community_ids) == 1 or (level_gain is not None and level_gain < min_modularity_increase):
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-    # Fase 2 (agregación de red) no implementada en esta versión.
+    node_list = node_ids.tolist()
+    levels = [dict(zip(node_list, level_labels.tolist())) for level_labels in hierarchy]
+    communities = levels[-1]
+    if return_hierarchy:
+        return communities, levels
     return communities
 
 
-# --- 3. Árbol de Expansión Mínima (Prim) ---
-# (Prim MST se mantiene como estaba, ya que su complejidad es aceptable para este ejercicio
-#  y el foco principal de optimización de escalabilidad era Louvain)
+# --- 3. Árbol (Bosque) de Expansión Mínima ---
+def spanning_forest(graph, giant_component=False):
+    """
+    Bosque generador del grafo tratado como NO DIRIGIDO (todas las aristas pesan 1, así que
+    cualquier bosque generador es mínimo). Usa el Borůvka vectorizado de _boruvka_forest
+    directamente sobre las aristas CSR (sin pesos: gana la primera arista de cada componente),
+    sin bucles de Python por arista. Cubre todas las componentes conexas; con
+    giant_component=True solo se devuelve el árbol de la componente débilmente conexa más grande.
+    Retorna (sources, targets): dos arrays int32 con las aristas del bosque (source < target).
+    """
+    indptr, indices = csr_arrays(graph)
+    sources = _edge_source_array(indptr)
+    forest_edges, roots = _boruvka_forest(len(indptr) - 1, sources, indices, None, desc="Spanning Forest")
+    tree_sources, tree_targets = sources[forest_edges].astype(np.int32), indices[forest_edges].astype(np.int32)
+    if giant_component and len(tree_sources) > 0:
+        tree_roots = roots[tree_sources]
+        in_giant = tree_roots == np.bincount(tree_roots).argmax() # La raíz con más aristas de árbol
+        tree_sources, tree_targets = tree_sources[in_giant], tree_targets[in_giant]
+    return np.minimum(tree_sources, tree_targets), np.maximum(tree_sources, tree_targets)
+
+def geographic_edge_weights(graph, sources, targets):
+    """
+    Peso de cada arista (sources[i], targets[i]): distancia haversine en km entre las
+    ubicaciones de sus extremos, calculada de forma vectorizada. NaN si falta alguna ubicación.
+    """
+    num_rows = int(max(sources.max(initial=0), targets.max(initial=0))) + 1
+    latitudes, longitudes = location_arrays(graph.locations, num_rows)
+    return haversine_km(latitudes[sources], longitudes[sources], latitudes[targets], longitudes[targets])
+
+def _boruvka_forest(num_rows, sources, targets, weights, desc="Borůvka MST"):
+    """
+    Borůvka vectorizado: en cada ronda cada componente elige su arista más ligera hacia otra
+    componente (empates resueltos por posición de la arista, así no se forman ciclos), se
+    unen las componentes con saltos de punteros y se descartan las aristas internas.
+    Cada ronda al menos reduce a la mitad las componentes: O(E log V) operaciones de NumPy.
+    Con weights=None todas las aristas pesan igual y se ordenan solo por posición.
+    Retorna (forest_edges, component): las posiciones (en sources/targets) de las aristas del
+    bosque mínimo y la raíz de la componente de cada fila.
+    """
+    num_edges = len(sources)
+    if weights is None:
+        edge_rank = rank_to_edge = np.arange(num_edges, dtype=np.int64)
+    else:
+        # Rango único por arista según (peso, posición): el mínimo por componente es único.
+        edge_rank = np.empty(num_edges, dtype=np.int64)
+        edge_rank[np.lexsort((np.arange(num_edges), weights))] = np.arange(num_edges)
+        rank_to_edge = np.argsort(edge_rank)
+    component = np.arange(max(num_rows, 1), dtype=np.int64)
+    candidates = np.arange(num_edges, dtype=np.int64)
+    selected = []
+    no_edge = np.iinfo(np.int64).max
+
+    with tqdm(desc=desc, unit="round") as progress_bar:
+        while True:
+            comp_u, comp_v = component[sources[candidates]], component[targets[candidates]]
+            crossing = comp_u != comp_v
+            candidates, comp_u, comp_v = candidates[crossing], comp_u[crossing], comp_v[crossing]
+            if len(candidates) == 0:
+                break
+            # Arista más ligera que sale de cada componente
+            lightest = np.full(num_rows, no_edge, dtype=np.int64)
+            np.minimum.at(lightest, comp_u, edge_rank[candidates])
+            np.minimum.at(lightest, comp_v, edge_rank[candidates])
+            roots = np.flatnonzero(lightest != no_edge)
+            chosen = rank_to_edge[lightest[roots]]
+            selected.append(np.unique(chosen))
+
+            # Cada componente apunta a la del otro extremo de su arista; los pares mutuos
+            # (misma arista elegida por ambos lados) se rompen dejando como raíz al menor.
+            chosen_u, chosen_v = component[sources[chosen]], component[targets[chosen]]
+            parent = np.arange(num_rows, dtype=np.int64)
+            parent[roots] = np.where(chosen_u == roots, chosen_v, chosen_u)
+            mutual_roots = roots[(parent[parent[roots]] == roots) & (roots < parent[roots])]
+            parent[mutual_roots] = mutual_roots
+            while True: # Saltos de punteros hasta llegar a las raíces
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+            component = parent[component]
+            progress_bar.update(1)
+            progress_bar.set_postfix(edges=sum(len(edges) for edges in selected), candidates=len(candidates))
+
+    forest_edges = np.concatenate(selected) if selected else np.zeros(0, dtype=np.int64)
+    return forest_edges, component
+
+def minimum_spanning_forest(graph, weight='haversine'):
+    """
+    Bosque de expansión mínima del grafo tratado como NO DIRIGIDO, con Borůvka vectorizado
+    sobre los arrays de aristas (sin heap de tuplas). Con weight='haversine' cada arista pesa
+    la distancia geográfica en km entre sus extremos (las aristas con algún extremo sin
+    ubicación se descartan); con weight=None todas pesan 1.
+    Retorna (sources, targets, weights): int32, int32 (source < target) y float64.
+    """
+    sym_indptr, sym_indices = undirected_csr(graph)
+    sources = edge_sources(sym_indptr)
+    upper = sources < sym_indices # Cada arista no dirigida una sola vez
+    sources, targets = sources[upper], sym_indices[upper].astype(np.int64)
+    if weight == 'haversine':
+        weights = geographic_edge_weights(graph, sources, targets)
+        located = ~np.isnan(weights)
+        if not located.all():
+            tqdm.write(f"  {np.count_nonzero(~located)} edges skipped (endpoint without location).")
+        sources, targets, weights = sources[located], targets[located], weights[located]
+    elif weight is None:
+        weights = np.ones(len(sources))
+    else:
+        raise ValueError(f"Unknown MST weight: {weight!r}")
+    forest_edges = _boruvka_forest(len(sym_indptr) - 1, sources, targets, weights)[0]
+    return sources[forest_edges].astype(np.int32), targets[forest_edges].astype(np.int32), weights[forest_edges]
+
 def prim_mst(graph):
-    nodes = graph.get_nodes()
-    if not nodes: return []
-    undirected_adj = collections.defaultdict(set)
-    for u_node in graph.adj:
-        for v_node in graph.adj[u_node]:
-            undirected_adj[u_node].add(v_node)
-            undirected_adj[v_node].add(u_node)
-
-    mst_edges = []
-    nodes_in_mst = set()
-    start_node_for_mst = None
-    for node_candidate in nodes:
-        if node_candidate in undirected_adj and undirected_adj[node_candidate]:
-            start_node_for_mst = node_candidate
+    """
+    Compatibilidad: aristas del bosque generador (ver spanning_forest) como lista ordenada de
+    tuplas (u, v) con u < v. Con pesos 1 el árbol de Prim es cualquier árbol generador; el
+    bosque cubre además todas las componentes, no solo la del nodo inicial.
+    """
+    tree_sources, tree_targets = spanning_forest(graph)
+    return sorted(zip(tree_sources.tolist(), tree_targets.tolist()))
+
+
+# --- 4. Influencia (PageRank / HITS) ---
+
+def _initial_scores(initial_scores, num_rows):
+    """Vector inicial normalizado (suma 1 sobre los IDs 1..n): uniforme o warm start."""
+    scores = np.zeros(num_rows)
+    if initial_scores is not None:
+        initial_scores = np.asarray(getattr(initial_scores, 'values_array', initial_scores), dtype=np.float64)
+        length = min(len(initial_scores), num_rows)
+        scores[1:length] = np.clip(initial_scores[1:length], 0.0, None)
+    if not scores.sum() > 0:
+        scores[1:] = 1.0
+    return scores / scores.sum()
+
+def pagerank(graph, damping=0.85, tol=1e-6, max_iter=100, initial_scores=None):
+    """
+    PageRank por iteración de potencia sobre los arrays CSR: cada iteración reparte x[u]/out(u)
+    por las aristas con un único np.bincount ponderado (producto matriz-vector disperso).
+    La masa de los nodos colgantes (sin aristas salientes) se reparte uniformemente.
+    initial_scores (array o NodeArrayView indexado por user_id, p. ej. un resultado previo)
+    permite un warm start. Converge cuando la norma L1 del cambio entre iteraciones es < tol
+    (criterio absoluto: no se relaja con el número de nodos).
+    Retorna un array float64 indexado por user_id (posición 0 = 0) que suma 1.
+    """
+    indptr, indices = csr_arrays(graph)
+    num_rows = max(len(indptr) - 1, graph.get_number_of_nodes() + 1)
+    num_nodes = num_rows - 1
+    if num_nodes <= 0:
+        return np.zeros(max(num_rows, 1))
+    sources = _edge_source_array(indptr)
+    out_degrees = np.zeros(num_rows)
+    out_degrees[:len(indptr) - 1] = np.diff(indptr)
+    dangling = out_degrees[1:] == 0
+    inverse_out_degrees = np.divide(1.0, out_degrees, out=np.zeros(num_rows), where=out_degrees > 0)
+
+    scores = _initial_scores(initial_scores, num_rows)
+    for iteration in tqdm(range(max_iter), desc="PageRank", unit="iter"):
+        contributions = scores * inverse_out_degrees
+        new_scores = damping * np.bincount(indices, weights=contributions[sources], minlength=num_rows)
+        dangling_mass = scores[1:][dangling].sum()
+        new_scores[1:] += (damping * dangling_mass + 1.0 - damping) / num_nodes
+        new_scores[0] = 0.0
+        change = np.abs(new_scores - scores).sum()
+        scores = new_scores
+        if change < tol:
+            tqdm.write(f"  PageRank converged after {iteration + 1} iterations (L1 change {change:.2e}).")
             break
-    if start_node_for_mst is None and nodes:
-        start_node_for_mst = nodes[0]
-    if not start_node_for_mst: return []
+    else:
+        tqdm.write(f"  PageRank did not converge in {max_iter} iterations (L1 change {change:.2e}).")
+    return scores
+
+def hits(graph, tol=1e-8, max_iter=100, initial_hubs=None):
+    """
+    HITS (Kleinberg): autoridad a[v] = suma de h[u] sobre u -> v y hub h[u] = suma de a[v]
+    sobre u -> v, ambos con np.bincount sobre las aristas y normalizados a suma 1.
+    initial_hubs permite un warm start; converge cuando la norma L1 del cambio es < tol.
+    Retorna (hubs, authorities) indexados por user_id.
+    """
+    indptr, indices = csr_arrays(graph)
+    num_rows = max(len(indptr) - 1, graph.get_number_of_nodes() + 1)
+    if num_rows <= 1 or len(indices) == 0:
+        return np.zeros(num_rows), np.zeros(num_rows)
+    sources = _edge_source_array(indptr)
+    hubs = _initial_scores(initial_hubs, num_rows)
+    authorities = np.zeros(num_rows)
+    for iteration in tqdm(range(max_iter), desc="HITS", unit="iter"):
+        authorities = np.bincount(indices, weights=hubs[sources], minlength=num_rows)
+        authorities /= authorities.sum()
+        new_hubs = np.bincount(sources, weights=authorities[indices], minlength=num_rows)
+        new_hubs /= new_hubs.sum()
+        change = np.abs(new_hubs - hubs).sum()
+        hubs = new_hubs
+        if change < tol:
+            tqdm.write(f"  HITS converged after {iteration + 1} iterations (L1 change {change:.2e}).")
+            break
+    else:
+        tqdm.write(f"  HITS did not converge in {max_iter} iterations (L1 change {change:.2e}).")
+    return hubs, authorities
+
+
+# --- 5. Componentes Conexas (débiles y fuertes) ---
+
+def _component_rows(graph, indptr):
+    """(num_rows, valid): filas a etiquetar y máscara de las que son nodos del grafo."""
+    nodes = graph.get_nodes()
+    num_rows = max(len(indptr) - 1, (nodes[-1] + 1) if len(nodes) else 0)
+    valid = np.zeros(num_rows, dtype=bool)
+    valid[np.asarray(nodes, dtype=np.int64)] = True
+    return num_rows, valid
+
+def _labels_by_size(raw_labels, valid):
+    """
+    Reetiqueta componentes a 0..C-1 por tamaño descendente (la 0 es la gigante).
+    Retorna (labels int32 por user_id, -1 fuera del grafo; sizes int64 por componente).
+    """
+    component_ids, inverse = np.unique(raw_labels[valid], return_inverse=True)
+    sizes = np.bincount(inverse, minlength=len(component_ids))
+    by_size = np.argsort(-sizes, kind='stable')
+    rank = np.empty(len(component_ids), dtype=np.int32)
+    rank[by_size] = np.arange(len(component_ids), dtype=np.int32)
+    labels = np.full(len(raw_labels), -1, dtype=np.int32)
+    labels[valid] = rank[inverse]
+    return labels, sizes[by_size]
+
+def weakly_connected_components(graph):
+    """
+    Componentes débilmente conexas (aristas como no dirigidas): las componentes que deja el
+    Borůvka vectorizado de _boruvka_forest sobre los arrays de aristas (sin pesos).
+    Retorna (labels, sizes): labels es un array int32 indexado por user_id con la componente
+    de cada nodo (-1 fuera del grafo) y sizes[c] el tamaño de la componente c, ordenadas por
+    tamaño descendente (la componente 0 es la gigante).
+    El resultado se cachea en el grafo mientras graph.adj no cambie.
+    """
+    cached = getattr(graph, '_wcc_cache', None)
+    if cached is not None and cached[0] is graph.adj:
+        return cached[1]
+    indptr, indices = csr_arrays(graph)
+    num_rows, valid = _component_rows(graph, indptr)
+    roots = _boruvka_forest(num_rows, _edge_source_array(indptr), indices, None, desc="Weakly Connected Components")[1]
+    result = _labels_by_size(roots[:num_rows], valid)
+    graph._wcc_cache = (graph.adj, result)
+    return result
 
-    nodes_in_mst.add(start_node_for_mst)
-    edge_candidates_heap = []
-    for neighbor in undirected_adj.get(start_node_for_mst, []):
-        heapq.heappush(edge_candidates_heap, (1, start_node_for_mst, neighbor)) # Peso 1
+def strongly_connected_components(graph):
+    """
+    Componentes fuertemente conexas con Tarjan iterativo (pila explícita de llamadas, sin
+    recursión: funciona con millones de nodos). Índices, lowlinks y pilas son arrays
+    preasignados; cada arista se recorre una vez. Mismo formato de retorno que
+    weakly_connected_components.
+    """
+    indptr, indices = csr_arrays(graph)
+    num_rows, valid = _component_rows(graph, indptr)
+    num_csr_rows = len(indptr) - 1
+    order = np.full(num_rows, -1, dtype=np.int32) # Índice de descubrimiento (-1 = no visitado)
+    lowlink = np.zeros(num_rows, dtype=np.int32)
+    on_stack = np.zeros(num_rows, dtype=np.uint8)
+    raw_labels = np.full(num_rows, -1, dtype=np.int32)
+    node_stack = np.empty(num_rows, dtype=np.int32) # Pila de Tarjan
+    call_nodes = np.empty(num_rows, dtype=np.int32) # Pila de "llamadas": nodo y próxima arista
+    call_edges = np.empty(num_rows, dtype=np.int64)
+    indptr_mv, indices_mv = memoryview(indptr), memoryview(np.ascontiguousarray(indices, dtype=np.int32))
+    order_mv, lowlink_mv, on_stack_mv, labels_mv = memoryview(order), memoryview(lowlink), memoryview(on_stack), memoryview(raw_labels)
+    node_stack_mv, call_nodes_mv, call_edges_mv = memoryview(node_stack), memoryview(call_nodes), memoryview(call_edges)
+    counter, num_components, stack_size = 0, 0, 0
 
-    processed_edges_in_mst = set() # Para evitar añadir la misma arista dos veces (e.g. (u,v) y (v,u))
+    for root in tqdm(np.flatnonzero(valid).tolist(), desc="Strongly Connected Components", unit="node", mininterval=0.5):
+        if order_mv[root] != -1:
+            continue
+        order_mv[root] = lowlink_mv[root] = counter
+        counter += 1
+        node_stack_mv[stack_size] = root
+        stack_size += 1
+        on_stack_mv[root] = 1
+        call_nodes_mv[0] = root
+        call_edges_mv[0] = indptr_mv[root] if root < num_csr_rows else 0
+        depth = 1
+        while depth > 0:
+            v = call_nodes_mv[depth - 1]
+            edge_idx = call_edges_mv[depth - 1]
+            end = indptr_mv[v + 1] if v < num_csr_rows else 0
+            descended = False
+            while edge_idx < end:
+                w = indices_mv[edge_idx]
+                edge_idx += 1
+                if order_mv[w] == -1: # Descender a w
+                    call_edges_mv[depth - 1] = edge_idx
+                    order_mv[w] = lowlink_mv[w] = counter
+                    counter += 1
+                    node_stack_mv[stack_size] = w
+                    stack_size += 1
+                    on_stack_mv[w] = 1
+                    call_nodes_mv[depth] = w
+                    call_edges_mv[depth] = indptr_mv[w] if w < num_csr_rows else 0
+                    depth += 1
+                    descended = True
+                    break
+                if on_stack_mv[w] and order_mv[w] < lowlink_mv[v]:
+                    lowlink_mv[v] = order_mv[w]
+            if descended:
+                continue
+            # v terminado: propagar lowlink al padre y cerrar la componente si v es su raíz
+            depth -= 1
+            if depth > 0:
+                parent = call_nodes_mv[depth - 1]
+                if lowlink_mv[v] < lowlink_mv[parent]:
+                    lowlink_mv[parent] = lowlink_mv[v]
+            if lowlink_mv[v] == order_mv[v]:
+                while True:
+                    stack_size -= 1
+                    w = node_stack_mv[stack_size]
+                    on_stack_mv[w] = 0
+                    labels_mv[w] = num_components
+                    if w == v:
+                        break
+                num_components += 1
 
-    # Progress bar for Prim's algorithm, progressing as nodes are added to MST
-    # Total is the number of nodes in the graph. Initial is 1 as start_node_for_mst is already added.
-    # Ensure graph.get_number_of_nodes() is efficient or pre-fetched if called repeatedly.
-    # Here, it's fine as it's mainly for the total.
-    num_total_nodes = graph.get_number_of_nodes()
-    # Initialize tqdm after nodes_in_mst has its first node.
-    # The loop condition `len(nodes_in_mst) < num_total_nodes` is key.
-    # We can update the progress bar each time a node is added.
+    return _labels_by_size(raw_labels, valid)
 
-    prim_progress_bar = tqdm(total=num_total_nodes, desc="Prim MST", unit="node", initial=len(nodes_in_mst))
+def giant_component_nodes(labels):
+    """IDs de los nodos de la componente gigante (etiqueta 0 en labels ordenados por tamaño)."""
+    return np.flatnonzero(labels == 0)
 
-    while edge_candidates_heap and len(nodes_in_mst) < num_total_nodes:
-        weight, u, v = heapq.heappop(edge_candidates_heap)
-        if v not in nodes_in_mst:
-            nodes_in_mst.add(v)
-            prim_progress_bar.update(1) # Increment progress by 1 node
 
-            # Guardar arista en formato canónico (u < v) y asegurar unicidad
-            canonical_edge = tuple(sorted((u, v)))
-            if canonical_edge not in processed_edges_in_mst:
-                 mst_edges.append(canonical_edge)
-                 processed_edges_in_mst.add(canonical_edge)
+# --- 6. Distribución de Distancias Aproximada (HyperANF) ---
 
-            for neighbor_of_v in undirected_adj.get(v, []):
-                if neighbor_of_v not in nodes_in_mst:
-                    heapq.heappush(edge_candidates_heap, (1, v, neighbor_of_v))
+def _splitmix64(values):
+    """Hash splitmix64 vectorizado sobre un array uint64 (aritmética módulo 2^64)."""
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
 
-    prim_progress_bar.close() # Close the progress bar when done
-    return sorted(list(processed_edges_in_mst))
+def _hll_alpha(num_registers):
+    """Constante de corrección de sesgo de HyperLogLog (Flajolet et al., 2007)."""
+    return {16: 0.673, 32: 0.697, 64: 0.709}.get(num_registers, 0.7213 / (1 + 1.079 / num_registers))
+
+def _hll_estimates(registers, alpha):
+    """Cardinalidad estimada por fila de registros HLL (con corrección para rangos pequeños)."""
+    num_registers = registers.shape[1]
+    inverse_powers = np.ldexp(1.0, -np.arange(65)) # 2^-M para cada valor posible de registro
+    raw = alpha * num_registers * num_registers / inverse_powers[registers].sum(axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    small = (raw <= 2.5 * num_registers) & (zeros > 0)
+    raw[small] = num_registers * np.log(num_registers / zeros[small])
+    return raw
+
+def hyper_anf(graph, num_registers=32, max_iter=100, seed=0, chunk_edges=1 << 22):
+    """
+    HyperANF (Boldi, Rosa y Vigna, 2011): aproxima la función de vecindad N(t) = número de
+    pares (u, v) con v a distancia (dirigida) <= t de u, sin BFS desde cada nodo. Cada nodo
+    guarda un contador HyperLogLog de su bola de radio t en num_registers registros uint8
+    (memoria: num_nodes * num_registers bytes; error relativo ~1.04/sqrt(num_registers)
+    por nodo, mucho menor en la suma). En cada iteración la bola de u es la unión (máximo por
+    registro) de las bolas de sus vecinos: una pasada vectorizada sobre las aristas de los nodos
+    con algún vecino modificado en la iteración anterior, por bloques de como mucho chunk_edges
+    aristas. Termina cuando ningún contador cambia.
+    Retorna un dict con 'neighbourhood_function' (array N(0..T)), 'distance_distribution'
+    (pares a distancia exacta t, t >= 1), 'average_distance' y 'effective_diameter' (percentil
+    90, interpolado) sobre los pares alcanzables, 'reachable_pairs' e 'iterations'.
+    """
+    if num_registers < 16 or num_registers & (num_registers - 1):
+        raise ValueError("num_registers debe ser una potencia de 2 >= 16")
+    indptr, indices = csr_arrays(graph)
+    num_rows, valid = _component_rows(graph, indptr)
+    register_bits = num_registers.bit_length() - 1
+    alpha = _hll_alpha(num_registers)
+
+    # Cada nodo se inserta en su propio contador: registro = bits bajos del hash,
+    # valor = posición del primer bit a 1 en el resto del hash.
+    nodes = np.flatnonzero(valid).astype(np.uint64)
+    hashes = _splitmix64(nodes ^ _splitmix64(np.array([seed], dtype=np.uint64)))
+    remaining = hashes >> np.uint64(register_bits)
+    lowest_bit = remaining & (~remaining + np.uint64(1))
+    rho = np.where(remaining == 0, 64 - register_bits + 1, np.log2(np.maximum(lowest_bit, 1).astype(np.float64)).astype(np.int64) + 1)
+    registers = np.zeros((num_rows, num_registers), dtype=np.uint8)
+    registers[nodes.astype(np.int64), (hashes & np.uint64(num_registers - 1)).astype(np.int64)] = rho
+
+    estimates = np.zeros(num_rows)
+    estimates[valid] = _hll_estimates(registers[valid], alpha)
+    neighbourhood_function = [float(estimates.sum())]
+    modified = valid.copy() # Contadores que cambiaron en la iteración anterior
+    row_lengths = np.diff(indptr)
+
+    with tqdm(desc="HyperANF", unit="iter") as progress_bar:
+        for iteration in range(max_iter):
+            # Solo las filas con algún vecino modificado pueden cambiar en esta iteración.
+            modified_edges = np.concatenate(([0], np.cumsum(modified[indices], dtype=np.int64)))
+            active_rows = np.flatnonzero(modified_edges[indptr[1:]] > modified_edges[indptr[:-1]])
+            if len(active_rows) == 0:
+                break
+            # Bloques de filas activas con como mucho ~chunk_edges aristas cada uno
+            active_edges = np.cumsum(row_lengths[active_rows])
+            bounds = np.concatenate(([0], np.searchsorted(active_edges, np.arange(chunk_edges, active_edges[-1], chunk_edges)), [len(active_rows)]))
+            updated_rows, updated_registers = [], []
+            for block_start, block_end in zip(bounds[:-1], bounds[1:]):
+                rows = active_rows[block_start:block_end]
+                if len(rows) == 0:
+                    continue
+                segment_starts = np.concatenate(([0], np.cumsum(row_lengths[rows])[:-1]))
+                neighbor_registers = registers[gather_neighbors(indptr, indices, rows)]
+                # La bola de radio t es la unión de la de radio t - 1 y las de los vecinos
+                merged = np.maximum(registers[rows], np.maximum.reduceat(neighbor_registers, segment_starts, axis=0))
+                row_changed = (merged != registers[rows]).any(axis=1)
+                updated_rows.append(rows[row_changed])
+                updated_registers.append(merged[row_changed])
+            # Actualización síncrona: se aplica después de leer todos los bloques
+            modified = np.zeros(num_rows, dtype=bool)
+            for rows, merged in zip(updated_rows, updated_registers):
+                registers[rows] = merged
+                estimates[rows] = _hll_estimates(merged, alpha)
+                modified[rows] = True
+            progress_bar.update(1)
+            if not modified.any():
+                break
+            neighbourhood_function.append(float(estimates.sum()))
+            progress_bar.set_postfix(pairs=f"{neighbourhood_function[-1]:.3g}", modified=int(np.count_nonzero(modified)))
+
+    neighbourhood_function = np.maximum.accumulate(np.asarray(neighbourhood_function)) # N(t) no decrece
+    distance_distribution = np.diff(neighbourhood_function)
+    reachable_pairs = neighbourhood_function[-1] - neighbourhood_function[0]
+    average_distance, effective_diameter = 0.0, 0.0
+    if reachable_pairs > 0:
+        distances = np.arange(1, len(neighbourhood_function))
+        average_distance = float((distances * distance_distribution).sum() / reachable_pairs)
+        # Menor t (interpolado) tal que el 90% de los pares alcanzables está a distancia <= t
+        cumulative = (neighbourhood_function - neighbourhood_function[0]) / reachable_pairs
+        t = int(np.searchsorted(cumulative, 0.9))
+        effective_diameter = float(t - 1 + (0.9 - cumulative[t - 1]) / (cumulative[t] - cumulative[t - 1])) if t > 0 else 0.0
+    tqdm.write(f"  HyperANF: {len(neighbourhood_function) - 1} iterations, average distance {average_distance:.3f}, effective diameter {effective_diameter:.2f}")
+    return {
+        'neighbourhood_function': neighbourhood_function,
+        'distance_distribution': distance_distribution,
+        'average_distance': average_distance,
+        'effective_diameter': effective_diameter,
+        'reachable_pairs': float(reachable_pairs),
+        'iterations': len(neighbourhood_function) - 1,
+    }
+
+
+# --- 7. Triángulos y Coeficiente de Clustering ---
+
+def _pairs_within_rows(indptr, rows):
+    """
+    Todas las parejas (i, j), i < j, de posiciones de aristas dentro de cada fila dada de un CSR.
+    Retorna (first, second): posiciones en el array de índices, vectorizado y sin bucles.
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    positions = gather_neighbors(indptr, np.arange(indptr[-1], dtype=np.int64), rows)
+    remaining = np.repeat(lengths, lengths) - (positions - np.repeat(starts, lengths)) - 1 # Elementos posteriores en la fila
+    first = np.repeat(positions, remaining)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(remaining) - remaining, remaining) + 1
+    return first, first + offsets
+
+def triangle_counts(graph, chunk_pairs=1 << 22):
+    """
+    Conteo exacto de triángulos (grafo tratado como NO DIRIGIDO, sin aristas repetidas) con el
+    algoritmo forward: cada arista se orienta del nodo de menor al de mayor grado (empates por
+    ID), y para cada nodo u y cada par v, w de sus vecinos "hacia adelante" se comprueba si la
+    arista v-w existe con búsqueda binaria en las filas ordenadas (intersección de listas
+    ordenadas, vectorizada). Cada triángulo se encuentra una sola vez; trabajo O(E^1.5) en el
+    peor caso. Procesa bloques de como mucho ~chunk_pairs pares.
+    Retorna (triangles, total): triángulos por user_id (int64) y el total.
+    """
+    sym_indptr, sym_indices = undirected_csr(graph)
+    num_rows = len(sym_indptr) - 1
+    degrees = np.diff(sym_indptr)
+    rank = np.empty(num_rows, dtype=np.int64)
+    rank[np.lexsort((np.arange(num_rows), degrees))] = np.arange(num_rows)
+
+    # CSR orientado (u -> v si rank[u] < rank[v]); las filas siguen ordenadas por ID de vecino
+    sources = edge_sources(sym_indptr)
+    forward = rank[sources] < rank[sym_indices]
+    forward_sources, forward_targets = sources[forward], sym_indices[forward].astype(np.int64)
+    forward_indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(forward_sources, minlength=num_rows), out=forward_indptr[1:])
+    forward_keys = forward_sources * num_rows + forward_targets # Ordenadas: filas y vecinos ordenados
+
+    triangles = np.zeros(num_rows, dtype=np.int64)
+    forward_degrees = np.diff(forward_indptr)
+    pair_counts = forward_degrees * (forward_degrees - 1) // 2
+    rows_with_pairs = np.flatnonzero(pair_counts)
+    cumulative_pairs = np.cumsum(pair_counts[rows_with_pairs])
+    bounds = np.concatenate(([0], np.searchsorted(cumulative_pairs, np.arange(chunk_pairs, cumulative_pairs[-1] if len(cumulative_pairs) else 0, chunk_pairs)), [len(rows_with_pairs)]))
+    for block_start, block_end in tqdm(list(zip(bounds[:-1], bounds[1:])), desc="Triangle Counting", unit="block"):
+        rows = rows_with_pairs[block_start:block_end]
+        if len(rows) == 0:
+            continue
+        first, second = _pairs_within_rows(forward_indptr, rows)
+        v, w = forward_targets[first], forward_targets[second]
+        low = np.where(rank[v] < rank[w], v, w)
+        high = v + w - low
+        keys = low * num_rows + high
+        found = np.searchsorted(forward_keys, keys)
+        closed = found < len(forward_keys)
+        closed[closed] = forward_keys[found[closed]] == keys[closed]
+        centers = forward_sources[first[closed]]
+        triangles += np.bincount(centers, minlength=num_rows)
+        triangles += np.bincount(v[closed], minlength=num_rows)
+        triangles += np.bincount(w[closed], minlength=num_rows)
+    return triangles, int(triangles.sum() // 3)
+
+def clustering_coefficients(graph, sample_size=None, seed=None):
+    """
+    Coeficientes de clustering (grafo NO DIRIGIDO). Exacto (sample_size=None) a partir de
+    triangle_counts: 'local' es un array por user_id con 2 t(v) / (d(v) (d(v) - 1)) (0 si
+    d(v) < 2), 'average' su media sobre los nodos y 'global' la transitividad
+    3 * triángulos / caminos de longitud 2 (wedges).
+    Con sample_size=k se estima en O(k log E) muestreando wedges (Seshadhri, Pinar y Kolda,
+    2013): 'global' con k wedges elegidos uniformemente, 'average' con k nodos uniformes y un
+    wedge aleatorio de cada uno; 'local' es None y 'triangles' es una estimación.
+    Retorna un dict con 'local', 'average', 'global' y 'triangles'.
+    """
+    sym_indptr, sym_indices = undirected_csr(graph)
+    num_rows = len(sym_indptr) - 1
+    degrees = np.diff(sym_indptr)
+    wedges_per_node = degrees * (degrees - 1) // 2
+    total_wedges = int(wedges_per_node.sum())
+    nodes = np.asarray(graph.get_nodes(), dtype=np.int64)
+    nodes = nodes[nodes < num_rows]
+    num_nodes = graph.get_number_of_nodes()
+    if num_nodes == 0 or total_wedges == 0:
+        return {'local': np.zeros(num_rows) if sample_size is None else None, 'average': 0.0, 'global': 0.0, 'triangles': 0}
+
+    if sample_size is None:
+        triangles, total_triangles = triangle_counts(graph)
+        local = np.divide(triangles, wedges_per_node, out=np.zeros(num_rows), where=wedges_per_node > 0)
+        return {'local': local, 'average': float(local[nodes].sum() / num_nodes),
+                'global': 3 * total_triangles / total_wedges, 'triangles': total_triangles}
+
+    rng = np.random.default_rng(seed)
+    symmetric_keys = edge_sources(sym_indptr) * num_rows + sym_indices # Ordenadas (filas ordenadas)
+
+    def closed_fraction(centers):
+        """Fracción de wedges cerrados: dos vecinos distintos al azar de cada centro."""
+        center_degrees = degrees[centers]
+        i = (rng.random(len(centers)) * center_degrees).astype(np.int64)
+        j = (rng.random(len(centers)) * (center_degrees - 1)).astype(np.int64)
+        j += j >= i
+        a = sym_indices[sym_indptr[centers] + i].astype(np.int64)
+        b = sym_indices[sym_indptr[centers] + j].astype(np.int64)
+        keys = a * num_rows + b
+        found = np.minimum(np.searchsorted(symmetric_keys, keys), len(symmetric_keys) - 1)
+        return symmetric_keys[found] == keys
+
+    # Transitividad: centros con probabilidad proporcional a su número de wedges
+    wedge_centers = np.searchsorted(np.cumsum(wedges_per_node), rng.integers(0, total_wedges, sample_size), side='right')
+    transitivity = float(closed_fraction(wedge_centers).mean())
+    # Clustering medio: nodos uniformes; los de grado < 2 aportan 0
+    sampled_nodes = nodes[rng.integers(0, len(nodes), sample_size)]
+    eligible = sampled_nodes[degrees[sampled_nodes] >= 2]
+    average = float(closed_fraction(eligible).sum() / sample_size * len(nodes) / num_nodes) if len(eligible) else 0.0
+    return {'local': None, 'average': average, 'global': transitivity,
+            'triangles': int(round(transitivity * total_wedges / 3))}
 
 
 # --- Mock SocialGraph para pruebas internas ---
@@ -277,7 +1151,11 @@ if __name__ == "__main__":
     g_bfs.add_edge(1, 2); g_bfs.add_edge(1, 3); g_bfs.add_edge(2, 4)
     g_bfs.nodes_set.update([1,2,3,4])
     print("BFS from 1:", bfs_shortest_paths(g_bfs, 1))
+    print("BFS distance array from 1:", bfs_distances(g_bfs, 1).tolist()) # [-1, 0, 1, 1, 2]
     print(f"Avg Shortest Path (g_bfs): {average_shortest_path_length(g_bfs):.3f}")
+    print(f"Avg Shortest Path (g_bfs, one BFS per source): {average_shortest_path_length(g_bfs, batch_sources=None):.3f}") # Igual: 1.250
+    anf_result = hyper_anf(g_bfs, num_registers=64)
+    print(f"HyperANF (g_bfs): N(t)={np.round(anf_result['neighbourhood_function'], 2).tolist()}, average distance {anf_result['average_distance']:.3f}") # ~[4, 7, 8], ~1.250
 
     # 2. Test Louvain Optimizado
     print("\n--- Testing Louvain Optimized ---")
@@ -321,6 +1199,36 @@ if __name__ == "__main__":
         for comm_id in sorted(s_grouped_communities.keys()):
             print(f"  Community {comm_id}: {sorted(s_grouped_communities[comm_id])}")
 
+    print("\nLouvain in parallel mode (colored batches, 2 workers):")
+    for test_graph in (g_louvain_test, g_simple_louvain):
+        parallel_communities = louvain_optimized(test_graph, max_passes=10, workers=2)
+        p_grouped_communities = collections.defaultdict(list)
+        for node, comm_id in parallel_communities.items():
+            p_grouped_communities[comm_id].append(node)
+        print("  Communities:", sorted(sorted(members) for members in p_grouped_communities.values())) # Igual que el modo secuencial
+
+
+    # Componentes: 1 <-> 2 -> 3 (débil: {1,2,3}; fuertes: {1,2}, {3}) y 4 -> 5 aparte
+    print("\n--- Testing Connected Components ---")
+    g_components = MockSocialGraph()
+    g_components.add_edge(1, 2); g_components.add_edge(2, 1); g_components.add_edge(2, 3); g_components.add_edge(4, 5)
+    wcc_labels, wcc_sizes = weakly_connected_components(g_components)
+    print(f"WCC labels: {wcc_labels.tolist()}, sizes: {wcc_sizes.tolist()}") # [-1, 0, 0, 0, 1, 1], [3, 2]
+    scc_labels, scc_sizes = strongly_connected_components(g_components)
+    print(f"SCC labels: {scc_labels.tolist()}, sizes: {scc_sizes.tolist()}") # {1,2} en la componente 0; 3, 4 y 5 solos
+    print(f"Giant component nodes: {giant_component_nodes(wcc_labels).tolist()}") # [1, 2, 3]
+
+    # Triángulos: 1-2-3 y 2-3-4 comparten la arista 2-3; 5 cuelga de 4
+    print("\n--- Testing Triangles and Clustering ---")
+    g_triangles = MockSocialGraph()
+    for u, v in ((1, 2), (2, 3), (3, 1), (2, 4), (4, 3), (4, 5)):
+        g_triangles.add_edge(u, v)
+    node_triangles, total_triangles = triangle_counts(g_triangles)
+    print(f"Triangles per node: {node_triangles[1:].tolist()}, total: {total_triangles}") # [1, 2, 2, 1, 0], 2
+    clustering = clustering_coefficients(g_triangles)
+    print(f"Local clustering: {np.round(clustering['local'][1:], 3).tolist()}, global: {clustering['global']:.3f}") # [1.0, 0.667, 0.667, 0.333, 0.0], 0.6
+    estimated = clustering_coefficients(g_triangles, sample_size=20000, seed=0)
+    print(f"Estimated global clustering: {estimated['global']:.3f}, average: {estimated['average']:.3f} (exact {clustering['average']:.3f})")
 
     # 3. Test Prim MST (sin cambios, se asume que funciona)
     print("\n--- Testing Prim MST (Briefly) ---")
@@ -329,3 +1237,7 @@ if __name__ == "__main__":
     g_mst_test.nodes_set.update([1,2,3])
     mst_edges = prim_mst(g_mst_test)
     print(f"MST edges (g_mst_test): {mst_edges}") # Esperado 2 aristas, e.g., [(1,2), (1,3)]
+    # Con pesos geográficos: 2 y 3 están cerca entre sí y lejos de 1
+    g_mst_test.locations = {1: (0.0, 0.0), 2: (10.0, 10.0), 3: (10.0, 10.5)}
+    geo_sources, geo_targets, geo_weights = minimum_spanning_forest(g_mst_test)
+    print(f"Geographic MST edges: {list(zip(geo_sources.tolist(), geo_targets.tolist()))}, total {geo_weights.sum():.1f} km") # [(1, 2), (2, 3)]
@@ -0,0 +1,57 @@
+# parallel_utils.py
+"""
+Utilidades para compartir arrays de NumPy (p. ej. los arrays CSR del grafo) con procesos
+worker a través de multiprocessing.shared_memory, sin serializar (pickle) los datos.
+El proceso principal exporta los arrays una vez; cada worker los adjunta en su initializer.
+"""
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class SharedArrays:
+    """
+    Copia un dict {nombre: array} a bloques de memoria compartida.
+    self.specs es un dict pequeño y serializable que los workers pasan a attach_shared_arrays;
+    self.arrays da al proceso principal vistas escribibles de los mismos bloques.
+    Usar como context manager para liberar (unlink) la memoria al terminar.
+    """
+    def __init__(self, arrays):
+        self._blocks = []
+        self.specs = {}
+        self.arrays = {}
+        for name, values in arrays.items():
+            values = np.ascontiguousarray(values)
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            shared_values = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+            shared_values[...] = values
+            self.arrays[name] = shared_values
+            self._blocks.append(block)
+            self.specs[name] = (block.name, values.dtype.str, values.shape)
+
+    def close(self):
+        self.arrays = {} # Las vistas deben liberarse antes de cerrar los bloques
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_shared_arrays(specs):
+    """
+    Adjunta (sin copiar) los arrays descritos por SharedArrays.specs.
+    Retorna (arrays, blocks); blocks debe mantenerse vivo mientras se usen los arrays.
+    """
+    arrays, blocks = {}, []
+    for name, (block_name, dtype, shape) in specs.items():
+        # Los workers del pool comparten el resource_tracker del proceso principal, que es
+        # quien libera (unlink) los bloques en SharedArrays.close().
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
@@ -0,0 +1,143 @@
+# spatial_index.py
+"""
+Índice espacial sobre las ubicaciones de los usuarios: una rejilla uniforme de celdas
+lat/lon cuyos usuarios se guardan contiguos por celda (cell_ptr + user_ids, como un CSR).
+Se construye una sola vez con NumPy y responde consultas por caja (bounding box), por radio
+(km, distancia haversine) y de k vecinos más cercanos revisando solo las celdas afectadas.
+"""
+import math
+import numpy as np
+from graph_utils import EARTH_RADIUS_KM, haversine_km, gather_neighbors
+
+# Usuarios por celda buscados al dimensionar la rejilla
+DEFAULT_POINTS_PER_CELL = 16
+
+
+class SpatialGridIndex:
+    """
+    Rejilla uniforme sobre la caja que contiene todas las ubicaciones válidas, con
+    ~points_per_cell usuarios por celda. latitudes/longitudes son arrays float indexados por
+    user_id (NaN = sin ubicación), p. ej. los de una vista LocationArrays; no se copian.
+    Las consultas devuelven arrays de user_id (int64) y, por radio / kNN, distancias en km.
+    """
+    def __init__(self, latitudes, longitudes, points_per_cell=DEFAULT_POINTS_PER_CELL):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        user_ids = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+        self.num_points = len(user_ids)
+        self.points_per_cell = points_per_cell
+        lats, lons = latitudes[user_ids], longitudes[user_ids]
+
+        if self.num_points:
+            self.min_lat, self.max_lat = float(lats.min()), float(lats.max())
+            self.min_lon, self.max_lon = float(lons.min()), float(lons.max())
+        else:
+            self.min_lat = self.max_lat = self.min_lon = self.max_lon = 0.0
+        span_lat = max(self.max_lat - self.min_lat, 1e-6)
+        span_lon = max(self.max_lon - self.min_lon, 1e-6)
+        # Celdas aproximadamente cuadradas (en grados)
+        num_cells = max(1, self.num_points // points_per_cell)
+        self.rows = int(np.clip(round(math.sqrt(num_cells * span_lat / span_lon)), 1, num_cells))
+        self.cols = int(np.clip(math.ceil(num_cells / self.rows), 1, num_cells))
+        self.cell_lat = span_lat / self.rows
+        self.cell_lon = span_lon / self.cols
+
+        cells = self._cell_rows(lats) * self.cols + self._cell_cols(lons)
+        order = np.argsort(cells, kind='stable') # Dentro de cada celda, por user_id
+        self.user_ids = user_ids[order]
+        self.cell_ptr = np.zeros(self.rows * self.cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.rows * self.cols), out=self.cell_ptr[1:])
+
+    def _cell_rows(self, lats):
+        return np.clip(np.floor((np.asarray(lats) - self.min_lat) / self.cell_lat), 0, self.rows - 1).astype(np.int64)
+
+    def _cell_cols(self, lons):
+        return np.clip(np.floor((np.asarray(lons) - self.min_lon) / self.cell_lon), 0, self.cols - 1).astype(np.int64)
+
+    def query_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        user_ids (ordenados) con min_lat <= lat <= max_lat y min_lon <= lon <= max_lon.
+        Si min_lon > max_lon la caja cruza el antimeridiano (p. ej. de 170 a -170).
+        """
+        if min_lon > max_lon:
+            return np.union1d(self.query_bbox(min_lat, min_lon, max_lat, 180.0),
+                              self.query_bbox(min_lat, -180.0, max_lat, max_lon))
+        if (self.num_points == 0 or min_lat > self.max_lat or max_lat < self.min_lat
+                or min_lon > self.max_lon or max_lon < self.min_lon):
+            return np.zeros(0, dtype=np.int64)
+        cell_rows = np.arange(self._cell_rows(min_lat), self._cell_rows(max_lat) + 1)
+        cell_cols = np.arange(self._cell_cols(min_lon), self._cell_cols(max_lon) + 1)
+        cells = (cell_rows[:, None] * self.cols + cell_cols[None, :]).ravel()
+        candidates = gather_neighbors(self.cell_ptr, self.user_ids, cells)
+        lats, lons = self.latitudes[candidates], self.longitudes[candidates]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return np.sort(candidates[inside])
+
+    def query_radius(self, lat, lon, radius_km):
+        """
+        Usuarios a como mucho radius_km (haversine) de (lat, lon).
+        Retorna (user_ids, distances_km) ordenados por distancia (empates por user_id).
+        """
+        angular = radius_km / EARTH_RADIUS_KM
+        delta_lat = math.degrees(angular)
+        if lat + delta_lat >= 90.0 or lat - delta_lat <= -90.0 or math.sin(angular) >= math.cos(math.radians(lat)):
+            # El círculo contiene un polo: todas las longitudes
+            min_lon, max_lon = -180.0, 180.0
+        else:
+            delta_lon = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(lat))))
+            min_lon, max_lon = lon - delta_lon, lon + delta_lon
+            if min_lon < -180.0:
+                min_lon += 360.0 # Cruza el antimeridiano (ver query_bbox)
+            if max_lon > 180.0:
+                max_lon -= 360.0
+        candidates = self.query_bbox(lat - delta_lat, min_lon, lat + delta_lat, max_lon)
+        distances = haversine_km(lat, lon, self.latitudes[candidates], self.longitudes[candidates])
+        within = distances <= radius_km
+        candidates, distances = candidates[within], distances[within]
+        order = np.lexsort((candidates, distances))
+        return candidates[order], distances[order]
+
+    def query_knn(self, lat, lon, k):
+        """
+        Los k usuarios más cercanos a (lat, lon). Consulta por radios crecientes (desde el
+        tamaño esperado para k usuarios según la densidad de la rejilla) hasta encontrar k;
+        el resultado es exacto porque cada consulta por radio lo es.
+        Retorna (user_ids, distances_km) ordenados por distancia (empates por user_id).
+        """
+        k = min(k, self.num_points)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        cell_km = math.radians(max(self.cell_lat, self.cell_lon)) * EARTH_RADIUS_KM
+        radius_km = cell_km * math.sqrt(k / self.points_per_cell)
+        while True:
+            user_ids, distances = self.query_radius(lat, lon, radius_km)
+            if len(user_ids) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return user_ids[:k], distances[:k]
+            radius_km *= 2
+
+
+if __name__ == "__main__":
+    print("--- Testing Spatial Grid Index ---")
+    test_latitudes = np.array([np.nan, 0.0, 0.0, 0.1, 10.0, -33.9, 51.5, 0.0, np.nan])
+    test_longitudes = np.array([np.nan, 0.0, 0.1, 0.0, 10.0, 151.2, -0.1, 179.9, 5.0])
+    index = SpatialGridIndex(test_latitudes, test_longitudes, points_per_cell=2)
+    print(f"Grid: {index.rows}x{index.cols} cells, {index.num_points} points") # 7 puntos (0 y 8 sin ubicación)
+    print(f"BBox [-1, 1]x[-1, 1]: {index.query_bbox(-1, -1, 1, 1).tolist()}") # [1, 2, 3]
+    print(f"BBox across antimeridian [170, -170]: {index.query_bbox(-1, 170, 1, -170).tolist()}") # [7]
+    near_ids, near_km = index.query_radius(0.0, 0.0, 20.0)
+    print(f"Within 20 km of (0, 0): {near_ids.tolist()}, {np.round(near_km, 1).tolist()}") # [1, 2, 3], [0.0, 11.1, 11.1]
+    wrap_ids, _ = index.query_radius(0.0, -179.95, 20.0)
+    print(f"Within 20 km of (0, -179.95): {wrap_ids.tolist()}") # [7]
+    knn_ids, knn_km = index.query_knn(50.0, 0.0, 2)
+    print(f"2 nearest to (50, 0): {knn_ids.tolist()}, {np.round(knn_km, 1).tolist()}") # [6, 4]
+
+    # Comparación con una búsqueda exhaustiva
+    rng = np.random.default_rng(0)
+    random_lats = np.concatenate(([np.nan], rng.uniform(-60, 70, 20000)))
+    random_lons = np.concatenate(([np.nan], rng.uniform(-180, 180, 20000)))
+    random_index = SpatialGridIndex(random_lats, random_lons)
+    all_distances = haversine_km(40.0, -3.7, random_lats[1:], random_lons[1:])
+    radius_ids, _ = random_index.query_radius(40.0, -3.7, 500.0)
+    knn_ids, _ = random_index.query_knn(40.0, -3.7, 10)
+    print(f"Radius query matches full scan: {sorted(radius_ids.tolist()) == (np.flatnonzero(all_distances <= 500.0) + 1).tolist()}")
+    print(f"kNN query matches full scan: {knn_ids.tolist() == (np.argsort(all_distances, kind='stable')[:10] + 1).tolist()}")
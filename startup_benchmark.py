@@ -0,0 +1,72 @@
+# startup_benchmark.py
+"""
+Benchmark de arranque: importa main.py en un intérprete nuevo con `python -X importtime` y
+comprueba que el tiempo de import acumulado no supere STARTUP_BUDGET_MS y que ninguna
+dependencia pesada de DEFERRED_MODULES (visualización, procesos, barras de progreso) se
+cargue al importar. Los trabajos por lotes lanzan cientos de análisis cortos, así que el
+arranque se paga en cada uno. Termina con código 1 si se incumple el presupuesto.
+"""
+import os
+import subprocess
+import sys
+
+# Presupuesto para el import acumulado de main (ms, mejor de STARTUP_RUNS ejecuciones)
+STARTUP_BUDGET_MS = 150
+STARTUP_RUNS = 5
+# Módulos que deben importarse de forma diferida (solo cuando se usan)
+DEFERRED_MODULES = ('plotly', 'matplotlib', 'networkx', 'tqdm', 'concurrent.futures',
+                    'multiprocessing', 'data_generator', 'visualizer')
+
+
+def measure_import(module_name, runs=STARTUP_RUNS):
+    """
+    Importa module_name runs veces, cada una en un proceso nuevo con -X importtime.
+    Retorna (ms acumulados del mejor run, {módulo importado: ms acumulados} de ese run).
+    """
+    best_ms, best_modules = None, None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        modules = {}
+        for line in result.stderr.splitlines():
+            # Formato: "import time: <self us> | <acumulado us> | <módulo indentado>"
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative) / 1000.0
+        total_ms = modules.get(module_name, 0.0)
+        if best_ms is None or total_ms < best_ms:
+            best_ms, best_modules = total_ms, modules
+    return best_ms, best_modules
+
+
+def check_startup(module_name='main', budget_ms=STARTUP_BUDGET_MS, deferred_modules=DEFERRED_MODULES, runs=STARTUP_RUNS):
+    """
+    Mide el arranque de module_name y retorna (total_ms, modules, problems), donde problems
+    es una lista de mensajes (vacía si se cumple el presupuesto).
+    """
+    total_ms, modules = measure_import(module_name, runs)
+    problems = []
+    if total_ms > budget_ms:
+        problems.append(f"import {module_name} took {total_ms:.1f} ms (budget {budget_ms} ms)")
+    for deferred in deferred_modules:
+        loaded = sorted(name for name in modules if name == deferred or name.startswith(deferred + '.'))
+        if loaded:
+            problems.append(f"{deferred} is imported at startup ({max(modules[name] for name in loaded):.1f} ms); it should be imported on first use")
+    return total_ms, modules, problems
+
+
+if __name__ == "__main__":
+    print(f"--- Startup Benchmark (import main, best of {STARTUP_RUNS}) ---")
+    total_ms, modules, problems = check_startup()
+    print(f"import main: {total_ms:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+    print("Slowest imports (cumulative):")
+    for name, cumulative_ms in sorted(modules.items(), key=lambda item: -item[1])[1:9]:
+        print(f"  {name:<40} {cumulative_ms:8.1f} ms")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems:
+        sys.exit(1)
+    print("Startup budget OK.")
@@ -1,31 +1,334 @@
 # visualizer.py
-import plotly.graph_objects as go
+import os
 import random
-import matplotlib
-matplotlib.use('Agg') # Use Agg backend for non-interactive environments if needed.
-import matplotlib.pyplot as plt
-import networkx as nx
+import numpy as np
+from graph_utils import undirected_csr, gather_neighbors, induced_subgraph, location_arrays, quotient_graph
+from layout_engine import graph_layout, forceatlas2_layout
+# plotly y matplotlib se importan dentro de las funciones que los usan (import diferido):
+# importar este módulo no debe pagar su coste de arranque si no se visualiza nada.
 
 # Umbral y tamaño de muestra para la visualización de Plotly en grafos grandes
 PLOTLY_VISUALIZATION_THRESHOLD = 2500
 PLOTLY_SAMPLE_SIZE_LARGE_GRAPH = 500
+PLOTLY_SAMPLING_MODES = ('auto', 'random', 'region', 'community', 'snowball')
+# Iteraciones de ForceAtlas2 para los layouts sin ubicaciones
+LAYOUT_ITERATIONS = 100
+# Modo WebGL (Scattergl): umbral, muestra y límite de aristas mucho mayores que en SVG
+PLOTLY_RENDER_MODES = ('auto', 'svg', 'webgl', 'overview')
+PLOTLY_WEBGL_VISUALIZATION_THRESHOLD = 50000
+PLOTLY_WEBGL_SAMPLE_SIZE = 20000
+PLOTLY_WEBGL_MAX_EDGES = 200000
+# Vista general (nivel de detalle): teselas de densidad / super-nodos de comunidad
+PLOTLY_OVERVIEW_TILE_COLUMNS = 256 # Teselas a lo largo del lado más largo (máximo PLOTLY_OVERVIEW_TILE_COLUMNS**2)
+PLOTLY_OVERVIEW_MAX_GROUPS = 2000
+PLOTLY_OVERVIEW_MAX_EDGES = 3000
+PLOTLY_OVERVIEW_EDGE_WIDTHS = (0.5, 1.0, 2.0, 4.0)
+COMMUNITY_COLOR_PALETTE = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+                           '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+def _snowball_sample(graph, seed_nodes, sample_size, allowed=None, rng=None):
+    """
+    Muestreo "bola de nieve": BFS por niveles (no dirigido, vectorizado) desde seed_nodes
+    hasta reunir sample_size nodos; del último nivel se toma un subconjunto aleatorio.
+    allowed (máscara booleana por user_id, opcional) restringe los nodos alcanzables.
+    Si la componente se agota, continúa desde otra semilla aleatoria.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    indptr, indices = undirected_csr(graph)
+    visited = np.zeros(len(indptr) - 1, dtype=bool)
+    visited[0] = True # IDs 1-indexados
+    if allowed is not None:
+        visited |= ~allowed[:len(visited)]
+    spare_seeds = rng.permutation(np.asarray(graph.get_nodes(), dtype=np.int64)) if allowed is None else rng.permutation(np.flatnonzero(~visited))
+    spare_position = 0
+    frontier = np.unique(np.asarray(seed_nodes, dtype=np.int64))
+    sampled, total = [], 0
+    while total < sample_size:
+        frontier = frontier[~visited[frontier]]
+        if len(frontier) == 0: # Componente agotada: nueva semilla
+            while spare_position < len(spare_seeds) and visited[spare_seeds[spare_position]]:
+                spare_position += 1
+            if spare_position == len(spare_seeds):
+                break
+            frontier = spare_seeds[spare_position:spare_position + 1]
+        if len(frontier) > sample_size - total:
+            frontier = rng.choice(frontier, sample_size - total, replace=False)
+        visited[frontier] = True
+        sampled.append(frontier)
+        total += len(frontier)
+        frontier = np.unique(gather_neighbors(indptr, indices, frontier)).astype(np.int64)
+    return np.concatenate(sampled) if sampled else np.zeros(0, dtype=np.int64)
+
+def _sample_nodes(graph, sampling, sample_size, communities=None, seed_nodes=None, use_locations=False):
+    """
+    Elige como mucho sample_size user_ids para visualizar:
+    'random' (uniforme), 'region' (los sample_size usuarios más cercanos a una semilla,
+    con el índice espacial), 'community' (bola de nieve dentro de la comunidad de la semilla
+    o, sin semilla, la más grande) o 'snowball' (BFS desde seed_nodes o un nodo aleatorio).
+    'auto' usa 'region' con layout por ubicaciones, 'community' si hay comunidades y
+    'snowball' en otro caso. Retorna (user_ids, modo usado).
+    """
+    if sampling not in PLOTLY_SAMPLING_MODES:
+        raise ValueError(f"sampling debe ser uno de {PLOTLY_SAMPLING_MODES}")
+    if sampling == 'auto':
+        sampling = 'region' if use_locations else 'community' if communities else 'snowball'
+    rng = np.random.default_rng()
+    all_graph_nodes = graph.get_nodes()
+
+    if sampling == 'region':
+        spatial_index = graph.get_spatial_index() if hasattr(graph, 'get_spatial_index') else None
+        if spatial_index is None or spatial_index.num_points == 0:
+            print("Warning: 'region' sampling needs node locations. Falling back to snowball sampling.")
+            sampling = 'snowball'
+        else:
+            located_seeds = [node_id for node_id in (seed_nodes or []) if node_id in graph.locations]
+            center = located_seeds[0] if located_seeds else int(spatial_index.user_ids[rng.integers(spatial_index.num_points)])
+            center_lat, center_lon = graph.locations[center]
+            region_nodes, region_km = spatial_index.query_knn(center_lat, center_lon, sample_size)
+            print(f"Sampling: {len(region_nodes)} nodes within {region_km[-1]:.1f} km of user {center}.")
+            return region_nodes, sampling
+
+    if sampling == 'community':
+        if not communities:
+            print("Warning: 'community' sampling needs communities. Falling back to snowball sampling.")
+            sampling = 'snowball'
+        else:
+            member_ids = np.fromiter(communities.keys(), dtype=np.int64, count=len(communities))
+            member_labels = np.fromiter(communities.values(), dtype=np.int64, count=len(communities))
+            seeds_in_graph = [node_id for node_id in (seed_nodes or []) if node_id in communities]
+            if seeds_in_graph:
+                chosen = communities[seeds_in_graph[0]]
+            else:
+                labels, sizes = np.unique(member_labels, return_counts=True)
+                chosen = labels[np.argmax(sizes)]
+            members = member_ids[member_labels == chosen]
+            allowed = np.zeros(max(int(member_ids.max()) + 1, graph.get_number_of_nodes() + 1), dtype=bool)
+            allowed[members] = True
+            seeds = seeds_in_graph or [int(members[rng.integers(len(members))])]
+            community_nodes = _snowball_sample(graph, seeds, sample_size, allowed=allowed, rng=rng)
+            print(f"Sampling: {len(community_nodes)} nodes of community {chosen} ({len(members)} members).")
+            return community_nodes, sampling
+
+    if sampling == 'snowball':
+        seeds = seed_nodes or [all_graph_nodes[rng.integers(len(all_graph_nodes))]]
+        snowball_nodes = _snowball_sample(graph, seeds, sample_size, rng=rng)
+        print(f"Sampling: {len(snowball_nodes)} nodes by BFS snowball from {list(seeds)[:5]}.")
+        return snowball_nodes, sampling
+
+    return random.sample(all_graph_nodes, sample_size), sampling
+
+def _discrete_colorscale(colors):
+    """Escala de colores por tramos: el valor i (de 0 a len(colors) - 1, con cmin=0 y cmax=len - 1) toma colors[i]."""
+    steps = np.linspace(0, 1, len(colors) + 1)
+    return [[float(position), color] for i, color in enumerate(colors) for position in (steps[i], steps[i + 1])]
+
+def _segment_coordinates(x_values, y_values, sources, targets):
+    """Coordenadas float32 de segmentos (origen, destino, NaN) para una traza de líneas."""
+    gaps = np.full(len(sources), np.nan)
+    edge_x = np.column_stack((x_values[sources], x_values[targets], gaps)).ravel().astype(np.float32)
+    edge_y = np.column_stack((y_values[sources], y_values[targets], gaps)).ravel().astype(np.float32)
+    return edge_x, edge_y
+
+def _weighted_edge_traces(x_values, y_values, sources, targets, weights):
+    """
+    Trazas Scattergl de aristas agregadas: las max PLOTLY_OVERVIEW_MAX_EDGES más pesadas,
+    repartidas en un trazo por cada ancho de PLOTLY_OVERVIEW_EDGE_WIDTHS (cuantiles de peso),
+    ya que el ancho de línea es fijo por traza.
+    """
+    import plotly.graph_objects as go
+    if len(weights) > PLOTLY_OVERVIEW_MAX_EDGES:
+        heaviest = np.argpartition(weights, len(weights) - PLOTLY_OVERVIEW_MAX_EDGES)[-PLOTLY_OVERVIEW_MAX_EDGES:]
+        sources, targets, weights = sources[heaviest], targets[heaviest], weights[heaviest]
+    if len(weights) == 0:
+        return []
+    log_weights = np.log1p(weights)
+    thresholds = np.quantile(log_weights, np.linspace(0, 1, len(PLOTLY_OVERVIEW_EDGE_WIDTHS) + 1)[1:-1])
+    buckets = np.searchsorted(thresholds, log_weights, side='right')
+    traces = []
+    for bucket, width in enumerate(PLOTLY_OVERVIEW_EDGE_WIDTHS):
+        in_bucket = buckets == bucket
+        if not in_bucket.any():
+            continue
+        edge_x, edge_y = _segment_coordinates(x_values, y_values, sources[in_bucket], targets[in_bucket])
+        traces.append(go.Scattergl(x=edge_x, y=edge_y, mode='lines', hoverinfo='none',
+                                   line=dict(width=width, color='rgba(120,120,120,0.5)')))
+    return traces
+
+def _community_labels(graph, communities):
+    """
+    Etiquetas 0..C-1 por user_id (-1 sin comunidad) a partir del dict {user_id: community_id},
+    ordenadas por tamaño (0 = la mayor), y los community_id originales de cada etiqueta.
+    """
+    member_ids = np.fromiter(communities.keys(), dtype=np.int64, count=len(communities))
+    member_communities = np.fromiter(communities.values(), dtype=np.int64, count=len(communities))
+    community_ids, local_labels, sizes = np.unique(member_communities, return_inverse=True, return_counts=True)
+    by_size = np.argsort(-sizes, kind='stable')
+    rank = np.empty(len(community_ids), dtype=np.int64)
+    rank[by_size] = np.arange(len(community_ids))
+    labels = np.full(max(int(member_ids.max()) + 1, graph.get_number_of_nodes() + 1), -1, dtype=np.int64)
+    labels[member_ids] = rank[local_labels]
+    return labels, community_ids[by_size]
+
+def _group_figure(group_x, group_y, group_sizes, hover_data, hover_template, marker,
+                  pair_sources, pair_targets, pair_counts, title, geographic):
+    """
+    Figura de un grafo agregado (teselas o comunidades): un marcador Scattergl por grupo con
+    tamaño proporcional a la raíz de su número de usuarios y las aristas entre grupos más
+    pesadas con ancho según su número de aristas (_weighted_edge_traces).
+    """
+    import plotly.graph_objects as go
+    marker['size'] = (4 + 26 * np.sqrt(group_sizes / max(group_sizes.max(), 1))).astype(np.float32)
+    marker['line'] = dict(width=0.5, color='black')
+    node_trace = go.Scattergl(x=np.asarray(group_x, dtype=np.float32), y=np.asarray(group_y, dtype=np.float32),
+                              mode='markers', customdata=hover_data.astype(np.int32),
+                              hovertemplate=hover_template + "<extra></extra>", marker=marker)
+    edge_traces = _weighted_edge_traces(np.asarray(group_x), np.asarray(group_y), pair_sources, pair_targets, pair_counts)
+    fig = go.Figure(data=edge_traces + [node_trace],
+                    layout=go.Layout(
+                        title=dict(text=title, font=dict(size=16)),
+                        showlegend=False,
+                        hovermode='closest',
+                        margin=dict(b=20, l=5, r=5, t=40),
+                        xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+                        yaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+                        plot_bgcolor='white'))
+    if geographic:
+        fig.update_layout(yaxis_scaleanchor="x", yaxis_scaleratio=1)
+    return fig
 
-def visualize_network_plotly(graph, communities=None, layout_type='random'):
+def visualize_community_graph(graph, communities, layout_type='locations', max_communities=PLOTLY_OVERVIEW_MAX_GROUPS):
+    """
+    Visualiza la estructura entre comunidades: el grafo se colapsa por comunidad
+    (louvain_optimized) en un meta-grafo ponderado, en una sola pasada vectorizada sobre las
+    aristas (graph_utils.quotient_graph). Cada comunidad es un nodo de tamaño proporcional a
+    su número de usuarios y cada par de comunidades conectadas una arista de ancho según su
+    número de aristas. Con layout_type='locations' (y ubicaciones disponibles) cada comunidad
+    se sitúa en el centroide de las ubicaciones de sus miembros; si no, se usa ForceAtlas2
+    sobre el meta-grafo. Solo se dibujan las max_communities comunidades más grandes.
+
+    Returns:
+        plotly.graph_objects.Figure: La figura de Plotly.
+    """
+    import plotly.graph_objects as go
+    if not communities:
+        print("No communities to visualize.")
+        return go.Figure()
+    num_nodes = graph.get_number_of_nodes()
+    labels, community_ids = _community_labels(graph, communities)
+    labels[labels >= max_communities] = -1 # Solo las comunidades más grandes
+    sizes, pair_sources, pair_targets, pair_counts, internal_edges = quotient_graph(graph, labels)
+    print(f"Community graph: {len(sizes)} of {len(community_ids)} communities, {len(pair_counts)} connected community pairs.")
+
+    geographic = layout_type == 'locations' and bool(graph.locations)
+    if geographic:
+        latitudes, longitudes = location_arrays(graph.locations, len(labels))
+        located = (labels[:len(latitudes)] >= 0) & ~np.isnan(latitudes[:len(labels)])
+        located_labels = labels[:len(latitudes)][located]
+        located_counts = np.bincount(located_labels, minlength=len(sizes))
+        geographic = bool(located_counts.any())
+    if geographic:
+        safe_counts = np.maximum(located_counts, 1)
+        group_x = np.bincount(located_labels, weights=longitudes[:len(labels)][located], minlength=len(sizes)) / safe_counts
+        group_y = np.bincount(located_labels, weights=latitudes[:len(labels)][located], minlength=len(sizes)) / safe_counts
+        has_centroid = located_counts > 0 # Comunidades sin ninguna ubicación: no se dibujan
+        keep = np.flatnonzero(has_centroid)
+        position_of = np.full(len(sizes), -1, dtype=np.int64)
+        position_of[keep] = np.arange(len(keep))
+        pair_keep = has_centroid[pair_sources] & has_centroid[pair_targets]
+        pair_sources, pair_targets, pair_counts = position_of[pair_sources[pair_keep]], position_of[pair_targets[pair_keep]], pair_counts[pair_keep]
+        group_x, group_y = group_x[keep], group_y[keep]
+        layout_description = "centroides geográficos"
+    else:
+        keep = np.arange(len(sizes))
+        print(f"Layout: ForceAtlas2 ({LAYOUT_ITERATIONS} iterations) for {len(sizes)} community nodes.")
+        positions = forceatlas2_layout(len(sizes), pair_sources, pair_targets, iterations=LAYOUT_ITERATIONS,
+                                       edge_weights=np.log1p(pair_counts), seed=0)
+        group_x, group_y = positions[:, 0], positions[:, 1]
+        layout_description = "ForceAtlas2"
+
+    hover_data = np.column_stack((community_ids[keep], sizes[keep], internal_edges[keep]))
+    hover_template = "Community: %{customdata[0]:d}<br>Users: %{customdata[1]:d}<br>Internal edges: %{customdata[2]:d}"
+    marker = dict(color=(keep % len(COMMUNITY_COLOR_PALETTE)).astype(np.int8),
+                  colorscale=_discrete_colorscale(COMMUNITY_COLOR_PALETTE), cmin=0, cmax=len(COMMUNITY_COLOR_PALETTE) - 1)
+    title = f"Grafo de Comunidades ({len(keep)} comunidades de {len(community_ids)}, {num_nodes} usuarios, layout por {layout_description})"
+    return _group_figure(group_x, group_y, sizes[keep], hover_data, hover_template, marker,
+                         pair_sources, pair_targets, pair_counts, title, geographic)
+
+def _plotly_overview(graph, communities, use_locations):
+    """
+    Vista general de nivel de detalle (LOD) del grafo completo, sin muestrear: con
+    ubicaciones, los usuarios se agregan en teselas de densidad de una rejilla lat/lon
+    (PLOTLY_OVERVIEW_TILE_COLUMNS teselas cuadradas en el lado más largo); sin ellas, en super-nodos de comunidad
+    (visualize_community_graph con ForceAtlas2). Las aristas entre grupos se agregan en una
+    pasada (graph_utils.quotient_graph) y se dibujan las más pesadas.
+    Todo se dibuja con Scattergl y arrays float32, por lo que el HTML no crece con el grafo.
+    """
+    if not use_locations:
+        return visualize_community_graph(graph, communities, layout_type='force')
+    num_nodes = graph.get_number_of_nodes()
+    latitudes, longitudes = location_arrays(graph.locations, num_nodes + 1)
+    located = ~np.isnan(latitudes)
+    min_lat, max_lat = np.nanmin(latitudes), np.nanmax(latitudes)
+    min_lon, max_lon = np.nanmin(longitudes), np.nanmax(longitudes)
+    # Teselas cuadradas según el lado más largo: rows * columns <= PLOTLY_OVERVIEW_TILE_COLUMNS**2
+    # aunque los usuarios estén en una franja estrecha (p. ej. una sola ciudad o un meridiano).
+    tile_size = max(max_lon - min_lon, max_lat - min_lat, 1e-9) / PLOTLY_OVERVIEW_TILE_COLUMNS
+    columns = int(np.clip(np.ceil((max_lon - min_lon) / tile_size), 1, PLOTLY_OVERVIEW_TILE_COLUMNS))
+    rows = int(np.clip(np.ceil((max_lat - min_lat) / tile_size), 1, PLOTLY_OVERVIEW_TILE_COLUMNS))
+    tile_columns = np.minimum(((np.where(located, longitudes, min_lon) - min_lon) / tile_size).astype(np.int64), columns - 1)
+    tile_rows = np.minimum(((np.where(located, latitudes, min_lat) - min_lat) / tile_size).astype(np.int64), rows - 1)
+    groups = np.where(located, tile_rows * columns + tile_columns, -1)
+    groups[0] = -1 # IDs 1-indexados
+    sizes, pair_sources, pair_targets, pair_counts, internal_edges = quotient_graph(graph, groups)
+    occupied = np.flatnonzero(sizes)
+    group_x = np.bincount(groups[located], weights=longitudes[located], minlength=len(sizes))[occupied] / sizes[occupied]
+    group_y = np.bincount(groups[located], weights=latitudes[located], minlength=len(sizes))[occupied] / sizes[occupied]
+    position_of = np.zeros(len(sizes), dtype=np.int64)
+    position_of[occupied] = np.arange(len(occupied))
+    group_sizes = sizes[occupied]
+    hover_data = np.column_stack((group_sizes, internal_edges[occupied]))
+    hover_template = "Tile (%{y:.2f}, %{x:.2f})<br>Users: %{customdata[0]:d}<br>Internal edges: %{customdata[1]:d}"
+    marker = dict(color=np.log10(group_sizes).astype(np.float32), colorscale='Viridis', showscale=True,
+                  colorbar=dict(title=dict(text='log10(usuarios)')))
+    title = f"Visualización de Red Social (Vista general: {len(occupied)} teselas de densidad, {num_nodes} usuarios)"
+    return _group_figure(group_x, group_y, group_sizes, hover_data, hover_template, marker,
+                         position_of[pair_sources], position_of[pair_targets], pair_counts, title, True)
+
+def visualize_network_plotly(graph, communities=None, layout_type='force', node_values=None, node_values_label='Clustering',
+                             sampling='auto', sample_size=None, seed_nodes=None, render='auto'):
     """
     Crea una visualización interactiva del grafo de red usando Plotly.
-    Para grafos grandes (más de PLOTLY_VISUALIZATION_THRESHOLD nodos), visualiza una muestra.
+    Para grafos grandes (más de PLOTLY_VISUALIZATION_THRESHOLD nodos), visualiza una muestra
+    de sample_size nodos elegida según sampling (ver _sample_nodes): por región geográfica,
+    por comunidad o por bola de nieve (BFS), para que la muestra conserve sus aristas.
     Los nodos se posicionan usando sus ubicaciones si están disponibles para la muestra,
-    o un layout aleatorio en caso contrario.
+    o un layout por fuerzas (ForceAtlas2, layout_engine.py) en caso contrario.
+    render elige cómo se dibuja: 'svg' (go.Scatter, umbrales PLOTLY_VISUALIZATION_THRESHOLD /
+    PLOTLY_SAMPLE_SIZE_LARGE_GRAPH), 'webgl' (go.Scattergl con arrays de NumPy y umbrales
+    PLOTLY_WEBGL_*) u 'overview' (vista general del grafo completo agregada en teselas de
+    densidad o super-nodos de comunidad, ver _plotly_overview). 'auto' usa 'overview' para
+    grafos de más de PLOTLY_WEBGL_VISUALIZATION_THRESHOLD nodos con ubicaciones o
+    comunidades (salvo que se pidan node_values) y 'webgl' en otro caso.
 
     Args:
         graph (SocialGraph): El objeto grafo.
         communities (dict, optional): Un diccionario {node_id: community_id} para colorear nodos.
-        layout_type (str): 'locations', 'random'.
-                           Si es 'locations' y no hay ubicaciones, recurre a 'random'.
+        layout_type (str): 'locations', 'force' o 'random'.
+                           Si es 'locations' y no hay ubicaciones, recurre a 'force'.
+                           'force' usa ForceAtlas2 con las comunidades (si se dan) como semilla.
+        node_values (array, optional): Valores por user_id (p. ej. clustering_coefficients(graph)['local'])
+                           para colorear los nodos con una escala continua (tiene prioridad sobre communities).
+        node_values_label (str): Nombre de node_values en la barra de color y el texto hover.
+        sampling (str): 'auto', 'random', 'region', 'community' o 'snowball'.
+        sample_size (int, optional): Nodos a visualizar cuando el grafo supera el umbral
+                           (por defecto, el tamaño de muestra del modo de render).
+        seed_nodes (list, optional): Usuarios semilla para los modos 'region', 'community' y 'snowball'.
+        render (str): 'auto', 'svg', 'webgl' u 'overview'.
 
     Returns:
         plotly.graph_objects.Figure: La figura de Plotly.
     """
+    import plotly.graph_objects as go
     original_node_count = graph.get_number_of_nodes()
     is_sampled_visualization = False
 
@@ -33,14 +336,26 @@ def visualize_network_plotly(graph, communities=None, layout_type='random'):
         print("No nodes to visualize.")
         return go.Figure()
 
-    if original_node_count > PLOTLY_VISUALIZATION_THRESHOLD:
+    if render not in PLOTLY_RENDER_MODES:
+        raise ValueError(f"render debe ser uno de {PLOTLY_RENDER_MODES}")
+    use_locations = layout_type == 'locations' and bool(graph.locations)
+    if render == 'auto':
+        can_aggregate = (use_locations or bool(communities)) and node_values is None
+        render = 'overview' if original_node_count > PLOTLY_WEBGL_VISUALIZATION_THRESHOLD and can_aggregate else 'webgl'
+    if render == 'overview':
+        if use_locations or communities:
+            return _plotly_overview(graph, communities, use_locations)
+        print("Warning: 'overview' rendering needs locations or communities. Falling back to WebGL sampling.")
+        render = 'webgl'
+    use_webgl = render == 'webgl'
+    threshold = PLOTLY_WEBGL_VISUALIZATION_THRESHOLD if use_webgl else PLOTLY_VISUALIZATION_THRESHOLD
+    if sample_size is None:
+        sample_size = PLOTLY_WEBGL_SAMPLE_SIZE if use_webgl else PLOTLY_SAMPLE_SIZE_LARGE_GRAPH
+    if original_node_count > threshold and sample_size < original_node_count:
         is_sampled_visualization = True
-        print(f"Graph with {original_node_count} nodes exceeds threshold ({PLOTLY_VISUALIZATION_THRESHOLD}). Visualizing a sample of {PLOTLY_SAMPLE_SIZE_LARGE_GRAPH} nodes.")
-        all_graph_nodes = graph.get_nodes()
-        if PLOTLY_SAMPLE_SIZE_LARGE_GRAPH >= original_node_count:
-            nodes_to_process = all_graph_nodes # Muestra es mayor o igual que el grafo
-        else:
-            nodes_to_process = random.sample(all_graph_nodes, PLOTLY_SAMPLE_SIZE_LARGE_GRAPH)
+        print(f"Graph with {original_node_count} nodes exceeds threshold ({threshold}). Visualizing a sample of {sample_size} nodes.")
+        sampled_nodes, sampling = _sample_nodes(graph, sampling, sample_size, communities, seed_nodes, use_locations)
+        nodes_to_process = [int(node_id) for node_id in sampled_nodes]
     else:
         nodes_to_process = graph.get_nodes()
 
@@ -52,85 +367,100 @@ def visualize_network_plotly(graph, communities=None, layout_type='random'):
     node_x = []
     node_y = []
     node_ids_to_draw = []
-    node_colors_values = []
-    node_hover_texts = []
 
     # Determinar si usar ubicaciones reales o generar aleatorias
     can_use_locations = layout_type == 'locations' and graph.locations and len(graph.locations) > 0
 
     if can_use_locations:
         print("Layout: Using provided node locations for (sampled) nodes.")
-        # Iterar sobre los nodos seleccionados para el proceso (pueden ser una muestra)
-        for node_id in nodes_to_process:
-            if node_id in graph.locations:
-                lat, lon = graph.locations[node_id]
-                node_x.append(lon) # Longitud para X
-                node_y.append(lat) # Latitud para Y
-                node_ids_to_draw.append(node_id)
+        # Coordenadas de los nodos seleccionados (pueden ser una muestra) con indexado vectorizado
+        latitudes, longitudes = location_arrays(graph.locations)
+        candidate_ids = np.asarray(nodes_to_process, dtype=np.int64)
+        candidate_ids = candidate_ids[candidate_ids < len(latitudes)]
+        candidate_ids = candidate_ids[~np.isnan(latitudes[candidate_ids])]
+        node_ids_to_draw = candidate_ids.tolist()
+        node_x = longitudes[candidate_ids] # Longitud para X
+        node_y = latitudes[candidate_ids] # Latitud para Y
 
         if not node_ids_to_draw: # Si 'locations' fue elegido pero ningún nodo (de la muestra) tenía ubicación
-            print("Warning: 'locations' layout chosen, but no (sampled) nodes had location data. Falling back to random.")
+            print("Warning: 'locations' layout chosen, but no (sampled) nodes had location data. Falling back to force layout.")
             can_use_locations = False
 
-    if not can_use_locations: # Random layout for (sampled) nodes
-        print("Layout: Using random positions for (sampled) nodes.")
+    if not can_use_locations:
         node_ids_to_draw = list(nodes_to_process) # Usar los nodos seleccionados (muestra o todos)
-        node_x = [random.uniform(0, 100) for _ in range(len(node_ids_to_draw))]
-        node_y = [random.uniform(0, 100) for _ in range(len(node_ids_to_draw))]
+        if layout_type == 'random':
+            print("Layout: Using random positions for (sampled) nodes.")
+            node_x = np.random.uniform(0, 100, len(node_ids_to_draw))
+            node_y = np.random.uniform(0, 100, len(node_ids_to_draw))
+        else:
+            print(f"Layout: ForceAtlas2 ({LAYOUT_ITERATIONS} iterations) for (sampled) nodes.")
+            node_x, node_y = graph_layout(graph, node_ids_to_draw, communities=communities, iterations=LAYOUT_ITERATIONS)
 
     if not node_ids_to_draw: # Si después de todo, no hay nodos para dibujar
         print("No nodes have coordinates for visualization (after sampling and layout attempt).")
         return go.Figure()
 
-    # Mapear node_ids (los que se van a dibujar, que son de la muestra si aplica) a sus índices
-    node_map_idx = {node_id: i for i, node_id in enumerate(node_ids_to_draw)}
-
-    # Colores de comunidad y textos hover (para los nodos que se van a dibujar)
+    # Colores de comunidad y datos hover (para los nodos que se van a dibujar), como arrays
+    # numéricos: Plotly los guarda en binario en el HTML en lugar de una cadena por nodo.
+    draw_ids = np.asarray(node_ids_to_draw, dtype=np.int64)
+    hover_columns = [draw_ids]
+    hover_template = "User: %{customdata[0]:d}"
+    color_scale = None
     if communities:
-        unique_comm_ids = sorted(list(set(c_id for c_id in communities.values() if c_id is not None)))
-        num_unique_communities = len(unique_comm_ids)
-
-        # Paleta de colores simple (Plotly ciclará si hay más comunidades que colores)
-        color_palette = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
-                         '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
-
-        # Mapeo estable de ID de comunidad a un color de la paleta
-        comm_id_to_color = {comm_id: color_palette[i % len(color_palette)] for i, comm_id in enumerate(unique_comm_ids)}
-
-        for node_id in node_ids_to_draw:
-            comm_id = communities.get(node_id)
-            node_colors_values.append(comm_id_to_color.get(comm_id, 'black')) # Negro para nodos sin comunidad asignada
-            node_hover_texts.append(f"User: {node_id}<br>Community: {comm_id if comm_id is not None else 'N/A'}")
+        # Etiquetas por tamaño (vectorizado); la paleta se repite si hay más comunidades que colores
+        labels, community_ids = _community_labels(graph, communities)
+        node_labels = labels[draw_ids]
+        node_communities = np.where(node_labels >= 0, community_ids[np.maximum(node_labels, 0)], -1)
+        # Índice de color por nodo; el último color (negro) es para nodos sin comunidad asignada
+        node_colors_values = np.where(node_labels >= 0, node_labels % len(COMMUNITY_COLOR_PALETTE),
+                                      len(COMMUNITY_COLOR_PALETTE)).astype(np.int8)
+        color_scale = _discrete_colorscale(COMMUNITY_COLOR_PALETTE + ['black'])
+        hover_columns.append(node_communities)
+        hover_template += "<br>Community: %{customdata[1]:d}"
     else:
         node_colors_values = 'blue' # Color único si no hay comunidades
-        for node_id in node_ids_to_draw:
-            node_hover_texts.append(f"User: {node_id}")
 
-    node_trace = go.Scatter(
-        x=node_x, y=node_y,
+    # Escala continua por valor de nodo (p. ej. clustering local)
+    color_by_values = node_values is not None
+    if color_by_values:
+        node_values = np.asarray(node_values)
+        node_colors_values = np.where(draw_ids < len(node_values), node_values[np.minimum(draw_ids, len(node_values) - 1)], 0.0)
+        color_scale = 'Viridis'
+        hover_template += f"<br>{node_values_label}: %{{customdata[{len(hover_columns)}]:.3f}}"
+        hover_columns.append(node_colors_values)
+
+    scatter_class = go.Scattergl if use_webgl else go.Scatter
+    coordinate_type = np.float32 if use_webgl else np.float64
+    node_trace = scatter_class(
+        x=np.asarray(node_x, dtype=coordinate_type), y=np.asarray(node_y, dtype=coordinate_type),
         mode='markers',
-        hoverinfo='text',
-        text=node_hover_texts,
+        customdata=np.column_stack(hover_columns).astype(np.float64 if color_by_values else np.int32),
+        hovertemplate=hover_template + "<extra></extra>",
         marker=dict(
-            showscale=False,
+            showscale=color_by_values,
+            colorscale=color_scale,
+            cmin=None if color_by_values or not communities else 0,
+            cmax=None if color_by_values or not communities else len(COMMUNITY_COLOR_PALETTE),
+            colorbar=dict(title=dict(text=node_values_label)) if color_by_values else None,
             color=node_colors_values,
-            size=10,
-            line_width=1,
+            size=6 if use_webgl else 10,
+            line_width=0.5 if use_webgl else 1,
             line_color='black'
         )
     )
 
     # --- Preparar datos de Aristas (solo entre nodos en node_ids_to_draw) ---
-    edge_x = []
-    edge_y = []
-    num_edges_visualized = 0
+    edge_x = np.zeros(0, dtype=coordinate_type)
+    edge_y = np.zeros(0, dtype=coordinate_type)
 
     # Ajustar max_edges_to_draw si es una muestra.
     # Para una muestra de N nodos, un límite razonable podría ser N*k (e.g., N*5 o N*logN)
     # O simplemente un máximo absoluto más pequeño que para el grafo completo.
-    if is_sampled_visualization:
-        # Para una muestra de PLOTLY_SAMPLE_SIZE_LARGE_GRAPH nodos, un límite como N*5 o N*10
-        max_edges_to_draw = PLOTLY_SAMPLE_SIZE_LARGE_GRAPH * 10
+    if use_webgl:
+        max_edges_to_draw = PLOTLY_WEBGL_MAX_EDGES # WebGL dibuja cientos de miles de segmentos
+    elif is_sampled_visualization:
+        # Para una muestra de sample_size nodos, un límite como N*5 o N*10
+        max_edges_to_draw = sample_size * 10
     else:
         # Para grafos pequeños, podemos permitir más aristas relativas al tamaño total,
         # pero aún así es bueno tener un cap.
@@ -138,25 +468,22 @@ def visualize_network_plotly(graph, communities=None, layout_type='random'):
         # Plotly dibuja una línea por arista.
         max_edges_to_draw = min(graph.get_number_of_edges(), 10000) # Cap a 10k aristas para Plotly
 
-    # Iterar sobre los nodos que se van a dibujar (node_ids_to_draw)
-    for u_id in node_ids_to_draw: # Estos son los nodos de la muestra (si aplica)
-        u_idx = node_map_idx[u_id]
-
-        for v_id in graph.adj.get(u_id, []):
-            # Solo dibujar arista si el nodo destino (v_id) también está en la muestra (node_ids_to_draw)
-            if v_id in node_map_idx:
-                v_idx = node_map_idx[v_id]
-                if num_edges_visualized < max_edges_to_draw:
-                    edge_x.extend([node_x[u_idx], node_x[v_idx], None]) # None para romper la línea
-                    edge_y.extend([node_y[u_idx], node_y[v_idx], None])
-                    num_edges_visualized += 1
-                else:
-                    break
-        if num_edges_visualized >= max_edges_to_draw:
-            print(f"Warning: Reached maximum number of edges to draw for Plotly ({max_edges_to_draw}). Not all edges in the (sample) graph might be shown.")
-            break
-
-    edge_trace = go.Scatter(
+    # Aristas del subgrafo inducido por los nodos a dibujar (pertenencia vectorizada)
+    edge_sources, edge_targets = induced_subgraph(graph, node_ids_to_draw)
+    if len(edge_sources) > max_edges_to_draw:
+        print(f"Warning: Reached maximum number of edges to draw for Plotly ({max_edges_to_draw}). Not all edges in the (sample) graph might be shown.")
+        edge_sources, edge_targets = edge_sources[:max_edges_to_draw], edge_targets[:max_edges_to_draw]
+    num_edges_visualized = len(edge_sources)
+    if num_edges_visualized:
+        draw_ids = np.asarray(node_ids_to_draw, dtype=np.int64)
+        position_of = np.zeros(int(draw_ids.max()) + 1, dtype=np.int64)
+        position_of[draw_ids] = np.arange(len(draw_ids))
+        # NaN rompe la línea entre aristas
+        edge_x, edge_y = _segment_coordinates(np.asarray(node_x, dtype=float), np.asarray(node_y, dtype=float),
+                                              position_of[edge_sources], position_of[edge_targets])
+        edge_x, edge_y = edge_x.astype(coordinate_type), edge_y.astype(coordinate_type)
+
+    edge_trace = scatter_class(
         x=edge_x, y=edge_y,
         line=dict(width=0.7, color='#888'),
         hoverinfo='none',
@@ -166,15 +493,19 @@ def visualize_network_plotly(graph, communities=None, layout_type='random'):
     # --- Crear Figura ---
     base_fig_title = "Visualización de Red Social"
     if is_sampled_visualization:
-        base_fig_title += f" (Muestra de ~{len(node_ids_to_draw)} nodos de {original_node_count} totales)"
+        base_fig_title += f" (Muestra '{sampling}' de ~{len(node_ids_to_draw)} nodos de {original_node_count} totales, {num_edges_visualized} aristas)"
 
     fig_title = base_fig_title
-    if communities:
+    if color_by_values:
+        fig_title += f" coloreada por {node_values_label}"
+    elif communities:
         fig_title += " con Comunidades"
     if can_use_locations: # Este flag ahora indica si se usaron ubicaciones para los nodos (de la muestra)
         fig_title += " (Layout por Ubicaciones)"
-    else:
+    elif layout_type == 'random':
         fig_title += " (Layout Aleatorio)"
+    else:
+        fig_title += " (Layout ForceAtlas2)"
 
 
     fig = go.Figure(data=[edge_trace, node_trace],
@@ -211,7 +542,10 @@ if __name__ == '__main__':
 
 def visualize_sample_graph_mpl(graph, sample_size=50):
     """
-    Visualiza una muestra del grafo usando Matplotlib y NetworkX.
+    Visualiza una muestra del grafo usando Matplotlib, sin convertirla a NetworkX: el
+    subgrafo inducido se extrae en arrays de NumPy, el layout es ForceAtlas2
+    (layout_engine.py) y las aristas se dibujan con una LineCollection. networkx solo se
+    importa (de forma diferida) como alternativa si el layout nativo falla.
     Muestra una imagen estática.
     """
     if not graph or graph.get_number_of_nodes(force_recount=False) == 0:
@@ -228,58 +562,48 @@ def visualize_sample_graph_mpl(graph, sample_size=50):
         print("Tamaño de muestra es 0. No se visualiza nada.")
         return
 
-    print(f"\nGenerando visualización de muestra con Matplotlib/NetworkX para {actual_sample_size} nodos...")
+    print(f"\nGenerando visualización de muestra con Matplotlib para {actual_sample_size} nodos...")
 
     # Tomar una muestra de nodos
-    sampled_nodes = random.sample(all_nodes, actual_sample_size)
-
-    # Crear un subgrafo en NetworkX
-    nx_graph = nx.Graph() # Usar grafo no dirigido para visualización simple
-
-    # Añadir nodos muestreados
-    for node_id in sampled_nodes:
-        nx_graph.add_node(node_id)
-
-    # Añadir aristas entre nodos muestreados
-    # Esto puede ser lento si el grafo original es muy grande y self.adj es grande
-    # Optimizacion: iterar solo sobre sampled_nodes en el bucle exterior
-    edges_added_count = 0
+    sampled_nodes = np.array(random.sample(all_nodes, actual_sample_size), dtype=np.int64)
+
+    # Aristas entre nodos muestreados, sin dirección ni duplicados (como un grafo no dirigido)
+    edge_sources, edge_targets = induced_subgraph(graph, sampled_nodes)
+    position_of = np.zeros(int(sampled_nodes.max()) + 1, dtype=np.int64)
+    position_of[sampled_nodes] = np.arange(actual_sample_size)
+    low = np.minimum(position_of[edge_sources], position_of[edge_targets])
+    high = np.maximum(position_of[edge_sources], position_of[edge_targets])
+    edge_keys = np.unique((low * actual_sample_size + high)[low != high])
     max_edges_to_draw_sample = actual_sample_size * 5 # Limitar aristas para claridad
+    if len(edge_keys) > max_edges_to_draw_sample:
+        print(f"Límite de {max_edges_to_draw_sample} aristas para la muestra alcanzado.")
+        edge_keys = edge_keys[:max_edges_to_draw_sample]
+    edge_low, edge_high = edge_keys // actual_sample_size, edge_keys % actual_sample_size
 
-    for u_id in sampled_nodes:
-        if u_id in graph.adj: # Si el nodo u_id tiene conexiones salientes
-            for v_id in graph.adj[u_id]:
-                if v_id in nx_graph: # Si v_id también está en la muestra
-                    if not nx_graph.has_edge(u_id, v_id): # Evitar duplicados para nx.Graph
-                        nx_graph.add_edge(u_id, v_id)
-                        edges_added_count +=1
-                        if edges_added_count >= max_edges_to_draw_sample:
-                            break
-            if edges_added_count >= max_edges_to_draw_sample:
-                print(f"Límite de {max_edges_to_draw_sample} aristas para la muestra alcanzado.")
-                break
-
-    if nx_graph.number_of_nodes() == 0:
-        print("La muestra del grafo no contiene nodos después del procesamiento. No se puede visualizar.")
-        return
-
-    plt.figure(figsize=(10, 8))
     try:
-        # Intentar un layout que tienda a separar componentes si el grafo es desconectado
-        if nx.is_connected(nx_graph):
-            pos = nx.spring_layout(nx_graph, k=0.15, iterations=20)
-        else:
-            # kamada_kawai puede ser lento para grafos grandes o desconectados.
-            # spring_layout es un buen fallback.
-            print("La muestra del grafo no es conexa, usando spring_layout.")
-            pos = nx.spring_layout(nx_graph, k=0.15, iterations=20)
-
+        positions = forceatlas2_layout(actual_sample_size, edge_low, edge_high, iterations=LAYOUT_ITERATIONS)
     except Exception as e_layout:
-        print(f"Error durante el cálculo del layout ({e_layout}), usando random_layout como fallback.")
-        pos = nx.random_layout(nx_graph)
-
-    nx.draw(nx_graph, pos, with_labels=True, node_size=50, font_size=8, node_color='lightblue', edge_color='gray', width=0.5)
-    plt.title(f"Muestra del Grafo de Red ({actual_sample_size} nodos, {nx_graph.number_of_edges()} aristas)")
+        print(f"Error durante el cálculo del layout ({e_layout}), usando networkx.spring_layout como fallback.")
+        import networkx as nx # Import diferido: solo para este caso
+        nx_graph = nx.Graph()
+        nx_graph.add_nodes_from(range(actual_sample_size))
+        nx_graph.add_edges_from(zip(edge_low.tolist(), edge_high.tolist()))
+        spring_positions = nx.spring_layout(nx_graph, k=0.15, iterations=20)
+        positions = np.array([spring_positions[i] for i in range(actual_sample_size)])
+
+    import matplotlib
+    matplotlib.use('Agg') # Use Agg backend for non-interactive environments if needed.
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    fig, ax = plt.subplots(figsize=(10, 8))
+    ax.add_collection(LineCollection(np.stack((positions[edge_low], positions[edge_high]), axis=1),
+                                     colors='gray', linewidths=0.5, zorder=1))
+    ax.scatter(positions[:, 0], positions[:, 1], s=50, c='lightblue', edgecolors='none', zorder=2)
+    for node_id, (x, y) in zip(sampled_nodes.tolist(), positions.tolist()):
+        ax.annotate(str(node_id), (x, y), fontsize=8, ha='center', va='center', zorder=3)
+    ax.autoscale_view()
+    ax.set_axis_off()
+    ax.set_title(f"Muestra del Grafo de Red ({actual_sample_size} nodos, {len(edge_keys)} aristas)")
 
     # Guardar en un archivo temporal y mostrar
     temp_image_file = "temp_graph_sample.png"